@@ -18,12 +18,21 @@
 
 """Usage:
   brix [options] validate [--full]
-  brix [options] show <name>
+  brix [options] show [--resource=NAME... --path=PATH] <name>
   brix [options] sync
   brix [options] update [--no-sync --param=KEY:VALUE...] <stack> [<template>]
   brix [options] diff <stack> [<template>]
   brix [options] stacks
   brix [options] events [--no-recurse] <stack>
+  brix [options] timings [--json | --gantt] <stack>
+  brix [options] apply [--no-sync --concurrency=N] <manifest>
+  brix [options] gc [--dry-run --grace=DAYS]
+  brix [options] graph [--dot] <name>
+  brix [options] size [<name>]
+  brix [options] find [--refresh] <physical-id>
+  brix [options] bake [--role=NAME... --source-ami=AMI]
+  brix [options] boot-report [--json] <stack>
+  brix [options] serve
 
 -h --help                    show this help message and exit
 --version                    show program's version number and exit
@@ -33,6 +42,23 @@
 --no-sync                    do not auto-sync before update
 --param=KEY:VALUE            parameters to pass to the stack
 --no-recurse                 do not process sub-stacks
+--concurrency=N              number of stacks to deploy at once [default: 4]
+--socket=PATH                socket for brix serve [default: ~/.brix.sock]
+--no-daemon                  do not forward requests to brix serve
+--stats                      show AWS call statistics when done
+--cache-ttl=SECONDS          keep AWS read results on disk this long [default: 0]
+--backend=BACKEND            AWS backend, boto or memory[:OPTIONS] [default: boto]
+--dry-run                    only show what would be done
+--grace=DAYS                 keep unreferenced templates newer than this [default: 7]
+--json                       output JSON
+--gantt                      output a chart of the last deploy
+--dot                        output a Graphviz graph
+--per-region                 render a specialized template for each region
+--resource=NAME              only show this resource and what it needs
+--path=PATH                  only show the value at a dotted path
+--refresh                    refresh the resource index first
+--role=NAME                  Chef role to build an image for, default all
+--source-ami=AMI             base image to build on, default the current one
 
 Example:
 brix sync
@@ -42,20 +68,35 @@ brix sync
 from __future__ import print_function
 
 import collections
+import copy
+import datetime
 import difflib
-import hashlib
 import importlib
+import glob
 import json
 import os
+import re
 import sys
+import threading
 import traceback
 
-import boto
-import boto.cloudformation
 import boto.exception
 import docopt
 import troposphere
 
+from . import aws, backend, bake, bootreport, cache, canonical, graph, index, manifest, outputs, regional, server, split, subset, timings
+
+
+# Results returned by Brix methods. The CLI only formats these, so they are
+# also what library users get.
+Validation = collections.namedtuple('Validation', ['name', 'error', 'warnings'])
+Upload = collections.namedtuple('Upload', ['name', 'region', 'key'])
+StackChange = collections.namedtuple('StackChange', ['stack_name', 'region', 'operation', 'template', 'parameters'])
+StackInfo = collections.namedtuple('StackInfo', ['name', 'status', 'description'])
+Event = collections.namedtuple('Event', ['timestamp', 'stack_name', 'logical_id', 'physical_id', 'resource_type', 'status', 'reason'])
+Timings = collections.namedtuple('Timings', ['deploy', 'resources', 'critical_path', 'by_type', 'deploys'])
+GcResult = collections.namedtuple('GcResult', ['referenced', 'garbage'])
+
 
 class Brix(object):
     TEMPLATES = [
@@ -73,72 +114,84 @@ class Brix(object):
         'us-west-2',
     ]
 
-    def __init__(self, region):
+    # Backend methods whose results are cached for the life of a command, and
+    # the methods that invalidate them.
+    CACHED_READS = ['describe_stacks', 'describe_stack_resources', 'get_template', 'get_object', 'list_objects']
+    CACHE_WRITES = ['create_stack', 'update_stack', 'put_object', 'delete_objects']
+
+    # Matches template keys in S3 and in TemplateURLs of nested stacks.
+    TEMPLATE_KEY_RE = re.compile(r'templates/[\w.-]+?-[0-9a-f]{40}\.json')
+
+    def __init__(self, region, cache_ttl=0, backend='boto', per_region=False):
         self.region = region
+        self.backend_spec = backend
+        self.per_region = per_region
+        self.cache = cache.ResponseCache(cache_ttl)
         # TODO: Allow configuring these on the command line
         self.access_key_id = os.environ.get('BALANCED_AWS_ACCESS_KEY_ID', os.environ.get('AWS_ACCESS_KEY_ID'))
         self.secret_access_key = os.environ.get('BALANCED_AWS_SECRET_ACCESS_KEY', os.environ.get('AWS_SECRET_ACCESS_KEY'))
-        # Connect to the right CloudFormation region
-        for r in boto.cloudformation.regions():
-            if r.name == self.region:
-                break
-        else:
-            raise ValueError('Unknown region {0}'.format(region))
-        self.cfn = boto.connect_cloudformation(self.access_key_id, self.secret_access_key, region=r)
-        self.s3 = boto.connect_s3(self.access_key_id, self.secret_access_key)
+        self.backend = self._connect(region)
+        # Resolver of the last render, to tell when its outputs went stale.
+        self._outputs = None
         # Load and render all templates
         self.templates = self._load_templates()
+        self._mtimes = self._template_mtimes()
 
-    def validate(self, quiet=False, full=False):
-        error = False
+    def validate(self, full=False):
+        """Check all templates, returns a list of Validations."""
+        results = []
         for name, data in self.templates.iteritems():
             if 'error' in data:
-                error = True
-                print("{} error: {}".format(name, data['error'][1]))
+                results.append(Validation(name, str(data['error'][1]), []))
                 continue
             if full:
                 # Run server-based validation
                 # Trying to use template_body fails randomly, probably due to
                 # length limits.
-                bucket = self.s3.get_bucket('balanced-cfn-us-east-1')
-                key = bucket.get_key('validation_tmp', validate=False)
-                key.set_contents_from_string(data['json'])
+                self.backend.put_object('balanced-cfn-us-east-1', 'validation_tmp', data['json'])
                 try:
-                    self.cfn.validate_template(template_url='https://balanced-cfn-us-east-1.s3.amazonaws.com/validation_tmp')
+                    self.backend.validate_template('https://balanced-cfn-us-east-1.s3.amazonaws.com/validation_tmp')
                 except boto.exception.BotoServerError, e:
                     if e.status != 400:
                         raise
-                    error = True
-                    print("{} error: {}".format(name, e.message))
+                    results.append(Validation(name, e.message, data['warnings']))
                     continue
                 finally:
-                    key.delete()
-            if not quiet:
-                print("{0} ok".format(name))
-        if error:
-            raise ValueError('Errors detected')
+                    self.backend.delete_objects('balanced-cfn-us-east-1', ['validation_tmp'])
+            results.append(Validation(name, None, data['warnings']))
+        return results
 
-    def show(self, name):
+    def show(self, name, resources=[], path=None):
+        """Return the rendered JSON for a template, or part of it."""
         data = self._get_template(name)
-        if'error' in data:
-            print(''.join(traceback.format_exception(*data['error'])), file=sys.stderr)
-        else:
-            print(data['json'])
+        if 'error' in data:
+            raise ValueError(''.join(traceback.format_exception(*data['error'])).rstrip())
+        if not (resources or path):
+            return self._regional(data)['json']
+        body = json.loads(self._regional(data)['json'], object_pairs_hook=collections.OrderedDict)
+        if resources:
+            body = subset.subset(body, resources)
+        return json.dumps(subset.select(body, path), indent=4)
 
     def sync(self):
-        self.validate(quiet=True) # Make sure all templates are good
+        """Upload all templates to every region, returns a list of Uploads."""
+        # Make sure all templates are good
+        errors = [v for v in self.validate() if v.error]
+        if errors:
+            raise ValueError('Errors detected in {}'.format(', '.join(v.name for v in errors)))
+        uploads = []
         for name in self.templates:
-            print('Uploading {}'.format(name), end='')
             for region in self.REGIONS:
-                print(' {}'.format(region), end='')
-                bucket = self.s3.get_bucket('balanced-cfn-{0}'.format(region))
-                key = bucket.get_key(self.templates[name]['s3_key'], validate=False)
-                key.set_contents_from_string(self.templates[name]['json'])
-            print()
+                # Regional versions only go to their own region.
+                data = self._regional(self.templates[name], region)
+                self.backend.put_object('balanced-cfn-{0}'.format(region), data['s3_key'], data['json'])
+                uploads.append(Upload(name, region, data['s3_key']))
+        return uploads
 
     def update(self, stack_name, template_name=None, params={}):
-        try:
-            stack = self.cfn.describe_stacks(stack_name)[0]
+        """Create or update a stack, returns a StackChange."""
+        stack = self._describe_stack(stack_name)
+        if stack:
             operation = 'update_stack'
             kwargs = {}
             if stack.parameters:
@@ -147,85 +200,437 @@ class Brix(object):
                 params = existing_params
             # if not template_name:
             #     template_name = stack.tags.get('TemplateName')
-            print('Updating stack {} in {}'.format(stack_name, self.region))
-        except boto.exception.BotoServerError:
+        else:
             operation = 'create_stack'
             kwargs = {'disable_rollback': True}#, 'tags': {'TemplateName': template_name}}
-            print('Creating stack {} in {}'.format(stack_name, self.region))
         if not template_name:
             raise ValueError('Template name for stack {} is required'.format(stack_name))
-        print()
-        data = self._get_template(template_name)
-        getattr(self.cfn, operation)(
+        template = self._get_template(template_name)
+        data = self._regional(template)
+        getattr(self.backend, operation)(
             stack_name=stack_name,
             template_url='https://balanced-cfn-{}.s3.amazonaws.com/{}'.format(self.region, data['s3_key']),
             capabilities=['CAPABILITY_IAM'],
             parameters=params.items(),
             **kwargs)
+        return StackChange(stack_name, self.region, operation.split('_')[0], template['name'], params)
+
+    def apply(self, manifest_path, concurrency=4, sync=True, progress=None):
+        """Deploy all stacks in a manifest file.
+
+        Returns a dict of stack id to manifest.Deploy. progress is called with
+        each Deploy as it finishes.
+        """
+        stacks = manifest.Manifest.load(manifest_path)
+        if sync:
+            self.sync()
+        return manifest.Deployer(self, stacks, concurrency=concurrency, progress=progress).run()
+
+    def for_region(self, region):
+        """Return a copy of this object connected to another region.
+
+        Templates are shared with the original, connections are not.
+        """
+        app = copy.copy(self)
+        app.region = region
+        app.backend = self._connect(region)
+        return app
 
     def stacks(self):
-        """List all stacks in the region."""
-        for stack in self._cfn_iterate(lambda t: self.cfn.list_stacks(next_token=t)):
-            if stack.stack_status == 'DELETE_COMPLETE':
-                continue
-            print('{0.stack_name}: {0.template_description}'.format(stack))
+        """List all stacks in the region, returns a list of StackInfos."""
+        return [
+            StackInfo(stack.stack_name, stack.stack_status, stack.template_description)
+            for stack in self._cfn_iterate(lambda t: self.backend.list_stacks(next_token=t))
+            if stack.stack_status != 'DELETE_COMPLETE'
+        ]
 
     def events(self, stack, recurse=True):
-        stacks = []
-        if recurse:
-            # Find all sub-stacks
-            pending = [stack]
-            while pending:
-                s = pending.pop()
-                stacks.append(s)
-                for res in self.cfn.describe_stack_resources(s):
-                    if res.resource_type == 'AWS::CloudFormation::Stack':
-                        pending.append(res.stack_name)
+        """Return Events for a stack and its nested stacks, oldest first."""
+        stacks = self._stack_tree(stack) if recurse else [stack]
+        return [
+            Event(e.timestamp, e.stack_name, e.logical_resource_id, e.physical_resource_id, e.resource_type, e.resource_status, e.resource_status_reason)
+            for e in sorted(self._stack_events(stacks), key=lambda event: event.timestamp)
+        ]
 
-        else:
-            stacks.append(stack)
-        events = []
-        for stack in stacks:
-            for event in self._cfn_iterate(lambda t: self.cfn.describe_stack_events(stack, next_token=t)):
-                events.append(event)
-        for event in sorted(events, key=lambda event: event.timestamp):
-            fmt = '{2} '
-            if len(stacks) > 1:
-                fmt += '[{0.stack_name}]\t'
-            fmt += '{0.logical_resource_id}: {0.resource_status} {1}'
-            print(fmt.format(event, event.resource_status_reason or '', event.timestamp.replace(microsecond=0)))
+    def timings(self, stack_name):
+        """Return Timings for the last deploy of a stack."""
+        intervals = timings.intervals(self._stack_events(self._stack_tree(stack_name)))
+        deploys = timings.deploys(intervals, stack_name)
+        if not deploys:
+            raise ValueError('No completed deploys found for stack {}'.format(stack_name))
+        deploy = deploys[-1]
+        resources = sorted(timings.within(intervals, deploy), key=timings.duration, reverse=True)
+        return Timings(
+            deploy=deploy,
+            resources=resources,
+            critical_path=timings.critical_path(resources),
+            by_type=timings.by_type(i for d in deploys for i in timings.within(intervals, d)),
+            deploys=deploys,
+        )
 
     def diff(self, stack_name, template_name):
+        """Return unified diff lines from a stack's template to the local one."""
         if not template_name:
-            stack = self.cfn.describe_stacks(stack_name)[0]
+            stack = self.backend.describe_stacks(stack_name)[0]
             template_name = stack.tags.get('TemplateName')
         if not template_name:
             raise ValueError('Template name for stack {} is required'.format(stack_name))
-        # Who wants to bet this long string of __getitem__'s will break eventually?
-        stack_template = self.cfn.get_template(stack_name)['GetTemplateResponse']['GetTemplateResult']['TemplateBody']
+        stack_template = self.backend.get_template(stack_name)
         # Reparse to normalize spacing
         stack_template = json.dumps(json.loads(stack_template, object_pairs_hook=collections.OrderedDict), indent=4)
-        template = self._get_template(template_name)['json']
-        for line in difflib.unified_diff(stack_template.splitlines(), template.splitlines(), fromfile=stack_name, tofile=template_name, lineterm=''):
-            print(line)
+        template = self._regional(self._get_template(template_name))['json']
+        return list(difflib.unified_diff(stack_template.splitlines(), template.splitlines(), fromfile=stack_name, tofile=template_name, lineterm=''))
+
+    def gc(self, dry_run=False, grace=7):
+        """Delete uploaded templates no longer used by any stack.
+
+        A template is kept if a live stack in its region runs it or references
+        it as a nested stack, if it is the current version of a local template,
+        or if it is newer than the grace period in days. Returns a dict of
+        region to GcResult.
+        """
+        local = set()
+        for data in self.templates.itervalues():
+            if 's3_key' in data:
+                local.add(data['s3_key'])
+                local.update(r['s3_key'] for r in data.get('regions', {}).itervalues())
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=grace)
+        def collect(app):
+            bucket = 'balanced-cfn-{}'.format(app.region)
+            referenced = app._referenced_template_keys()
+            garbage = []
+            for obj in app.backend.list_objects(bucket, 'templates/'):
+                if obj.key in referenced or obj.key in local:
+                    continue
+                if obj.last_modified.replace(tzinfo=None) > cutoff:
+                    continue
+                garbage.append(obj.key)
+            if garbage and not dry_run:
+                app.backend.delete_objects(bucket, garbage)
+            return GcResult(len(referenced), garbage)
+        return self._map_regions(collect)
+
+    def graph(self, name):
+        """Return the resource dependency graph.Graph of a template."""
+        data = self._get_template(name)
+        if 'error' in data:
+            raise ValueError('Template {} has errors, run brix show {} for details'.format(data['name'], data['name']))
+        return graph.Graph.from_template(json.loads(data['json']), self._parsed_template)
+
+    def size(self, name=None):
+        """Return the rendered size in bytes of templates, None for errors."""
+        names = [self._get_template(name)['name']] if name else self.templates.keys()
+        return collections.OrderedDict(
+            (name, None if 'error' in self.templates[name] else len(self._regional(self.templates[name])['json']))
+            for name in names
+        )
+
+    def find(self, physical_id, refresh=False):
+        """Find which stacks own a physical resource ID, or IDs with that prefix.
+
+        Returns a list of index.Matches.
+        """
+        resource_index = index.ResourceIndex()
+        if refresh or resource_index.empty():
+            self._refresh_index(resource_index)
+        matches = resource_index.find(physical_id)
+        if not matches and not refresh:
+            # Maybe it was created since the last refresh.
+            self._refresh_index(resource_index)
+            matches = resource_index.find(physical_id)
+        return matches
+
+    def boot_report(self, stack_name):
+        """Aggregate instance boot reports for a stack and its nested stacks.
+
+        Returns a list of bootreport.PhaseStats.
+        """
+        bucket = 'balanced-cfn-{}'.format(self.region)
+        reports = []
+        for stack in self._stack_tree(stack_name):
+            # Nested stacks are listed by ARN, reports use the name.
+            if stack.startswith('arn:'):
+                stack = stack.split('/')[1]
+            for obj in self.backend.list_objects(bucket, bootreport.PREFIX.format(stack)):
+                reports.append(json.loads(self.backend.get_object(bucket, obj.key)))
+        if not reports:
+            raise ValueError('No boot reports found for stack {}'.format(stack_name))
+        return bootreport.aggregate(reports)
+
+    def bake(self, roles=None, source_ami=None):
+        """Build an image for each role with its recipe already converged.
+
+        All roles used by templates are built by default, in parallel. AMI IDs
+        are saved to templates/amis.json and templates are re-rendered to use
+        them. Returns a dict of role to region to AMI ID.
+        """
+        from templates import base
+        role_envs = bake.roles(self.templates)
+        roles = roles or sorted(role_envs)
+        source_ami = source_ami or base.BASE_AMIS['us-east-1']
+        results = {}
+        errors = {}
+        def worker(role):
+            try:
+                results[role] = bake.build(role, source_ami, role_envs.get(role, 'production'))
+            except Exception, e:
+                errors[role] = str(e)
+        threads = [threading.Thread(target=worker, args=(role,)) for role in roles]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if results:
+            amis = bake.load()
+            amis.update(results)
+            bake.save(amis)
+            self.reload()
+        if errors:
+            raise ValueError('\n'.join(errors[role] for role in sorted(errors)))
+        return results
+
+    def refresh(self):
+        """Start over between operations on a long-lived object.
+
+        Forgets AWS reads cached so far and re-renders templates if they
+        changed on disk or used stack outputs older than their TTL.
+        Connections are kept.
+        """
+        self.cache.clear()
+        return self.reload(force=self._outputs is not None and self._outputs.expired())
+
+    def reload(self, force=False):
+        """Re-render all templates if any template module changed on disk."""
+        mtimes = self._template_mtimes()
+        if mtimes == self._mtimes and not force:
+            return False
+        # Drop the whole package so base classes get re-imported too.
+        for mod_name in list(sys.modules):
+            if mod_name == 'templates' or mod_name.startswith('templates.'):
+                del sys.modules[mod_name]
+        self.templates = self._load_templates()
+        self._mtimes = mtimes
+        return True
+
+    def _template_mtimes(self):
+        """Return modification times for all template source files."""
+        import templates
+        path = os.path.join(os.path.dirname(templates.__file__), '*.py')
+        # Baked AMI IDs are template inputs too.
+        files = glob.glob(path) + [bake.AMIS_PATH]
+        return {f: os.path.getmtime(f) for f in files if os.path.exists(f)}
+
+    def _connect(self, region):
+        """Create a rate limited, cached backend for a region."""
+        conn = backend.connect(self.backend_spec, region, self.access_key_id, self.secret_access_key)
+        conn = aws.Throttled(conn, region, backend.SERVICES)
+        def namespaces(methods):
+            return {m: aws.namespace(backend.SERVICES.get(m, 'cloudformation'), region) for m in methods}
+        return cache.Cached(conn, self.cache, namespaces(self.CACHED_READS), namespaces(self.CACHE_WRITES))
+
+    def _map_regions(self, fn, regions=None):
+        """Call fn with a copy of this object for each region, concurrently.
+
+        Returns a dict of region to result.
+        """
+        results = {}
+        errors = []
+        def worker(region):
+            try:
+                results[region] = fn(self.for_region(region))
+            except Exception:
+                errors.append(sys.exc_info())
+        threads = [threading.Thread(target=worker, args=(region,)) for region in regions or self.REGIONS]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0][0], errors[0][1], errors[0][2]
+        return results
+
+    def _referenced_template_keys(self):
+        """Find template keys used by live stacks in this region.
+
+        CloudFormation doesn't tell us which URL a stack was created from, so
+        a stack's own template is matched by hashing its body. Nested stacks
+        are found through the TemplateURLs in their parents.
+        """
+        keys = set()
+        for stack in self._cfn_iterate(lambda t: self.backend.list_stacks(next_token=t)):
+            if stack.stack_status == 'DELETE_COMPLETE':
+                continue
+            body = self.backend.get_template(stack.stack_name)
+            keys.update(self.TEMPLATE_KEY_RE.findall(body))
+            keys.update(self._template_keys(self._template_sha1(body)))
+        return keys
+
+    def _stack_tree(self, stack_name):
+        """Return a stack and all of its nested stacks."""
+        stacks = []
+        pending = [stack_name]
+        while pending:
+            s = pending.pop()
+            stacks.append(s)
+            for res in self.backend.describe_stack_resources(s):
+                if res.resource_type == 'AWS::CloudFormation::Stack':
+                    pending.append(res.physical_resource_id)
+        return stacks
+
+    def _stack_events(self, stacks):
+        """Return all events for a list of stacks."""
+        events = []
+        for stack in stacks:
+            events.extend(self._cfn_iterate(lambda t: self.backend.describe_stack_events(stack, next_token=t)))
+        return events
+
+    def _refresh_index(self, resource_index):
+        """Fetch resources of stacks changed since they were indexed, all regions at once."""
+        # SQLite connections stay on this thread, workers only talk to AWS.
+        versions = {region: resource_index.versions(region) for region in self.REGIONS}
+        def fetch(app):
+            known = versions[app.region]
+            live = {}
+            changed = []
+            for stack in app._cfn_iterate(lambda t: app.backend.list_stacks(next_token=t)):
+                if stack.stack_status == 'DELETE_COMPLETE':
+                    continue
+                live[stack.stack_name] = stack
+                if known.get(stack.stack_name) != index.stack_version(stack):
+                    changed.append((stack, list(app.backend.describe_stack_resources(stack.stack_name))))
+            return changed, [name for name in known if name not in live]
+        for region, (changed, deleted) in self._map_regions(fetch).iteritems():
+            for stack, resources in changed:
+                resource_index.update(region, stack, resources)
+            for stack_name in deleted:
+                resource_index.remove(region, stack_name)
+
+    def _template_keys(self, sha1):
+        """Possible S3 keys for a template body hash."""
+        keys = ['templates/{}-{}.json'.format(name, sha1) for name in self.TEMPLATES]
+        keys.extend('templates/{}-{}-{}.json'.format(name, self.region, sha1) for name in self.TEMPLATES)
+        return keys
+
+    def _template_sha1(self, body):
+        """Hash a template body fetched from AWS by its canonical form, see brix.canonical."""
+        return canonical.sha1(json.loads(body))
+
+    def _describe_stack(self, stack_name, cached=True):
+        """Return a stack, or None if it doesn't exist."""
+        conn = self.backend if cached else self.backend.uncached
+        try:
+            return conn.describe_stacks(stack_name)[0]
+        except boto.exception.BotoServerError, e:
+            if aws.is_missing_stack(e):
+                return None
+            raise
 
     def _load_templates(self):
         """Load all known templates and compute some data about them."""
+        resolver = outputs.OutputResolver(self)
+        templates = self._render_templates(resolver)
+        if resolver.pending:
+            # Some StackOutputs weren't cached, look them up and go again.
+            resolver.fetch()
+            templates = self._render_templates(resolver)
+        self._outputs = resolver
+        return templates
+
+    def _render_templates(self, resolver):
+        """Render all templates, children before their parents."""
         templates = {}
         # HAXXXXXX :-(
         from templates import base
         base.Stack.TEMPLATES = templates
+        base.StackOutput.RESOLVER = resolver
         for name in reversed(self.TEMPLATES):
-            template_data = {'name': name}
+            template_data = {'name': name, 'children': []}
             try:
                 template_data['class'] = self._load_template(name)
-                template_data['json'] = template_data['class']().to_json()
-                template_data['sha1'] = hashlib.sha1(template_data['json']).hexdigest()
+                template_data['json'], document = self._render_template(template_data['class'])
+                template_data['warnings'] = split.warnings(document, len(template_data['json']))
+                if template_data['warnings'] and getattr(template_data['class'], 'AUTO_SPLIT', False):
+                    template_data['json'], document = self._split_template(name, json.loads(template_data['json']), templates)
+                    template_data['children'] = sorted(n for n in templates if templates[n].get('parent') == name)
+                    template_data['warnings'] = ['split into {} nested stacks, {}'.format(len(template_data['children']), ', '.join(template_data['warnings']))]
+                template_data['sha1'] = canonical.sha1(document)
                 template_data['s3_key'] = 'templates/{}-{}.json'.format(name, template_data['sha1'])
             except Exception:
                 template_data['error'] = sys.exc_info()
             templates[name] = template_data
-        return collections.OrderedDict((name, templates[name]) for name in self.TEMPLATES)
+        if self.per_region:
+            self._specialize_templates(templates)
+        # Generated children go right after their parent.
+        return collections.OrderedDict(
+            (child, templates[child])
+            for name in self.TEMPLATES
+            for child in [name] + templates[name]['children']
+        )
+
+    def _render_template(self, template_class):
+        """Return the JSON of a template and the document it was made from.
+
+        The document is what troposphere's to_json() serializes, troposphere
+        objects included, so it can be hashed without parsing the JSON again.
+        """
+        template = template_class()
+        document = {'Resources': template.resources}
+        for key, attr in [
+            ('AWSTemplateFormatVersion', 'version'),
+            ('Conditions', 'conditions'),
+            ('Description', 'description'),
+            ('Mappings', 'mappings'),
+            ('Outputs', 'outputs'),
+            ('Parameters', 'parameters'),
+        ]:
+            if getattr(template, attr):
+                document[key] = getattr(template, attr)
+        return json.dumps(document, cls=troposphere.awsencode, indent=4, sort_keys=True, separators=(',', ': ')), document
+
+    def _split_template(self, name, body, templates):
+        """Move resources of a template into generated children, see brix.split.
+
+        The children are added to templates and the parent's JSON and
+        document are returned.
+        """
+        parent, children = split.split(name, body)
+        for child_name, child in children:
+            child_json = split.dumps(child)
+            sha1 = canonical.sha1(child)
+            templates[child_name] = {
+                'name': child_name,
+                'parent': name,
+                'children': [],
+                'warnings': [],
+                'json': child_json,
+                'sha1': sha1,
+                's3_key': 'templates/{}-{}.json'.format(child_name, sha1),
+            }
+        return split.dumps(parent), parent
+
+    def _specialize_templates(self, templates):
+        """Add a region-specialized version of each template, see brix.regional.
+
+        Children, including generated split children, go first so parents
+        can point at their regional keys.
+        """
+        key_maps = {region: {} for region in self.REGIONS}
+        for name in reversed(self.TEMPLATES):
+            for child in templates[name]['children'] + [name]:
+                template_data = templates[child]
+                if 'error' in template_data:
+                    continue
+                body = json.loads(template_data['json'])
+                template_data['regions'] = {}
+                for region in self.REGIONS:
+                    regional_json, sha1 = regional.render(body, region, key_maps[region])
+                    s3_key = 'templates/{}-{}-{}.json'.format(child, region, sha1)
+                    template_data['regions'][region] = {'json': regional_json, 'sha1': sha1, 's3_key': s3_key}
+                    key_maps[region][template_data['s3_key']] = s3_key
+
+    def _regional(self, data, region=None):
+        """Return the version of rendered template data to use in a region."""
+        return data.get('regions', {}).get(region or self.region, data)
 
     def _load_template(self, name):
         """Given a module name, return the template class."""
@@ -251,6 +656,13 @@ class Brix(object):
         else:
             raise ValueError('Unknown template {}'.format(name))
 
+    def _parsed_template(self, name):
+        """Return the parsed JSON for a template, or None if it isn't usable."""
+        data = self.templates.get(name)
+        if not data or 'json' not in data:
+            return None
+        return json.loads(data['json'])
+
     def _cfn_iterate(self, fn):
         first = True
         next_token = None
@@ -262,37 +674,183 @@ class Brix(object):
             next_token = objs.next_token
 
 
-def main():
-    args = docopt.docopt(__doc__, version='brix 1.0-dev')
-    app = Brix(args['--region'])
+def run(app, args):
+    """Run the command described by parsed docopt arguments.
+
+    Brix methods return results, this formats them for the terminal.
+    """
     try:
         if args['validate']:
-            app.validate(quiet=args['--quiet'], full=args['--full'])
+            results = app.validate(full=args['--full'])
+            for result in results:
+                if result.error:
+                    print('{} error: {}'.format(result.name, result.error))
+                elif not args['--quiet']:
+                    print('{} ok'.format(result.name))
+                for warning in result.warnings:
+                    print('{} warning: {}'.format(result.name, warning))
+            if any(result.error for result in results):
+                raise ValueError('Errors detected')
         elif args['show']:
-            app.show(args['<name>'])
+            print(app.show(args['<name>'], args['--resource'], args['--path']))
         elif args['sync']:
-            app.sync()
+            _print_uploads(app.sync())
         elif args['stacks']:
-            app.stacks()
+            for stack in app.stacks():
+                print('{0.name}: {0.description}'.format(stack))
         elif args['update']:
             if not args['--no-sync']:
-                app.sync()
+                _print_uploads(app.sync())
             def parse_param(s):
                 if ':' in s:
                     return s.split(':', 1)
                 else:
                     return (s, '1')
             params = dict(parse_param(s) for s in args['--param'])
-            app.update(args['<stack>'], args['<template>'], params)
+            change = app.update(args['<stack>'], args['<template>'], params)
+            print('{} stack {} in {}'.format('Creating' if change.operation == 'create' else 'Updating', change.stack_name, change.region))
+            print()
         elif args['events']:
-            app.events(args['<stack>'], not args['--no-recurse'])
+            events = app.events(args['<stack>'], not args['--no-recurse'])
+            nested = len(set(event.stack_name for event in events)) > 1
+            for event in events:
+                fmt = '{2} '
+                if nested:
+                    fmt += '[{0.stack_name}]\t'
+                fmt += '{0.logical_id}: {0.status} {1}'
+                print(fmt.format(event, event.reason or '', event.timestamp.replace(microsecond=0)))
+        elif args['timings']:
+            _print_timings(app.timings(args['<stack>']), 'json' if args['--json'] else 'gantt' if args['--gantt'] else 'table')
         elif args['diff']:
-            app.diff(args['<stack>'], args['<template>'])
+            for line in app.diff(args['<stack>'], args['<template>']):
+                print(line)
+        elif args['apply']:
+            def progress(deploy):
+                print('{}: {}{}'.format(deploy.stack_id, deploy.result, ' ({})'.format(deploy.reason) if deploy.reason else ''))
+            results = app.apply(args['<manifest>'], int(args['--concurrency']), not args['--no-sync'], progress)
+            failed = [stack_id for stack_id, deploy in results.iteritems() if deploy.result in ('failed', 'skipped')]
+            if failed:
+                raise ValueError('Failed to deploy {}'.format(', '.join(sorted(failed))))
+        elif args['gc']:
+            results = app.gc(args['--dry-run'], int(args['--grace']))
+            for region in app.REGIONS:
+                result = results[region]
+                print('{}: {} referenced, {} {}'.format(region, result.referenced, 'would delete' if args['--dry-run'] else 'deleted', len(result.garbage)))
+                if args['--dry-run']:
+                    for key in result.garbage:
+                        print('  {}'.format(key))
+        elif args['graph']:
+            g = app.graph(args['<name>'])
+            if args['--dot']:
+                print(g.to_dot(app._get_template(args['<name>'])['name']))
+            else:
+                _print_graph(g)
+        elif args['size']:
+            for name, size in app.size(args['<name>']).iteritems():
+                print('{} {}'.format(name, 'error' if size is None else size))
+        elif args['bake']:
+            for role, amis in sorted(app.bake(args['--role'], args['--source-ami']).iteritems()):
+                print('{} {}'.format(role, ' '.join('{}:{}'.format(region, ami_id) for region, ami_id in sorted(amis.iteritems()))))
+        elif args['boot-report']:
+            stats = app.boot_report(args['<stack>'])
+            if args['--json']:
+                print(json.dumps([s._asdict() for s in stats], indent=4))
+            else:
+                for s in stats:
+                    print('{0.role:<24} {0.phase:<40} {0.count:>4} x {0.p50:>7.1f}s p50 {0.p90:>7.1f}s p90 {0.p99:>7.1f}s p99 {0.max:>7.1f}s max'.format(s))
+        elif args['find']:
+            matches = app.find(args['<physical-id>'], args['--refresh'])
+            if not matches:
+                raise ValueError('No resource found for {}'.format(args['<physical-id>']))
+            for match in matches:
+                print('{0.physical_id} {0.region} {0.stack_path} {0.logical_id} ({0.resource_type})'.format(match))
     except ValueError, e:
         print(e.message, file=sys.stderr)
         sys.exit(1)
 
 
+def _print_uploads(uploads):
+    by_name = collections.OrderedDict()
+    for upload in uploads:
+        by_name.setdefault(upload.name, []).append(upload.region)
+    for name, regions in by_name.iteritems():
+        print('Uploading {} {}'.format(name, ' '.join(regions)))
+
+
+def _print_timings(result, output):
+    deploy, resources, path = result.deploy, result.resources, result.critical_path
+    if output == 'json':
+        def interval_data(i):
+            return {
+                'stack': i.stack_name,
+                'logical_id': i.logical_id,
+                'resource_type': i.resource_type,
+                'operation': i.operation,
+                'status': i.status,
+                'start': i.start.isoformat(),
+                'duration': timings.duration(i),
+            }
+        print(json.dumps({
+            'deploy': interval_data(deploy),
+            'resources': [interval_data(i) for i in resources],
+            'critical_path': [interval_data(i) for i in path],
+            'by_type': result.by_type,
+        }, indent=4))
+    elif output == 'gantt':
+        for line in timings.gantt(deploy, resources):
+            print(line)
+    else:
+        print('{} {} {} in {:.0f}s'.format(deploy.stack_name, deploy.operation, deploy.status, timings.duration(deploy)))
+        print()
+        for i in resources:
+            marker = '*' if i in path else ' '
+            print('{}{:>6.0f}s +{:<6.0f} [{}] {} ({})'.format(marker, timings.duration(i), (i.start - deploy.start).total_seconds(), i.stack_name, i.logical_id, i.resource_type))
+        print()
+        print('Critical path: {:.0f}s'.format(sum(timings.duration(i) for i in path)))
+        print()
+        print('By type over {} deploys:'.format(len(result.deploys)))
+        for row in result.by_type:
+            print('{mean:>6.0f}s mean {p50:>6.0f}s p50 {max:>6.0f}s max {count:>4} x {operation} {resource_type}'.format(**row))
+
+
+def _print_graph(g):
+    chain = g.longest_chain()
+    print('Longest chain ({} resources):'.format(len(chain)))
+    for node in chain:
+        print('  {} ({})'.format(node, g.nodes[node]))
+    report = g.depends_on_report()
+    if report:
+        print()
+        print('DependsOn:')
+    for edge, implied, saving in report:
+        if implied:
+            status = 'implied by other references, can be removed'
+        elif saving:
+            status = 'adds {} to the longest chain'.format(saving)
+        else:
+            status = 'not on the longest chain'
+        print('  {} -> {}: {}'.format(edge.source, edge.target, status))
+
+
+def main():
+    args = docopt.docopt(__doc__, version='brix 1.0-dev')
+    socket_path = os.path.expanduser(args['--socket'])
+    if args['serve']:
+        server.serve(socket_path, lambda region, backend_spec, cache_ttl: Brix(region, cache_ttl=cache_ttl, backend=backend_spec), run)
+        return
+    if not args['--no-daemon'] and not args['--per-region'] and any(args[c] for c in server.COMMANDS):
+        reply = server.forward(socket_path, args)
+        if reply is not None:
+            sys.stdout.write(reply['stdout'])
+            sys.stderr.write(reply['stderr'])
+            sys.exit(reply['status'])
+    app = Brix(args['--region'], cache_ttl=int(args['--cache-ttl']), backend=args['--backend'], per_region=args['--per-region'])
+    try:
+        run(app, args)
+    finally:
+        if args['--stats']:
+            print(aws.STATS, file=sys.stderr)
+
 
 if __name__ == '__main__':
     main()
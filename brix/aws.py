@@ -0,0 +1,173 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Throttling-aware wrapper for all AWS calls.
+
+Every call brix makes goes through a Throttled proxy. Calls to the same
+service share a token bucket, so any number of threads stay under the API's
+rate together, and calls rejected for throttling are retried with jittered
+exponential backoff.
+"""
+
+import functools
+import random
+import threading
+import time
+
+import boto.exception
+
+
+# Sustained calls per second and burst size for each service.
+RATES = {
+    'cloudformation': (4.0, 8),
+    's3': (50.0, 100),
+}
+
+THROTTLING_CODES = set([
+    'Throttling',
+    'ThrottlingException',
+    'RequestLimitExceeded',
+    'SlowDown',
+])
+
+
+def is_throttling(e):
+    """Check if a BotoServerError means we are calling too fast."""
+    return e.error_code in THROTTLING_CODES or (e.status == 400 and 'Rate exceeded' in (e.message or ''))
+
+
+def is_missing_stack(e):
+    """Check if a BotoServerError means a stack doesn't exist."""
+    return e.status == 400 and e.error_code == 'ValidationError' and 'does not exist' in (e.message or '')
+
+
+class TokenBucket(object):
+    """A thread-safe token bucket rate limiter."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, sleeping until one is available.
+
+        Returns the number of seconds spent waiting.
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class Stats(object):
+    """Counters for AWS calls, shared by all threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0.0
+
+    def add(self, calls=0, retries=0, throttled=0.0):
+        with self.lock:
+            self.calls += calls
+            self.retries += retries
+            self.throttled += throttled
+
+    def __str__(self):
+        return 'AWS calls: {0.calls}, retries: {0.retries}, time throttled: {0.throttled:.1f}s'.format(self)
+
+
+STATS = Stats()
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def namespace(service, region=None):
+    """Name for everything shared per service, like rate limits and caches.
+
+    S3 is global, CloudFormation limits are per region.
+    """
+    if service == 's3' or not region:
+        return service
+    return '{}.{}'.format(service, region)
+
+
+def bucket(service, region=None):
+    """Return the shared token bucket for a service in a region."""
+    key = namespace(service, region)
+    with _buckets_lock:
+        if key not in _buckets:
+            _buckets[key] = TokenBucket(*RATES[service])
+        return _buckets[key]
+
+
+class Throttled(object):
+    """Proxy for a backend that rate limits and retries every call.
+
+    services maps method names to the service they call, anything else uses
+    the default service.
+    """
+
+    MAX_RETRIES = 8
+    BASE_DELAY = 0.5
+    MAX_DELAY = 20.0
+
+    def __init__(self, conn, region=None, services={}, default='cloudformation', stats=STATS):
+        self._conn = conn
+        self._region = region
+        self._services = services
+        self._default = default
+        self._stats = stats
+
+    def __getattr__(self, name):
+        attr = getattr(self._conn, name)
+        if not callable(attr):
+            return attr
+        limiter = bucket(self._services.get(name, self._default), self._region)
+        @functools.wraps(attr)
+        def wrapper(*args, **kwargs):
+            return self._call(limiter, attr, args, kwargs)
+        return wrapper
+
+    def _call(self, limiter, fn, args, kwargs):
+        attempt = 0
+        while True:
+            self._stats.add(calls=1, throttled=limiter.acquire())
+            try:
+                return fn(*args, **kwargs)
+            except boto.exception.BotoServerError, e:
+                if not is_throttling(e) or attempt >= self.MAX_RETRIES:
+                    raise
+            # Full jitter, so concurrent callers don't retry in lockstep.
+            delay = random.uniform(0, min(self.MAX_DELAY, self.BASE_DELAY * 2 ** attempt))
+            self._stats.add(retries=1, throttled=delay)
+            time.sleep(delay)
+            attempt += 1
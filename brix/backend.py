@@ -0,0 +1,512 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""AWS backends.
+
+Brix talks to AWS only through a Backend, which covers the handful of S3 and
+CloudFormation operations it needs. BotoBackend is the real thing,
+MemoryBackend keeps everything in process so commands can be run, tested and
+benchmarked without credentials or a network.
+
+CloudFormation results use the same attribute names as the boto objects they
+stand in for.
+"""
+
+import abc
+import collections
+import cPickle
+import datetime
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+
+import boto
+import boto.cloudformation
+import boto.exception
+import boto.utils
+
+
+# Which service each backend method talks to, for rate limiting and caching.
+# Anything not listed here is CloudFormation.
+SERVICES = {
+    'put_object': 's3',
+    'get_object': 's3',
+    'list_objects': 's3',
+    'delete_objects': 's3',
+}
+
+StoredObject = collections.namedtuple('StoredObject', ['key', 'last_modified', 'size'])
+
+
+def connect(spec, region, access_key_id=None, secret_access_key=None):
+    """Create a backend from a --backend spec.
+
+    The spec is either "boto" or "memory", optionally followed by a colon and
+    comma-separated MemoryBackend options: path to keep the in-memory state
+    in a file between runs, latency, throttle and deploy_time, as in
+    "memory:path=/tmp/brix,latency=0.2,throttle=0.05". "memory:PATH" is
+    short for "memory:path=PATH".
+    """
+    name, _, arg = spec.partition(':')
+    if name == 'boto':
+        if arg:
+            raise ValueError('The boto backend takes no options')
+        return BotoBackend(region, access_key_id, secret_access_key)
+    elif name == 'memory':
+        options = parse_options(arg)
+        path = options.pop('path', None)
+        try:
+            options = {k: float(v) for k, v in options.iteritems()}
+        except ValueError:
+            raise ValueError('Invalid memory backend options {}'.format(arg))
+        return MemoryBackend(region, MemoryWorld.get(path), **options)
+    raise ValueError('Unknown backend {}'.format(spec))
+
+
+def parse_options(arg):
+    """Parse the options of a memory backend spec into a dict."""
+    if arg and '=' not in arg:
+        return {'path': arg}
+    options = {}
+    for option in filter(None, arg.split(',')):
+        key, sep, value = option.partition('=')
+        if not sep or key not in ('path', 'latency', 'throttle', 'deploy_time'):
+            raise ValueError('Unknown memory backend option {}'.format(option))
+        options[key] = value
+    return options
+
+
+class Backend(object):
+    """Interface for AWS operations used by brix."""
+
+    __metaclass__ = abc.ABCMeta
+
+    @abc.abstractmethod
+    def put_object(self, bucket, key, body):
+        pass
+
+    @abc.abstractmethod
+    def get_object(self, bucket, key):
+        """Return the body of an object."""
+
+    @abc.abstractmethod
+    def list_objects(self, bucket, prefix=''):
+        """Return a list of StoredObjects."""
+
+    @abc.abstractmethod
+    def delete_objects(self, bucket, keys):
+        pass
+
+    @abc.abstractmethod
+    def validate_template(self, template_url):
+        pass
+
+    @abc.abstractmethod
+    def create_stack(self, stack_name, template_url, capabilities=[], parameters=[], disable_rollback=False):
+        pass
+
+    @abc.abstractmethod
+    def update_stack(self, stack_name, template_url, capabilities=[], parameters=[]):
+        pass
+
+    @abc.abstractmethod
+    def describe_stacks(self, stack_name=None, next_token=None):
+        pass
+
+    @abc.abstractmethod
+    def list_stacks(self, next_token=None):
+        pass
+
+    @abc.abstractmethod
+    def describe_stack_events(self, stack_name, next_token=None):
+        pass
+
+    @abc.abstractmethod
+    def describe_stack_resources(self, stack_name):
+        pass
+
+    @abc.abstractmethod
+    def get_template(self, stack_name):
+        """Return the template body for a stack."""
+
+
+class BotoBackend(Backend):
+    # Most keys S3 will delete in one request.
+    DELETE_BATCH = 1000
+
+    def __init__(self, region, access_key_id=None, secret_access_key=None):
+        for r in boto.cloudformation.regions():
+            if r.name == region:
+                break
+        else:
+            raise ValueError('Unknown region {0}'.format(region))
+        self.cfn = boto.connect_cloudformation(access_key_id, secret_access_key, region=r)
+        self.s3 = boto.connect_s3(access_key_id, secret_access_key)
+
+    def _bucket(self, name):
+        return self.s3.get_bucket(name, validate=False)
+
+    def put_object(self, bucket, key, body):
+        self._bucket(bucket).new_key(key).set_contents_from_string(body)
+
+    def get_object(self, bucket, key):
+        return self._bucket(bucket).new_key(key).get_contents_as_string()
+
+    def list_objects(self, bucket, prefix=''):
+        return [StoredObject(k.name, boto.utils.parse_ts(k.last_modified), k.size) for k in self._bucket(bucket).list(prefix)]
+
+    def delete_objects(self, bucket, keys):
+        keys = list(keys)
+        for i in xrange(0, len(keys), self.DELETE_BATCH):
+            result = self._bucket(bucket).delete_keys(keys[i:i+self.DELETE_BATCH], quiet=True)
+            if result.errors:
+                raise ValueError('Unable to delete {} from {}: {}'.format(result.errors[0].key, bucket, result.errors[0].message))
+
+    def validate_template(self, template_url):
+        return self.cfn.validate_template(template_url=template_url)
+
+    def create_stack(self, stack_name, template_url, capabilities=[], parameters=[], disable_rollback=False):
+        return self.cfn.create_stack(stack_name=stack_name, template_url=template_url, capabilities=capabilities, parameters=parameters, disable_rollback=disable_rollback)
+
+    def update_stack(self, stack_name, template_url, capabilities=[], parameters=[]):
+        return self.cfn.update_stack(stack_name=stack_name, template_url=template_url, capabilities=capabilities, parameters=parameters)
+
+    def describe_stacks(self, stack_name=None, next_token=None):
+        return self.cfn.describe_stacks(stack_name, next_token=next_token)
+
+    def list_stacks(self, next_token=None):
+        return self.cfn.list_stacks(next_token=next_token)
+
+    def describe_stack_events(self, stack_name, next_token=None):
+        return self.cfn.describe_stack_events(stack_name, next_token=next_token)
+
+    def describe_stack_resources(self, stack_name):
+        return self.cfn.describe_stack_resources(stack_name)
+
+    def get_template(self, stack_name):
+        # Who wants to bet this long string of __getitem__'s will break eventually?
+        return self.cfn.get_template(stack_name)['GetTemplateResponse']['GetTemplateResult']['TemplateBody']
+
+
+def _setting(value, env_var):
+    if value is None:
+        value = os.environ.get(env_var, 0.0)
+    return float(value)
+
+
+def _error(status, code, message):
+    """Build an error shaped like the ones boto raises."""
+    e = boto.exception.BotoServerError(status, code)
+    e.error_code = code
+    e.message = message
+    return e
+
+
+class ResultSet(list):
+    """A list with a pagination token, like boto.resultset.ResultSet."""
+
+    next_token = None
+
+
+class Record(object):
+    """Plain attribute bag standing in for boto result objects."""
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    def __repr__(self):
+        return 'Record({})'.format(', '.join('{}={!r}'.format(k, v) for k, v in sorted(self.__dict__.iteritems())))
+
+
+class MemoryWorld(object):
+    """State shared by every MemoryBackend in a process.
+
+    If a path is given, the state is loaded from and saved to that file so
+    separate brix invocations see each other's stacks and objects.
+    """
+
+    _worlds = {}
+    _worlds_lock = threading.Lock()
+
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.RLock()
+        self.buckets = collections.defaultdict(dict)
+        self.stacks = collections.defaultdict(collections.OrderedDict)
+        if path and os.path.exists(path):
+            with open(path, 'rb') as f:
+                self.buckets, self.stacks = cPickle.load(f)
+
+    @classmethod
+    def get(cls, path=None):
+        with cls._worlds_lock:
+            if path not in cls._worlds:
+                cls._worlds[path] = cls(path)
+            return cls._worlds[path]
+
+    def save(self):
+        if self.path:
+            with open(self.path, 'wb') as f:
+                cPickle.dump((self.buckets, self.stacks), f, cPickle.HIGHEST_PROTOCOL)
+
+
+class MemoryBackend(Backend):
+    """In-memory stand-in for AWS.
+
+    latency is added to every call, and each call fails with a Throttling
+    error with probability throttle. Stack creates and updates stay
+    IN_PROGRESS for deploy_time seconds, with every resource getting its own
+    start and end events in between.
+    """
+
+    URL_RE = re.compile(r'^https://([^.]+)\.s3\.amazonaws\.com/(.+)$')
+
+    def __init__(self, region, world=None, latency=None, throttle=None, deploy_time=None):
+        self.region = region
+        self.world = world or MemoryWorld()
+        # Settings not passed in come from the environment.
+        self.latency = _setting(latency, 'BRIX_MEMORY_LATENCY')
+        self.throttle = _setting(throttle, 'BRIX_MEMORY_THROTTLE')
+        self.deploy_time = _setting(deploy_time, 'BRIX_MEMORY_DEPLOY_TIME')
+
+    def _call(self):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.throttle and random.random() < self.throttle:
+            raise _error(400, 'Throttling', 'Rate exceeded')
+
+    @property
+    def _stacks(self):
+        return self.world.stacks[self.region]
+
+    def _stack(self, stack_name):
+        stack = self._stacks.get(stack_name)
+        if not stack:
+            # Allow lookup by stack ID too.
+            stack = next((s for s in self._stacks.itervalues() if s['stack_id'] == stack_name), None)
+        if not stack:
+            raise _error(400, 'ValidationError', 'Stack with id {} does not exist'.format(stack_name))
+        self._advance(stack)
+        return stack
+
+    def _now(self):
+        return datetime.datetime.utcnow().replace(microsecond=0)
+
+    def _advance(self, stack):
+        """Fill in events and final status once an operation has run its course."""
+        if not stack['stack_status'].endswith('_IN_PROGRESS') or time.time() < stack['ready_at']:
+            return
+        final = stack['stack_status'].replace('_IN_PROGRESS', '_COMPLETE')
+        body = stack['body']
+        resources = sorted(body.get('Resources', {}).iteritems())
+        start = stack['started_at']
+        step = datetime.timedelta(seconds=self.deploy_time / (len(resources) + 1))
+        for i, (logical_id, resource) in enumerate(resources):
+            self._event(stack, logical_id, resource['Type'], final.replace('_COMPLETE', '_IN_PROGRESS'), start + step * i)
+            self._event(stack, logical_id, resource['Type'], final, start + step * (i + 1))
+        stack['stack_status'] = final
+        stack['resources'] = [self._resource(stack, logical_id, resource) for logical_id, resource in resources]
+        self._event(stack, stack['stack_name'], 'AWS::CloudFormation::Stack', final, self._now())
+        self.world.save()
+
+    def _event(self, stack, logical_id, resource_type, status, timestamp):
+        stack['events'].append(Record(
+            stack_name=stack['stack_name'],
+            stack_id=stack['stack_id'],
+            logical_resource_id=logical_id,
+            physical_resource_id=self._physical_id(stack, logical_id, resource_type),
+            resource_type=resource_type,
+            resource_status=status,
+            resource_status_reason=None,
+            timestamp=timestamp,
+        ))
+
+    def _physical_id(self, stack, logical_id, resource_type):
+        if resource_type == 'AWS::CloudFormation::Stack':
+            if logical_id == stack['stack_name']:
+                return stack['stack_id']
+            return '{}-{}'.format(stack['stack_name'], logical_id)
+        digest = hashlib.sha1('{}/{}/{}'.format(self.region, stack['stack_name'], logical_id)).hexdigest()
+        prefix = resource_type.split('::')[-1].lower()
+        return '{}-{}'.format(prefix, digest[:8])
+
+    def _resource(self, stack, logical_id, resource):
+        physical_id = self._physical_id(stack, logical_id, resource['Type'])
+        if resource['Type'] == 'AWS::CloudFormation::Stack':
+            self._create_nested(physical_id, resource.get('Properties', {}))
+        return Record(
+            stack_name=stack['stack_name'],
+            stack_id=stack['stack_id'],
+            logical_resource_id=logical_id,
+            physical_resource_id=physical_id,
+            resource_type=resource['Type'],
+            resource_status=stack['stack_status'],
+            timestamp=self._now(),
+        )
+
+    def _create_nested(self, stack_name, properties):
+        url = self._resolve(properties.get('TemplateURL'))
+        if not isinstance(url, basestring) or stack_name in self._stacks:
+            return
+        params = {k: v for k, v in properties.get('Parameters', {}).iteritems() if isinstance(v, basestring)}
+        self._create(stack_name, url, params.items())
+
+    def _resolve(self, value):
+        """Evaluate the few intrinsics needed to find nested template URLs."""
+        if isinstance(value, dict) and value.keys() == ['Ref'] and value['Ref'] == 'AWS::Region':
+            return self.region
+        if isinstance(value, dict) and value.keys() == ['Fn::Join']:
+            sep, parts = value['Fn::Join']
+            parts = [self._resolve(p) for p in parts]
+            if all(isinstance(p, basestring) for p in parts):
+                return sep.join(parts)
+        return value
+
+    def _load_url(self, template_url):
+        match = self.URL_RE.match(template_url or '')
+        obj = match and self.world.buckets[match.group(1)].get(match.group(2))
+        if not obj:
+            raise _error(400, 'ValidationError', 'Template URL {} does not point to a template'.format(template_url))
+        try:
+            return json.loads(obj['body'])
+        except ValueError, e:
+            raise _error(400, 'ValidationError', 'Template format error: {}'.format(e))
+
+    def put_object(self, bucket, key, body):
+        self._call()
+        with self.world.lock:
+            self.world.buckets[bucket][key] = {'body': body, 'last_modified': self._now()}
+            self.world.save()
+
+    def get_object(self, bucket, key):
+        self._call()
+        with self.world.lock:
+            obj = self.world.buckets[bucket].get(key)
+        if obj is None:
+            raise _error(404, 'NoSuchKey', 'The specified key does not exist.')
+        return obj['body']
+
+    def list_objects(self, bucket, prefix=''):
+        self._call()
+        with self.world.lock:
+            return [StoredObject(key, obj['last_modified'], len(obj['body'])) for key, obj in sorted(self.world.buckets[bucket].iteritems()) if key.startswith(prefix)]
+
+    def delete_objects(self, bucket, keys):
+        self._call()
+        with self.world.lock:
+            for key in keys:
+                self.world.buckets[bucket].pop(key, None)
+            self.world.save()
+
+    def validate_template(self, template_url):
+        self._call()
+        with self.world.lock:
+            body = self._load_url(template_url)
+        if not body.get('Resources'):
+            raise _error(400, 'ValidationError', 'Template format error: At least one Resources member must be defined.')
+        return Record(description=body.get('Description'), parameters=body.get('Parameters', {}).keys())
+
+    def _start(self, stack, template_url, parameters, status):
+        stack['body'] = self._load_url(template_url)
+        declared = stack['body'].get('Parameters', {})
+        params = {k: str(v['Default']) for k, v in declared.iteritems() if 'Default' in v}
+        params.update((k, str(v)) for k, v in parameters)
+        missing = [k for k in declared if k not in params]
+        if missing:
+            raise _error(400, 'ValidationError', 'Parameters: [{}] must have values'.format(', '.join(missing)))
+        stack.update({
+            'parameters': [Record(key=k, value=v) for k, v in sorted(params.iteritems())],
+            'outputs': [Record(key=k, value='{}-{}'.format(stack['stack_name'], k), description=v.get('Description')) for k, v in sorted(stack['body'].get('Outputs', {}).iteritems())],
+            'template_description': stack['body'].get('Description'),
+            'stack_status': status,
+            'started_at': self._now(),
+            'ready_at': time.time() + self.deploy_time,
+        })
+        self._event(stack, stack['stack_name'], 'AWS::CloudFormation::Stack', status, stack['started_at'])
+        self._advance(stack)
+        self.world.save()
+        return stack['stack_id']
+
+    def create_stack(self, stack_name, template_url, capabilities=[], parameters=[], disable_rollback=False):
+        self._call()
+        with self.world.lock:
+            return self._create(stack_name, template_url, parameters)
+
+    def _create(self, stack_name, template_url, parameters):
+        if stack_name in self._stacks:
+            raise _error(400, 'AlreadyExistsException', 'Stack [{}] already exists'.format(stack_name))
+        stack = {
+            'stack_name': stack_name,
+            'stack_id': 'arn:aws:cloudformation:{}:000000000000:stack/{}/{}'.format(self.region, stack_name, hashlib.sha1(stack_name).hexdigest()[:12]),
+            'creation_time': self._now(),
+            'last_updated_time': None,
+            'tags': {},
+            'events': [],
+            'resources': [],
+        }
+        self._stacks[stack_name] = stack
+        try:
+            return self._start(stack, template_url, parameters, 'CREATE_IN_PROGRESS')
+        except boto.exception.BotoServerError:
+            del self._stacks[stack_name]
+            raise
+
+    def update_stack(self, stack_name, template_url, capabilities=[], parameters=[]):
+        self._call()
+        with self.world.lock:
+            stack = self._stack(stack_name)
+            if stack['stack_status'].endswith('_IN_PROGRESS'):
+                raise _error(400, 'ValidationError', 'Stack:{} is in {} state and can not be updated.'.format(stack['stack_id'], stack['stack_status']))
+            stack['last_updated_time'] = self._now()
+            return self._start(stack, template_url, parameters, 'UPDATE_IN_PROGRESS')
+
+    def _describe(self, stack):
+        fields = ['stack_name', 'stack_id', 'stack_status', 'parameters', 'outputs', 'tags', 'template_description', 'creation_time', 'last_updated_time']
+        record = Record(**{f: stack[f] for f in fields})
+        record.description = record.template_description
+        record.stack_status_reason = None
+        return record
+
+    def describe_stacks(self, stack_name=None, next_token=None):
+        self._call()
+        with self.world.lock:
+            if stack_name:
+                return ResultSet([self._describe(self._stack(stack_name))])
+            return ResultSet(self._describe(self._stack(name)) for name in list(self._stacks))
+
+    def list_stacks(self, next_token=None):
+        return self.describe_stacks()
+
+    def describe_stack_events(self, stack_name, next_token=None):
+        self._call()
+        with self.world.lock:
+            return ResultSet(reversed(self._stack(stack_name)['events']))
+
+    def describe_stack_resources(self, stack_name):
+        self._call()
+        with self.world.lock:
+            return ResultSet(self._stack(stack_name)['resources'])
+
+    def get_template(self, stack_name):
+        self._call()
+        with self.world.lock:
+            return json.dumps(self._stack(stack_name)['body'], indent=4)
@@ -0,0 +1,88 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Per-role image builds.
+
+Each role gets an image built by packer/balanced-role.json on top of the base
+image, with the role's recipe already converged. The resulting AMI IDs are
+kept in templates/amis.json, which templates read through
+templates.base.role_amis.
+"""
+
+import json
+import os
+import subprocess
+
+
+PACKER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'packer')
+AMIS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates', 'amis.json')
+
+
+def roles(templates):
+    """Return Chef role to Chef environment for the roles templates use."""
+    found = {}
+    for data in templates.itervalues():
+        recipe = getattr(data.get('class'), 'CHEF_RECIPE', None)
+        if recipe:
+            found[recipe] = getattr(data['class'], 'ENV', 'production')
+    return found
+
+
+def parse_artifacts(output):
+    """Return region to AMI ID from packer -machine-readable output."""
+    amis = {}
+    for line in output.splitlines():
+        fields = line.split(',')
+        if len(fields) >= 6 and fields[2] == 'artifact' and fields[4] == 'id':
+            for artifact in fields[5].replace('%!(PACKER_COMMA)', ',').split(','):
+                region, _, ami_id = artifact.partition(':')
+                amis[region] = ami_id
+    return amis
+
+
+def build(role, source_ami, chef_env='production'):
+    """Run packer for one role, returns region to AMI ID."""
+    proc = subprocess.Popen(
+        [
+            'packer', 'build', '-machine-readable',
+            '-var', 'role={}'.format(role),
+            '-var', 'source_ami={}'.format(source_ami),
+            '-var', 'chef_env={}'.format(chef_env),
+            'balanced-role.json',
+        ],
+        cwd=PACKER_DIR,
+        stdout=subprocess.PIPE,
+    )
+    output = proc.communicate()[0]
+    amis = parse_artifacts(output)
+    if proc.returncode or not amis:
+        raise ValueError('Packer build for {} failed with status {}'.format(role, proc.returncode))
+    return amis
+
+
+def load(path=AMIS_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(amis, path=AMIS_PATH):
+    with open(path, 'w') as f:
+        json.dump(amis, f, indent=4, sort_keys=True)
+        f.write('\n')
@@ -0,0 +1,76 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Instance boot timing reports.
+
+bootstrap.sh uploads a JSON report per instance to
+boot-reports/<stack>/<instance id>.json in the region's balanced-cfn bucket.
+Each report has the time from kernel start to bootstrap.sh, the start and
+end of each bootstrap phase, and the Chef report handler's per-resource
+timings.
+"""
+
+import collections
+import math
+
+
+PREFIX = 'boot-reports/{}/'
+
+PhaseStats = collections.namedtuple('PhaseStats', ['role', 'phase', 'count', 'p50', 'p90', 'p99', 'max'])
+
+
+def phases(report):
+    """Yield (phase, seconds) for one report.
+
+    Besides the bootstrap phases there is "kernel" for the time before
+    bootstrap.sh started, "chef:<cookbook>::<recipe>" for Chef resources
+    grouped by recipe, and "total".
+    """
+    total = float(report.get('uptime_at_start') or 0)
+    yield 'kernel', total
+    for phase in report.get('phases', []):
+        duration = phase['end'] - phase['start']
+        total += duration
+        yield phase['name'], duration
+    by_recipe = collections.defaultdict(float)
+    for resource in (report.get('chef') or {}).get('resources', []):
+        by_recipe[resource['recipe']] += resource['elapsed']
+    for recipe, elapsed in by_recipe.iteritems():
+        yield 'chef:{}'.format(recipe), elapsed
+    yield 'total', total
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a sorted list."""
+    return values[max(0, int(math.ceil(fraction * len(values))) - 1)]
+
+
+def aggregate(reports):
+    """Return PhaseStats per role and phase, slowest phases first."""
+    durations = collections.defaultdict(list)
+    order = {}
+    for report in reports:
+        for i, (phase, seconds) in enumerate(phases(report)):
+            durations[report.get('role'), phase].append(seconds)
+            order.setdefault(phase, i)
+    stats = []
+    for (role, phase), values in durations.iteritems():
+        values.sort()
+        stats.append(PhaseStats(role, phase, len(values), percentile(values, 0.5), percentile(values, 0.9), percentile(values, 0.99), values[-1]))
+    # Bootstrap phases in the order they run, then recipes by time spent.
+    return sorted(stats, key=lambda s: (s.role, s.phase.startswith('chef:'), -s.p50 if s.phase.startswith('chef:') else order[s.phase]))
@@ -0,0 +1,165 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Request-scoped cache for AWS read calls.
+
+A ResponseCache lives as long as one brix command, so no identical read goes
+to AWS twice. Optionally entries are also kept on disk for a short TTL so
+that back-to-back commands can share them.
+"""
+
+import cPickle
+import functools
+import hashlib
+import os
+import threading
+import time
+
+import boto.connection
+
+
+CACHE_DIR = os.path.expanduser('~/.cache/brix')
+
+
+def _persistent_id(obj):
+    # boto result objects hold a reference to their connection, which can't
+    # (and shouldn't) be pickled.
+    if isinstance(obj, boto.connection.AWSAuthConnection):
+        return 'connection'
+    return None
+
+
+def _persistent_load(pid):
+    return None
+
+
+class ResponseCache(object):
+    def __init__(self, ttl=0, path=CACHE_DIR):
+        self.ttl = ttl
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def get(self, key):
+        """Return (True, value) for a cached key, or (False, None)."""
+        with self.lock:
+            if key in self.entries:
+                return True, self.entries[key]
+        if self.ttl:
+            found, value = self._disk_get(key)
+            if found:
+                with self.lock:
+                    self.entries[key] = value
+                return True, value
+        return False, None
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+        if self.ttl:
+            self._disk_set(key, value)
+
+    def invalidate(self, namespace):
+        """Drop all entries for one namespace."""
+        with self.lock:
+            for key in list(self.entries):
+                if key[0] == namespace:
+                    del self.entries[key]
+        if self.ttl and os.path.isdir(self.path):
+            prefix = self._namespace_hash(namespace)
+            for name in os.listdir(self.path):
+                if name.startswith(prefix):
+                    os.unlink(os.path.join(self.path, name))
+
+    def clear(self):
+        """Forget everything held in memory, e.g. between daemon requests."""
+        with self.lock:
+            self.entries.clear()
+
+    def _namespace_hash(self, namespace):
+        return hashlib.sha1(namespace).hexdigest()[:12]
+
+    def _filename(self, key):
+        return os.path.join(self.path, '{}-{}.pickle'.format(self._namespace_hash(key[0]), hashlib.sha1(repr(key)).hexdigest()))
+
+    def _disk_get(self, key):
+        filename = self._filename(key)
+        try:
+            if time.time() - os.path.getmtime(filename) > self.ttl:
+                return False, None
+            with open(filename, 'rb') as f:
+                unpickler = cPickle.Unpickler(f)
+                unpickler.persistent_load = _persistent_load
+                return True, unpickler.load()
+        except (IOError, OSError, EOFError, cPickle.UnpicklingError):
+            return False, None
+
+    def _disk_set(self, key, value):
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        filename = self._filename(key)
+        tmp = '{}.{}.tmp'.format(filename, os.getpid())
+        try:
+            with open(tmp, 'wb') as f:
+                pickler = cPickle.Pickler(f, cPickle.HIGHEST_PROTOCOL)
+                pickler.persistent_id = _persistent_id
+                pickler.dump(value)
+            os.rename(tmp, filename)
+        except (cPickle.PicklingError, TypeError):
+            # Not everything boto returns can be pickled, keep it in memory only.
+            os.unlink(tmp)
+
+
+class Cached(object):
+    """Proxy for a backend that caches read calls.
+
+    reads and writes map method names to the cache namespace they use. Calls
+    to reads are answered from the cache when possible, calls to writes drop
+    every entry in their namespace. Use uncached to get at the wrapped
+    backend when polling for changes.
+    """
+
+    def __init__(self, conn, cache, reads, writes):
+        self.uncached = conn
+        self._cache = cache
+        self._reads = reads
+        self._writes = writes
+
+    def __getattr__(self, name):
+        attr = getattr(self.uncached, name)
+        if name in self._reads:
+            namespace = self._reads[name]
+            @functools.wraps(attr)
+            def wrapper(*args, **kwargs):
+                key = (namespace, name, args, tuple(sorted(kwargs.items())))
+                found, value = self._cache.get(key)
+                if not found:
+                    value = attr(*args, **kwargs)
+                    self._cache.set(key, value)
+                return value
+            return wrapper
+        if name in self._writes:
+            namespace = self._writes[name]
+            @functools.wraps(attr)
+            def wrapper(*args, **kwargs):
+                try:
+                    return attr(*args, **kwargs)
+                finally:
+                    self._cache.invalidate(namespace)
+            return wrapper
+        return attr
@@ -0,0 +1,96 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Canonical serialization of templates for hashing.
+
+Template hashes end up in S3 keys and in the TemplateURL of every parent
+stack, so a hash change ripples all the way up to the region stacks. The
+canonical form only depends on what a template means to CloudFormation, not
+on how it was written out:
+
+* object keys are sorted, and there is no insignificant whitespace;
+* str and unicode strings encode the same way;
+* numbers are written as strings (CloudFormation doesn't tell 1, 1.0 and "1"
+  apart), integral floats as integers and others in their shortest form;
+* objects from troposphere are encoded through their JSONrepr().
+
+So any two templates that are equal after json.loads() and those rules hash
+the same, whatever key order, float formatting or encoder produced them.
+"""
+
+import hashlib
+import json
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return json.dumps(repr(value) if isinstance(value, float) else str(value))
+
+
+def iterencode(obj):
+    """Yield the canonical encoding of obj in chunks."""
+    if hasattr(obj, 'JSONrepr'):
+        obj = obj.JSONrepr()
+    if obj is None:
+        yield 'null'
+    elif obj is True:
+        yield 'true'
+    elif obj is False:
+        yield 'false'
+    elif isinstance(obj, basestring):
+        yield json.dumps(obj)
+    elif isinstance(obj, (int, long, float)):
+        yield _number(obj)
+    elif isinstance(obj, dict):
+        yield '{'
+        for i, key in enumerate(sorted(obj)):
+            if i:
+                yield ','
+            yield json.dumps(key)
+            yield ':'
+            for chunk in iterencode(obj[key]):
+                yield chunk
+        yield '}'
+    elif isinstance(obj, (list, tuple)):
+        yield '['
+        for i, value in enumerate(obj):
+            if i:
+                yield ','
+            for chunk in iterencode(value):
+                yield chunk
+        yield ']'
+    else:
+        raise TypeError('{!r} is not JSON serializable'.format(obj))
+
+
+def dumps(obj):
+    """Return the canonical encoding of obj as a string."""
+    return ''.join(iterencode(obj))
+
+
+def sha1(obj):
+    """Return the hex SHA1 of the canonical encoding of obj.
+
+    The digest is updated as the encoding is produced, the full canonical
+    string is never built.
+    """
+    digest = hashlib.sha1()
+    for chunk in iterencode(obj):
+        digest.update(chunk)
+    return digest.hexdigest()
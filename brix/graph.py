@@ -0,0 +1,184 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Resource dependency graphs of rendered templates.
+
+CloudFormation creates resources in parallel unless a Ref, GetAtt or
+DependsOn orders them, so the longest chain in this graph bounds how fast a
+stack can deploy.
+
+Nested stacks are expanded in place. Their resources are named
+"Parent/Child", the resources inside start once everything the stack
+resource depends on is done, and the stack resource itself is done when all
+of them are.
+"""
+
+import collections
+import re
+
+
+NESTED_KEY_RE = re.compile(r'templates/(\w+?)-[0-9a-f]{40}\.json')
+
+# origin is set on edges that were copied from a nested stack resource onto
+# the resources inside it, so they go away along with the original.
+Edge = collections.namedtuple('Edge', ['source', 'target', 'kind', 'origin'])
+Edge.__new__.__defaults__ = (None,)
+
+
+def references(value, resources):
+    """Yield (kind, logical_id) for each resource referenced in a value."""
+    if isinstance(value, dict):
+        for key, inner in value.iteritems():
+            if key == 'Ref' and inner in resources:
+                yield 'ref', inner
+            elif key == 'Fn::GetAtt' and isinstance(inner, list) and inner and inner[0] in resources:
+                yield 'getatt', inner[0]
+            else:
+                for ref in references(inner, resources):
+                    yield ref
+    elif isinstance(value, list):
+        for inner in value:
+            for ref in references(inner, resources):
+                yield ref
+
+
+def nested_template(resource):
+    """Name of the local template a nested stack resource uses, if any."""
+    url = resource.get('Properties', {}).get('TemplateURL')
+    match = NESTED_KEY_RE.search(repr(url))
+    return match and match.group(1)
+
+
+class Graph(object):
+    def __init__(self):
+        self.nodes = collections.OrderedDict()
+        self.edges = []
+
+    @classmethod
+    def from_template(cls, body, load_template):
+        """Build a graph from a parsed template.
+
+        load_template is called with a template name to get the parsed body
+        of a nested stack's template, or None if it isn't known.
+        """
+        graph = cls()
+        graph._add_template(body, '', [], load_template)
+        return graph
+
+    def _add_template(self, body, prefix, outer_deps, load_template):
+        resources = body.get('Resources', {})
+        names = {}
+        for logical_id, resource in sorted(resources.iteritems()):
+            names[logical_id] = prefix + logical_id
+            self.nodes[prefix + logical_id] = resource['Type']
+        has_deps = set()
+        for logical_id, resource in sorted(resources.iteritems()):
+            node = names[logical_id]
+            seen = set()
+            for kind, target in references(resource.get('Properties', {}), resources):
+                if (kind, target) not in seen:
+                    seen.add((kind, target))
+                    self.edges.append(Edge(node, names[target], kind))
+            depends_on = resource.get('DependsOn', [])
+            if not isinstance(depends_on, list):
+                depends_on = [depends_on]
+            for target in depends_on:
+                self.edges.append(Edge(node, names[target], 'dependson'))
+            if seen or depends_on:
+                has_deps.add(node)
+        for node in names.itervalues():
+            if node not in has_deps:
+                for dep in outer_deps:
+                    self.edges.append(Edge(node, dep.target, 'nested', dep.origin or dep))
+        for logical_id, resource in sorted(resources.iteritems()):
+            child = nested_template(resource) if resource['Type'] == 'AWS::CloudFormation::Stack' else None
+            child_body = child and load_template(child)
+            if child_body:
+                node = names[logical_id]
+                deps = [e for e in self.edges if e.source == node]
+                child_prefix = node + '/'
+                self._add_template(child_body, child_prefix, deps, load_template)
+                for child_node in self.nodes:
+                    if child_node.startswith(child_prefix):
+                        self.edges.append(Edge(node, child_node, 'nested'))
+
+    def dependencies(self, exclude=None):
+        deps = collections.defaultdict(set)
+        for edge in self.edges:
+            if exclude is None or (edge != exclude and edge.origin != exclude):
+                deps[edge.source].add(edge.target)
+        return deps
+
+    def longest_chain(self, exclude=None):
+        """Return the longest chain of resources, first to be created first."""
+        deps = self.dependencies(exclude)
+        memo = {}
+        def chain(node):
+            if node not in memo:
+                memo[node] = None # Cycle guard, CloudFormation rejects those anyway.
+                best = max([chain(dep) for dep in deps[node] if memo.get(dep, ()) is not None] + [[]], key=len)
+                memo[node] = best + [node]
+            return memo[node]
+        return max([chain(node) for node in self.nodes] + [[]], key=len)
+
+    def reachable(self, source, target, exclude=None):
+        deps = self.dependencies(exclude)
+        pending = list(deps[source])
+        seen = set()
+        while pending:
+            node = pending.pop()
+            if node == target:
+                return True
+            if node not in seen:
+                seen.add(node)
+                pending.extend(deps[node])
+        return False
+
+    def depends_on_report(self):
+        """Classify every DependsOn edge.
+
+        Returns a list of (edge, implied, saving) where implied means the
+        ordering already follows from other references, and saving is how many
+        steps the longest chain would shrink without the edge.
+        """
+        longest = len(self.longest_chain())
+        report = []
+        for edge in self.edges:
+            if edge.kind != 'dependson':
+                continue
+            implied = self.reachable(edge.source, edge.target, exclude=edge)
+            saving = 0 if implied else longest - len(self.longest_chain(exclude=edge))
+            report.append((edge, implied, saving))
+        return report
+
+    def to_dot(self, name='template'):
+        styles = {
+            'ref': '',
+            'getatt': '',
+            'dependson': ' [style=dashed]',
+            'nested': ' [style=dotted]',
+        }
+        implied = set(edge for edge, is_implied, _ in self.depends_on_report() if is_implied)
+        lines = ['digraph "{}" {{'.format(name), '    rankdir=BT;']
+        for node, resource_type in self.nodes.iteritems():
+            lines.append('    "{}" [label="{}\\n{}"];'.format(node, node, resource_type))
+        for edge in self.edges:
+            style = ' [style=dashed, color=red]' if edge in implied else styles[edge.kind]
+            lines.append('    "{}" -> "{}"{};'.format(edge.source, edge.target, style))
+        lines.append('}')
+        return '\n'.join(lines)
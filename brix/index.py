@@ -0,0 +1,120 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Local index of physical resource IDs across regions.
+
+Stack resources are kept in SQLite along with the last updated time of the
+stack they came from, so a refresh only fetches stacks that changed since.
+"""
+
+import collections
+import os
+import sqlite3
+
+from . import cache
+
+
+INDEX_PATH = os.path.join(cache.CACHE_DIR, 'index.sqlite')
+
+Match = collections.namedtuple('Match', ['physical_id', 'region', 'stack_path', 'logical_id', 'resource_type'])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stacks (
+    region TEXT NOT NULL,
+    stack_name TEXT NOT NULL,
+    stack_id TEXT,
+    updated TEXT,
+    PRIMARY KEY (region, stack_name)
+);
+CREATE TABLE IF NOT EXISTS resources (
+    physical_id TEXT NOT NULL,
+    region TEXT NOT NULL,
+    stack_name TEXT NOT NULL,
+    logical_id TEXT NOT NULL,
+    resource_type TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS resources_physical_id ON resources (physical_id);
+CREATE INDEX IF NOT EXISTS resources_stack ON resources (region, stack_name);
+"""
+
+
+def stack_version(stack):
+    """What changes when a stack's resources might have."""
+    return str(stack.last_updated_time or stack.creation_time)
+
+
+class ResourceIndex(object):
+    def __init__(self, path=INDEX_PATH):
+        if path != ':memory:' and not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def versions(self, region):
+        """Return stack name to stored version for a region."""
+        return dict(self.db.execute('SELECT stack_name, updated FROM stacks WHERE region = ?', (region,)))
+
+    def update(self, region, stack, resources):
+        """Replace the indexed resources of a stack."""
+        with self.db:
+            self._delete(region, stack.stack_name)
+            self.db.execute('INSERT INTO stacks VALUES (?, ?, ?, ?)', (region, stack.stack_name, stack.stack_id, stack_version(stack)))
+            self.db.executemany('INSERT INTO resources VALUES (?, ?, ?, ?, ?)', [
+                (res.physical_resource_id, region, stack.stack_name, res.logical_resource_id, res.resource_type)
+                for res in resources if res.physical_resource_id
+            ])
+
+    def remove(self, region, stack_name):
+        with self.db:
+            self._delete(region, stack_name)
+
+    def _delete(self, region, stack_name):
+        self.db.execute('DELETE FROM stacks WHERE region = ? AND stack_name = ?', (region, stack_name))
+        self.db.execute('DELETE FROM resources WHERE region = ? AND stack_name = ?', (region, stack_name))
+
+    def empty(self):
+        return not self.db.execute('SELECT 1 FROM stacks LIMIT 1').fetchone()
+
+    def find(self, prefix):
+        """Return Matches for physical IDs starting with prefix."""
+        # A range scan so the index on physical_id is used, LIKE wouldn't.
+        rows = self.db.execute(
+            'SELECT physical_id, region, stack_name, logical_id, resource_type FROM resources '
+            'WHERE physical_id >= ? AND physical_id < ? ORDER BY physical_id, region',
+            (prefix, prefix + u'\U0010ffff'),
+        )
+        return [Match(physical_id, region, self._stack_path(region, stack_name), logical_id, resource_type)
+                for physical_id, region, stack_name, logical_id, resource_type in rows.fetchall()]
+
+    def _stack_path(self, region, stack_name):
+        """Return "Root/Logical/..." for a nested stack, following its parents."""
+        path = [stack_name]
+        seen = set(path)
+        while True:
+            parent = self.db.execute(
+                'SELECT r.stack_name, r.logical_id FROM resources r, stacks s '
+                'WHERE s.region = ? AND s.stack_name = ? AND r.region = s.region '
+                'AND r.resource_type = ? AND r.physical_id IN (s.stack_id, s.stack_name)',
+                (region, path[0], 'AWS::CloudFormation::Stack'),
+            ).fetchone()
+            if not parent or parent[0] in seen:
+                break
+            path[0] = parent[1]
+            path.insert(0, parent[0])
+            seen.add(parent[0])
+        return '/'.join(path)
@@ -0,0 +1,197 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Multi-stack deployment manifests.
+
+A manifest is a JSON file listing stacks to deploy:
+
+    {
+        "region": "us-west-1",
+        "stacks": [
+            {"name": "balanced-region", "template": "balanced_region"},
+            {
+                "name": "balanced-api-test",
+                "template": "balanced_api",
+                "params": {"Env": "test", "MaxCapacity": "4"},
+                "depends_on": ["balanced-region"]
+            }
+        ]
+    }
+
+Each stack can override the top-level region. Stacks are identified in
+depends_on by their id, which defaults to the stack name.
+"""
+
+import collections
+import json
+import Queue
+import threading
+import time
+
+
+Deploy = collections.namedtuple('Deploy', ['stack_id', 'result', 'reason'])
+
+SUCCESS_STATUSES = set([
+    'CREATE_COMPLETE',
+    'UPDATE_COMPLETE',
+    'UPDATE_COMPLETE_CLEANUP_IN_PROGRESS',
+])
+
+
+class Manifest(object):
+    def __init__(self, stacks, region=None):
+        self.stacks = []
+        for data in stacks:
+            if 'name' not in data or 'template' not in data:
+                raise ValueError('Manifest stacks need a name and template: {!r}'.format(data))
+            stack = {
+                'id': data.get('id', data['name']),
+                'name': data['name'],
+                'template': data['template'],
+                'region': data.get('region', region),
+                'params': {k: str(v) for k, v in data.get('params', {}).iteritems()},
+                'depends_on': list(data.get('depends_on', [])),
+            }
+            if not stack['region']:
+                raise ValueError('No region given for stack {}'.format(stack['id']))
+            self.stacks.append(stack)
+        self._check()
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data.get('stacks', []), data.get('region'))
+
+    def _check(self):
+        """Make sure ids are unique, dependencies exist and there are no cycles."""
+        by_id = {}
+        for stack in self.stacks:
+            if stack['id'] in by_id:
+                raise ValueError('Duplicate stack {} in manifest'.format(stack['id']))
+            by_id[stack['id']] = stack
+        for stack in self.stacks:
+            for dep in stack['depends_on']:
+                if dep not in by_id:
+                    raise ValueError('Stack {} depends on unknown stack {}'.format(stack['id'], dep))
+        visiting, visited = set(), set()
+        def visit(stack_id):
+            if stack_id in visited:
+                return
+            if stack_id in visiting:
+                raise ValueError('Dependency cycle involving stack {}'.format(stack_id))
+            visiting.add(stack_id)
+            for dep in by_id[stack_id]['depends_on']:
+                visit(dep)
+            visiting.remove(stack_id)
+            visited.add(stack_id)
+        for stack in self.stacks:
+            visit(stack['id'])
+
+
+class Deployer(object):
+    """Run stack creates and updates from a manifest in dependency order.
+
+    Independent stacks are deployed concurrently, at most concurrency at a
+    time. Each worker gets its own Brix copy for its region since boto
+    connections must not be shared between threads.
+    """
+
+    def __init__(self, app, manifest, concurrency=4, poll_interval=10, progress=None):
+        self.app = app
+        self.manifest = manifest
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.progress = progress
+        self.results = {}
+        self._queue = Queue.Queue()
+
+    def run(self):
+        pending = {stack['id']: stack for stack in self.manifest.stacks}
+        running = set()
+        while pending or running:
+            for stack_id, stack in sorted(pending.items()):
+                failed_deps = [d for d in stack['depends_on'] if d in self.results and self.results[d].result not in ('ok', 'unchanged')]
+                if failed_deps:
+                    del pending[stack_id]
+                    self._finish(stack_id, 'skipped', 'dependency {} failed'.format(failed_deps[0]))
+            ready = [s for _, s in sorted(pending.items()) if all(d in self.results for d in s['depends_on'])]
+            for stack in ready[:self.concurrency - len(running)]:
+                del pending[stack['id']]
+                running.add(stack['id'])
+                thread = threading.Thread(target=self._worker, args=(stack,))
+                thread.daemon = True
+                thread.start()
+            if not running:
+                continue
+            # A timeout keeps the wait interruptible by Ctrl-C on Python 2.
+            try:
+                stack_id, result, reason = self._queue.get(timeout=1)
+            except Queue.Empty:
+                continue
+            running.discard(stack_id)
+            self._finish(stack_id, result, reason)
+        return self.results
+
+    def _finish(self, stack_id, result, reason=None):
+        self.results[stack_id] = Deploy(stack_id, result, reason)
+        if self.progress:
+            self.progress(self.results[stack_id])
+
+    def _worker(self, stack):
+        try:
+            app = self.app.for_region(stack['region'])
+            if self._is_noop(app, stack):
+                self._queue.put((stack['id'], 'unchanged', None))
+                return
+            app.update(stack['name'], stack['template'], dict(stack['params']))
+            status = self._wait(app, stack['name'])
+            if status is None:
+                self._queue.put((stack['id'], 'failed', 'stack {} no longer exists'.format(stack['name'])))
+            else:
+                self._queue.put((stack['id'], 'ok' if status in SUCCESS_STATUSES else 'failed', status))
+        except Exception, e:
+            self._queue.put((stack['id'], 'failed', str(e)))
+
+    def _is_noop(self, app, stack):
+        """Check if a stack already runs this template with these parameters."""
+        existing = app._describe_stack(stack['name'])
+        if existing is None or existing.stack_status not in SUCCESS_STATUSES:
+            return False
+        current = {p.key: p.value for p in existing.parameters}
+        wanted = dict(current)
+        wanted.update(stack['params'])
+        if current != wanted:
+            return False
+        body = app.backend.get_template(stack['name'])
+        return json.loads(body) == json.loads(app._regional(app._get_template(stack['template']))['json'])
+
+    def _wait(self, app, stack_name):
+        """Poll a stack until it leaves the IN_PROGRESS states.
+
+        Returns None if the stack disappears, e.g. a failed create rolled back
+        and was deleted.
+        """
+        while True:
+            time.sleep(self.poll_interval)
+            stack = app._describe_stack(stack_name, cached=False)
+            if stack is None:
+                return None
+            status = stack.stack_status
+            if status in SUCCESS_STATUSES or not status.endswith('_IN_PROGRESS'):
+                return status
@@ -0,0 +1,97 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Render-time lookup of outputs from other stacks.
+
+Templates use templates.base.StackOutput to refer to an output of a stack
+they don't own. Rendering happens in two passes: the first one records every
+lookup, then all of them are fetched at once with at most one
+describe_stacks listing per region (regions in parallel), then templates are
+rendered again with real values. Values are cached on disk for a short TTL,
+so usually the second pass isn't needed. Templates rendered with outputs
+count as stale once the TTL is over, see Brix.refresh.
+"""
+
+import collections
+import time
+
+from . import aws, cache
+
+
+class OutputResolver(object):
+    # How long fetched output values are reused, in seconds.
+    TTL = 300
+
+    def __init__(self, app, ttl=TTL, path=cache.CACHE_DIR):
+        self.app = app
+        self.ttl = ttl
+        self.cache = cache.ResponseCache(ttl, path)
+        self.created = time.time()
+        self.used = False
+        self.pending = set()
+        self.errors = {}
+        self.final = False
+
+    def expired(self):
+        """True if templates used output values that are now too old."""
+        return self.used and time.time() - self.created > self.ttl
+
+    def _key(self, region, stack_name, key):
+        return (aws.namespace('cloudformation', region), 'output', stack_name, key)
+
+    def __call__(self, stack_name, key, region):
+        # Rendered templates are synced to every region, so there is no
+        # default region to fall back to.
+        if not region:
+            raise ValueError('No region given for output {} of stack {}'.format(key, stack_name))
+        self.used = True
+        found, value = self.cache.get(self._key(region, stack_name, key))
+        if found:
+            return value
+        if self.final:
+            raise ValueError(self.errors.get((region, stack_name), 'Stack {} in {} has no output {}'.format(stack_name, region, key)))
+        self.pending.add((region, stack_name, key))
+        # Placeholder for the first pass.
+        return 'StackOutput:{}:{}:{}'.format(region, stack_name, key)
+
+    def fetch(self):
+        """Look up all pending outputs and switch to the final pass."""
+        by_region = collections.defaultdict(set)
+        for region, stack_name, key in self.pending:
+            by_region[region].add(stack_name)
+        def fetch_region(app):
+            stack_names = by_region[app.region]
+            try:
+                if len(stack_names) == 1:
+                    stacks = app.backend.describe_stacks(next(iter(stack_names)))
+                else:
+                    # One listing returns every stack in the region.
+                    stacks = list(app._cfn_iterate(lambda t: app.backend.describe_stacks(next_token=t)))
+            except Exception, e:
+                return {stack_name: str(e) for stack_name in stack_names}
+            for stack in stacks:
+                if stack.stack_name in stack_names:
+                    for output in stack.outputs:
+                        self.cache.set(self._key(app.region, stack.stack_name, output.key), output.value)
+            return {}
+        if by_region:
+            for region, errors in self.app._map_regions(fetch_region, by_region.keys()).iteritems():
+                for stack_name, error in errors.iteritems():
+                    self.errors[region, stack_name] = error
+        self.pending.clear()
+        self.final = True
@@ -0,0 +1,100 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Region-specialized templates.
+
+Templates are written to work in any region, so region lookups like
+FindInMap keyed by Ref('AWS::Region') and Joins with it are left for
+CloudFormation to evaluate. When rendering per region, brix evaluates those itself and drops
+mappings nothing uses anymore, which makes for smaller, simpler bodies.
+"""
+
+import json
+import re
+
+from . import canonical
+
+
+TEMPLATE_KEY_RE = re.compile(r'templates/[\w.-]+?-[0-9a-f]{40}\.json')
+
+
+def _literal(value):
+    return isinstance(value, basestring)
+
+
+def specialize(body, region, key_map={}):
+    """Return a copy of a parsed template with region lookups evaluated.
+
+    key_map maps generic nested template keys to their regional versions.
+    """
+    mappings = body.get('Mappings', {})
+    def evaluate(value):
+        if isinstance(value, list):
+            return [evaluate(v) for v in value]
+        if _literal(value):
+            return TEMPLATE_KEY_RE.sub(lambda m: key_map.get(m.group(0), m.group(0)), value)
+        if not isinstance(value, dict):
+            return value
+        value = {k: evaluate(v) for k, v in value.iteritems()}
+        if len(value) != 1:
+            return value
+        fn, args = value.items()[0]
+        if fn == 'Ref' and args == 'AWS::Region':
+            return region
+        if fn == 'Fn::FindInMap' and all(_literal(a) for a in args):
+            try:
+                return mappings[args[0]][args[1]][args[2]]
+            except KeyError:
+                return value
+        if fn == 'Fn::Join' and _literal(args[0]):
+            parts = []
+            for part in args[1]:
+                if _literal(part) and parts and _literal(parts[-1]):
+                    parts[-1] += args[0] + part
+                else:
+                    parts.append(part)
+            if len(parts) == 1 and _literal(parts[0]):
+                # Run the result through again for nested template keys.
+                return evaluate(parts[0])
+            return {fn: [args[0], parts]}
+        return value
+    result = {k: evaluate(v) for k, v in body.iteritems() if k != 'Mappings'}
+    used = set(args[0] for args in _find_in_maps(result))
+    remaining = {name: mapping for name, mapping in mappings.iteritems() if name in used}
+    if remaining:
+        result['Mappings'] = remaining
+    return result
+
+
+def _find_in_maps(value):
+    if isinstance(value, dict):
+        for k, v in value.iteritems():
+            if k == 'Fn::FindInMap':
+                yield v
+            for found in _find_in_maps(v):
+                yield found
+    elif isinstance(value, list):
+        for v in value:
+            for found in _find_in_maps(v):
+                yield found
+
+
+def render(body, region, key_map={}):
+    """Specialize a parsed template for a region, returns (json, sha1)."""
+    result = specialize(body, region, key_map)
+    return json.dumps(result, indent=4, sort_keys=True, separators=(',', ': ')), canonical.sha1(result)
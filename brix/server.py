@@ -0,0 +1,145 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Resident brix daemon.
+
+`brix serve` keeps Brix objects in memory and answers requests over a Unix
+socket, so editor integrations and hooks don't pay for Python startup and a
+full template render on every call. Requests carry the client's options, and
+there is one Brix object per region, backend and cache TTL asked for. The wire
+format is one JSON object per line in each direction.
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import socket
+import SocketServer
+import StringIO
+import sys
+
+from . import aws
+
+
+# Commands that only need rendered templates (and maybe a read from AWS), so
+# it is safe to answer them from a long-lived process.
+COMMANDS = ['validate', 'show', 'diff', 'size']
+
+
+class BrixRequestHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                reply = self.server.dispatch(json.loads(line))
+            except Exception, e:
+                reply = {'status': 1, 'stdout': '', 'stderr': 'brix serve: {}\n'.format(e)}
+            self.wfile.write(json.dumps(reply) + '\n')
+            self.wfile.flush()
+
+
+class BrixServer(SocketServer.UnixStreamServer):
+    """Unix socket server dispatching CLI arguments to cached Brix objects.
+
+    Requests are handled one at a time. Rendering isn't thread-safe (see the
+    Stack.TEMPLATES hack in templates/base.py) and it's fast once warm anyway.
+    """
+
+    def __init__(self, path, app_factory, run):
+        self.path = path
+        self.app_factory = app_factory
+        self.run = run
+        self.apps = {}
+        if os.path.exists(path):
+            os.unlink(path)
+        SocketServer.UnixStreamServer.__init__(self, path, BrixRequestHandler)
+
+    def app(self, region, backend, cache_ttl):
+        key = (region, backend, cache_ttl)
+        if key not in self.apps:
+            self.apps[key] = self.app_factory(region, backend, cache_ttl)
+        app = self.apps[key]
+        # AWS responses are only cached for one request.
+        app.refresh()
+        return app
+
+    def dispatch(self, args):
+        command = next((c for c in COMMANDS if args.get(c)), None)
+        if not command:
+            raise ValueError('unsupported command')
+        stdout, stderr = StringIO.StringIO(), StringIO.StringIO()
+        old_stdout, old_stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = stdout, stderr
+        status = 0
+        # Requests are handled one at a time, so the change in the shared
+        # counters is what this one did.
+        before = (aws.STATS.calls, aws.STATS.retries, aws.STATS.throttled)
+        try:
+            self.run(self.app(args['--region'], args['--backend'], int(args['--cache-ttl'])), args)
+        except SystemExit, e:
+            status = e.code or 0
+        finally:
+            if args.get('--stats'):
+                stats = aws.Stats()
+                stats.add(aws.STATS.calls - before[0], aws.STATS.retries - before[1], aws.STATS.throttled - before[2])
+                print(stats, file=sys.stderr)
+            sys.stdout, sys.stderr = old_stdout, old_stderr
+        return {'status': status, 'stdout': stdout.getvalue(), 'stderr': stderr.getvalue()}
+
+    def server_close(self):
+        SocketServer.UnixStreamServer.server_close(self)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def serve(path, app_factory, run):
+    """Run the daemon until interrupted."""
+    server = BrixServer(path, app_factory, run)
+    print('Listening on {}'.format(path))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def forward(path, args):
+    """Send a request to a running daemon.
+
+    Returns the reply dict, or None if there is no daemon listening on path.
+    """
+    if not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except socket.error:
+        return None
+    try:
+        f = sock.makefile('rw')
+        f.write(json.dumps(args) + '\n')
+        f.flush()
+        line = f.readline()
+    finally:
+        sock.close()
+    if not line:
+        return None
+    return json.loads(line)
@@ -0,0 +1,328 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""CloudFormation template limits and automatic nested stack splitting.
+
+A template that sets AUTO_SPLIT and gets near a limit is rewritten into a
+parent holding only its parameters, conditions and outputs, plus generated
+child templates with the resources. Resources go to children in dependency
+order, so a child only ever needs values from children before it and the
+parent's parameters. Those are passed as child parameters; a Ref to another
+resource keeps its name, a GetAtt becomes a Ref to a parameter named after
+the resource and attribute. Values always cross over as String parameters.
+"""
+
+import json
+import re
+
+from . import canonical
+
+
+# Hard limits, body size is for templates passed by S3 URL.
+LIMITS = {
+    'resources': 200,
+    'parameters': 60,
+    'outputs': 60,
+    'bytes': 460800,
+}
+
+# Warn when a template is past this fraction of a limit, and split there if
+# it allows it.
+WARN_FRACTION = 0.8
+
+# Generated children are kept well below the limits.
+CHILD_FRACTION = 0.5
+
+
+def usage(body, size):
+    """Return how much of each limit a parsed template of size bytes uses."""
+    return {
+        'resources': len(body.get('Resources', {})),
+        'parameters': len(body.get('Parameters', {})),
+        'outputs': len(body.get('Outputs', {})),
+        'bytes': size,
+    }
+
+
+def warnings(body, size):
+    """Return a message for each limit the template is close to or over."""
+    messages = []
+    for limit, used in sorted(usage(body, size).iteritems()):
+        if used >= LIMITS[limit] * WARN_FRACTION:
+            messages.append('{} {} of {} allowed'.format(used, limit, LIMITS[limit]))
+    return messages
+
+
+def dumps(body):
+    """Serialize a generated template the way troposphere does."""
+    return json.dumps(body, indent=4, sort_keys=True, separators=(',', ': '))
+
+
+def _walk(value):
+    """Yield (kind, name, attribute) for every reference in a value.
+
+    kind is 'ref', 'getatt', 'condition' or 'mapping'.
+    """
+    if isinstance(value, dict):
+        for key, inner in value.iteritems():
+            if key == 'Ref' and isinstance(inner, basestring):
+                yield 'ref', inner, None
+            elif key == 'Fn::GetAtt' and isinstance(inner, list) and len(inner) == 2:
+                yield 'getatt', inner[0], inner[1]
+            elif key == 'Fn::FindInMap' and isinstance(inner, list) and inner:
+                yield 'mapping', inner[0], None
+            elif key == 'Fn::If' and isinstance(inner, list) and inner:
+                yield 'condition', inner[0], None
+            elif key == 'Condition' and isinstance(inner, basestring):
+                yield 'condition', inner, None
+            for found in _walk(inner):
+                yield found
+    elif isinstance(value, list):
+        for inner in value:
+            for found in _walk(inner):
+                yield found
+
+
+def _depends_on(resource):
+    depends_on = resource.get('DependsOn', [])
+    return depends_on if isinstance(depends_on, list) else [depends_on]
+
+
+def _input_name(target, attribute):
+    """Name of the output and parameter carrying a value between stacks."""
+    if attribute is None:
+        return target
+    return target + re.sub(r'[^A-Za-z0-9]', '', attribute)
+
+
+class Splitter(object):
+    """Partition the resources of a parsed template into child templates."""
+
+    def __init__(self, name, body):
+        self.name = name
+        self.body = body
+        self.resources = body.get('Resources', {})
+        self.parameters = body.get('Parameters', {})
+        self.conditions = body.get('Conditions', {})
+
+    def split(self):
+        """Return (parent body, [(child name, child body), ...])."""
+        chunks = self._partition()
+        location = {}
+        for i, chunk in enumerate(chunks):
+            for logical_id in chunk:
+                location[logical_id] = i
+        # Values each chunk has to export, as (target, attribute).
+        exports = [set() for _ in chunks]
+        imports = []
+        for i, chunk in enumerate(chunks):
+            needed = set()
+            for logical_id in chunk:
+                for kind, target, attribute in _walk(self.resources[logical_id]):
+                    if kind in ('ref', 'getatt') and target in location and location[target] != i:
+                        needed.add((target, attribute))
+                        exports[location[target]].add((target, attribute))
+            imports.append(needed)
+        for kind, target, attribute in _walk(self.body.get('Outputs', {})):
+            if kind in ('ref', 'getatt') and target in location:
+                exports[location[target]].add((target, attribute))
+
+        children = []
+        parent_resources = {}
+        for i, chunk in enumerate(chunks):
+            child_name = '{}_split{}'.format(self.name, i + 1)
+            child = self._child(chunk, location, i, imports[i], exports[i])
+            children.append((child_name, child))
+            parent_resources[self._stack_id(i)] = self._stack_resource(child_name, child, chunk, location, i, imports[i])
+
+        parent = dict((k, v) for k, v in self.body.iteritems() if k not in ('Resources', 'Outputs'))
+        parent['Resources'] = parent_resources
+        if 'Outputs' in self.body:
+            parent['Outputs'] = self._rewrite_outputs(self.body['Outputs'], location)
+        return parent, children
+
+    def _partition(self):
+        """Cut the resources, in dependency order, into chunks that fit."""
+        max_resources = int(LIMITS['resources'] * CHILD_FRACTION)
+        max_parameters = int(LIMITS['parameters'] * CHILD_FRACTION)
+        max_bytes = int(LIMITS['bytes'] * CHILD_FRACTION)
+        chunks = []
+        chunk, inputs, size = [], set(), 0
+        for logical_id in self._ordered():
+            resource_inputs = self._inputs(logical_id)
+            resource_size = len(dumps(self.resources[logical_id]))
+            new_inputs = set(i for i in inputs | resource_inputs if i[0] not in chunk and i[0] != logical_id)
+            if chunk and (len(chunk) >= max_resources or len(new_inputs) > max_parameters or size + resource_size > max_bytes):
+                chunks.append(chunk)
+                chunk, inputs, size = [], set(), 0
+                new_inputs = resource_inputs
+            chunk.append(logical_id)
+            inputs = new_inputs
+            size += resource_size
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def _ordered(self):
+        """Resource IDs with everything a resource needs before it."""
+        order = []
+        seen = set()
+        def visit(logical_id):
+            if logical_id in seen:
+                return
+            seen.add(logical_id)
+            resource = self.resources[logical_id]
+            deps = [t for k, t, _ in _walk(resource) if k in ('ref', 'getatt') and t in self.resources]
+            for dep in sorted(set(deps + _depends_on(resource))):
+                if dep in self.resources:
+                    visit(dep)
+            order.append(logical_id)
+        for logical_id in sorted(self.resources):
+            visit(logical_id)
+        return order
+
+    def _conditions(self, value):
+        """Names of conditions a value uses, including through other conditions."""
+        found = set()
+        pending = [name for kind, name, _ in _walk(value) if kind == 'condition']
+        while pending:
+            name = pending.pop()
+            if name in self.conditions and name not in found:
+                found.add(name)
+                pending.extend(n for kind, n, _ in _walk(self.conditions[name]) if kind == 'condition')
+        return found
+
+    def _inputs(self, logical_id):
+        """Everything a resource needs passed in, as (name, attribute)."""
+        resource = self.resources[logical_id]
+        inputs = set()
+        values = [resource] + [self.conditions[c] for c in self._conditions(resource)]
+        for kind, target, attribute in _walk(values):
+            if kind in ('ref', 'getatt') and (target in self.resources or target in self.parameters):
+                inputs.add((target, attribute))
+        return inputs
+
+    def _stack_id(self, i):
+        return 'Split{}'.format(i + 1)
+
+    def _output_value(self, target, attribute):
+        if attribute is None:
+            return {'Ref': target}
+        return {'Fn::GetAtt': [target, attribute]}
+
+    def _child(self, chunk, location, i, imports, exports):
+        resources = {}
+        for logical_id in chunk:
+            resource = self._rewrite(self.resources[logical_id], lambda target, attribute: {'Ref': _input_name(target, attribute)}, location, i)
+            depends_on = [d for d in _depends_on(resource) if location.get(d) == i]
+            if depends_on:
+                resource['DependsOn'] = depends_on
+            else:
+                resource.pop('DependsOn', None)
+            resources[logical_id] = resource
+        values = [resources[logical_id] for logical_id in chunk]
+        conditions = self._conditions(values)
+        parameters = {}
+        for kind, target, _ in _walk(values + [self.conditions[c] for c in conditions]):
+            if kind == 'ref' and target in self.parameters:
+                parameters[target] = self.parameters[target]
+        for target, attribute in imports:
+            parameters[_input_name(target, attribute)] = {'Type': 'String', 'Default': ''}
+        child = {
+            'AWSTemplateFormatVersion': '2010-09-09',
+            'Description': '{} part {}, generated by brix'.format(self.body.get('Description', self.name), i + 1),
+            'Resources': resources,
+        }
+        if parameters:
+            child['Parameters'] = parameters
+        if conditions:
+            child['Conditions'] = {c: self.conditions[c] for c in conditions}
+        mappings = set(name for kind, name, _ in _walk(values) if kind == 'mapping')
+        if mappings:
+            child['Mappings'] = {m: self.body['Mappings'][m] for m in mappings}
+        outputs = {}
+        for target, attribute in exports:
+            output = {'Value': self._output_value(target, attribute)}
+            if 'Condition' in self.resources[target]:
+                output['Condition'] = self.resources[target]['Condition']
+            outputs[_input_name(target, attribute)] = output
+        if outputs:
+            child['Outputs'] = outputs
+        for limit in ('resources', 'parameters', 'outputs'):
+            used = usage(child, 0)[limit]
+            if used > LIMITS[limit]:
+                raise ValueError('Unable to split {}, part {} needs {} {}'.format(self.name, i + 1, used, limit))
+        return child
+
+    def _imported_value(self, target, attribute, location):
+        """How the parent refers to a value exported by a child."""
+        value = {'Fn::GetAtt': [self._stack_id(location[target]), 'Outputs.{}'.format(_input_name(target, attribute))]}
+        condition = self.resources[target].get('Condition')
+        if condition:
+            value = {'Fn::If': [condition, value, {'Ref': 'AWS::NoValue'}]}
+        return value
+
+    def _stack_resource(self, child_name, child, chunk, location, i, imports):
+        parameters = {}
+        for name in child.get('Parameters', {}):
+            if name in self.parameters:
+                parameters[name] = {'Ref': name}
+        for target, attribute in imports:
+            parameters[_input_name(target, attribute)] = self._imported_value(target, attribute, location)
+        sha1 = canonical.sha1(child)
+        resource = {
+            'Type': 'AWS::CloudFormation::Stack',
+            'Properties': {
+                'TemplateURL': {'Fn::Join': ['', [
+                    'https://balanced-cfn-',
+                    {'Ref': 'AWS::Region'},
+                    '.s3.amazonaws.com/templates/{}-{}.json'.format(child_name, sha1),
+                ]]},
+                'Parameters': parameters,
+            },
+        }
+        depends_on = set(location[target] for target, _ in imports)
+        for logical_id in chunk:
+            depends_on.update(location[d] for d in _depends_on(self.resources[logical_id]) if d in location)
+        depends_on.discard(i)
+        if depends_on:
+            resource['DependsOn'] = [self._stack_id(j) for j in sorted(depends_on)]
+        return resource
+
+    def _rewrite(self, value, replace, location, i):
+        """Copy a value, replacing references to resources outside chunk i."""
+        if isinstance(value, dict):
+            if len(value) == 1:
+                key, inner = value.items()[0]
+                if key == 'Ref' and location.get(inner, i) != i:
+                    return replace(inner, None)
+                if key == 'Fn::GetAtt' and isinstance(inner, list) and len(inner) == 2 and location.get(inner[0], i) != i:
+                    return replace(inner[0], inner[1])
+            return {k: self._rewrite(v, replace, location, i) for k, v in value.iteritems()}
+        if isinstance(value, list):
+            return [self._rewrite(v, replace, location, i) for v in value]
+        return value
+
+    def _rewrite_outputs(self, outputs, location):
+        replace = lambda target, attribute: self._imported_value(target, attribute, location)
+        return self._rewrite(outputs, replace, location, None)
+
+
+def split(name, body):
+    """Split a parsed template, see Splitter.split."""
+    return Splitter(name, body).split()
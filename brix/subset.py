@@ -0,0 +1,103 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Pick parts of a rendered template.
+
+A subset keeps the named resources plus everything they need: resources,
+parameters, conditions and mappings reached through Ref, Fn::GetAtt,
+DependsOn, Condition, Fn::If and Fn::FindInMap.
+"""
+
+import collections
+
+
+def _dependencies(value):
+    """Yield (section, name) for everything a value refers to."""
+    if isinstance(value, dict):
+        for key, inner in value.iteritems():
+            if key == 'Ref' and isinstance(inner, basestring):
+                yield 'Resources', inner
+                yield 'Parameters', inner
+            elif key == 'Fn::GetAtt' and isinstance(inner, list) and inner:
+                yield 'Resources', inner[0]
+            elif key == 'Fn::FindInMap' and isinstance(inner, list) and inner:
+                yield 'Mappings', inner[0]
+            elif key == 'Fn::If' and isinstance(inner, list) and inner:
+                yield 'Conditions', inner[0]
+            elif key == 'Condition' and isinstance(inner, basestring):
+                yield 'Conditions', inner
+            elif key == 'DependsOn':
+                for name in inner if isinstance(inner, list) else [inner]:
+                    yield 'Resources', name
+            for dep in _dependencies(inner):
+                yield dep
+    elif isinstance(value, list):
+        for inner in value:
+            for dep in _dependencies(inner):
+                yield dep
+
+
+def find_resource(body, name):
+    """Return the logical ID for a resource name.
+
+    Matches the logical ID exactly, then ignoring case, then with the
+    template method prefix removed, so "stack_ZoneB" finds "ZoneB".
+    """
+    resources = body.get('Resources', {})
+    candidates = [name, name.split('_', 1)[-1]]
+    for candidate in candidates:
+        if candidate in resources:
+            return candidate
+        for logical_id in resources:
+            if logical_id.lower() == candidate.lower():
+                return logical_id
+    raise ValueError('Unknown resource {}'.format(name))
+
+
+def subset(body, names):
+    """Return a template with only the given resources and what they need."""
+    result = collections.OrderedDict()
+    pending = [('Resources', find_resource(body, name)) for name in names]
+    while pending:
+        section, name = pending.pop()
+        if name not in body.get(section, {}) or name in result.get(section, {}):
+            continue
+        value = body[section][name]
+        result.setdefault(section, collections.OrderedDict())[name] = value
+        pending.extend(_dependencies(value))
+    # Keep sections and entries in the order of the original template.
+    return collections.OrderedDict(
+        (section, collections.OrderedDict((k, v) for k, v in body[section].iteritems() if k in result[section]))
+        for section in body if section in result
+    )
+
+
+def select(value, path):
+    """Follow a dotted path like "Resources.ZoneB.Properties.Parameters".
+
+    Numeric parts index into lists.
+    """
+    for part in path.split('.') if path else []:
+        try:
+            if isinstance(value, list):
+                value = value[int(part)]
+            else:
+                value = value[part]
+        except (KeyError, IndexError, ValueError, TypeError):
+            raise ValueError('Path {} not found at {}'.format(path, part))
+    return value
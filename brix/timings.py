@@ -0,0 +1,126 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Deployment timing analysis from stack events."""
+
+import collections
+
+
+Interval = collections.namedtuple('Interval', ['stack_name', 'logical_id', 'resource_type', 'operation', 'status', 'start', 'end'])
+
+# Statuses that end a resource operation.
+TERMINAL_SUFFIXES = ('_COMPLETE', '_FAILED')
+
+# Events this close together count as one thing starting right after the
+# other. Event timestamps only have second resolution.
+SLACK = 1.0
+
+
+def duration(interval):
+    return (interval.end - interval.start).total_seconds()
+
+
+def intervals(events):
+    """Pair up IN_PROGRESS and COMPLETE/FAILED events for each resource."""
+    by_resource = collections.defaultdict(list)
+    for event in events:
+        by_resource[event.stack_name, event.logical_resource_id].append(event)
+    results = []
+    for (stack_name, logical_id), resource_events in by_resource.iteritems():
+        start = None
+        for event in sorted(resource_events, key=lambda e: e.timestamp):
+            status = event.resource_status
+            if status.endswith('_IN_PROGRESS'):
+                # Cleanup and rollback phases extend the operation they belong to.
+                if start is None:
+                    start = event
+            elif status.endswith(TERMINAL_SUFFIXES) and start is not None:
+                results.append(Interval(
+                    stack_name=stack_name,
+                    logical_id=logical_id,
+                    resource_type=event.resource_type,
+                    operation=start.resource_status.split('_')[0],
+                    status=status,
+                    start=start.timestamp,
+                    end=event.timestamp,
+                ))
+                start = None
+    return sorted(results, key=lambda i: i.start)
+
+
+def deploys(all_intervals, stack_name):
+    """Operations on a stack itself, oldest first."""
+    return sorted((i for i in all_intervals if i.stack_name == stack_name and i.logical_id == stack_name), key=lambda i: i.start)
+
+
+def within(all_intervals, deploy):
+    """Resource intervals that happened as part of a deploy."""
+    return [i for i in all_intervals if i.start >= deploy.start and i.end <= deploy.end and i != deploy]
+
+
+def critical_path(deploy_intervals):
+    """Walk back from the last resource to finish.
+
+    Each step picks the resource that finished last before the current one
+    started, which is what was holding it up. Nested stack resources are
+    skipped since they only wrap the resources inside them.
+    """
+    candidates = [i for i in deploy_intervals if i.resource_type != 'AWS::CloudFormation::Stack']
+    if not candidates:
+        return []
+    path = [max(candidates, key=lambda i: i.end)]
+    while True:
+        current = path[-1]
+        before = [i for i in candidates if (current.start - i.end).total_seconds() >= -SLACK and i.start < current.start]
+        if not before:
+            break
+        path.append(max(before, key=lambda i: (i.end, duration(i))))
+    path.reverse()
+    return path
+
+
+def by_type(all_intervals):
+    """Aggregate durations per resource type and operation."""
+    groups = collections.defaultdict(list)
+    for interval in all_intervals:
+        groups[interval.resource_type, interval.operation].append(duration(interval))
+    results = []
+    for (resource_type, operation), durations in groups.iteritems():
+        durations.sort()
+        results.append({
+            'resource_type': resource_type,
+            'operation': operation,
+            'count': len(durations),
+            'mean': sum(durations) / len(durations),
+            'p50': durations[len(durations) // 2],
+            'max': durations[-1],
+        })
+    return sorted(results, key=lambda r: r['mean'], reverse=True)
+
+
+def gantt(deploy, deploy_intervals, width=60):
+    """Render a text chart of a deploy, one row per resource."""
+    total = max(duration(deploy), 1)
+    label_width = max([len('{}/{}'.format(i.stack_name, i.logical_id)) for i in deploy_intervals] + [0])
+    lines = []
+    for interval in sorted(deploy_intervals, key=lambda i: (i.start, i.end)):
+        offset = int((interval.start - deploy.start).total_seconds() / total * width)
+        length = max(1, int(duration(interval) / total * width))
+        label = '{}/{}'.format(interval.stack_name, interval.logical_id)
+        lines.append('{} |{}{}{}| {:.0f}s'.format(label.ljust(label_width), ' ' * offset, '#' * length, ' ' * max(0, width - offset - length), duration(interval)))
+    return lines
@@ -0,0 +1,42 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+require 'chef/handler'
+require 'json'
+
+# Write how long each resource took in the last Chef run as JSON, bootstrap.sh
+# includes it in the boot report.
+class BootTimings < Chef::Handler
+  def initialize(path)
+    @path = path
+  end
+
+  def report
+    resources = all_resources.map do |resource|
+      {
+        'resource' => resource.to_s,
+        'recipe' => "#{resource.cookbook_name}::#{resource.recipe_name}",
+        'elapsed' => resource.elapsed_time.to_f,
+        'updated' => resource.updated_by_last_action?,
+      }
+    end
+    File.open(@path, 'w') do |f|
+      f.write(JSON.generate('success' => success?, 'elapsed' => elapsed_time.to_f, 'resources' => resources))
+    end
+  end
+end
@@ -21,20 +21,95 @@
 TAG="$1"
 ENV="$2"
 ROLE="$3"
+STACK="$4"
+DATA_PATH="$5"
+EBS_MOUNTS="$6"
 
-# Set the hostname
+# Boot timing report, uploaded to S3 when this script exits. Phases are
+# recorded as start/end timestamps, the Chef report handler in
+# /etc/chef/handlers/boot_timings.rb adds per-resource timings.
+BOOT_REPORT=/var/log/boot-report.json
+CHEF_TIMINGS=/var/log/chef-timings.json
+UPTIME_AT_START="$(cut -d' ' -f1 /proc/uptime)"
+PHASES=""
+PHASE=""
+phase() {
+  local now="$(date +%s.%N)"
+  if [ -n "$PHASE" ]; then
+    PHASES="${PHASES}${PHASES:+,}{\"name\":\"$PHASE\",\"start\":$PHASE_START,\"end\":$now}"
+  fi
+  PHASE="$1"
+  PHASE_START="$now"
+}
+finish() {
+  local status="$?"
+  set +e
+  phase ""
+  cat > "$BOOT_REPORT" <<EOP
+{"stack":"$STACK","role":"$ROLE","env":"$ENV","instance_id":"$INSTANCE_ID","prebaked":$PREBAKED,"status":$status,"uptime_at_start":$UPTIME_AT_START,"phases":[$PHASES],"chef":$(cat "$CHEF_TIMINGS" 2>/dev/null || echo null)}
+EOP
+  if [ -n "$STACK" -a -n "$REGION" ]; then
+    aws s3 cp "$BOOT_REPORT" "s3://balanced-cfn-${REGION}/boot-reports/${STACK}/${INSTANCE_ID}.json" --region "$REGION"
+  fi
+  exit "$status"
+}
+PREBAKED=false
+trap finish EXIT
+
+phase metadata
 LOCAL_IPV4="$(curl http://169.254.169.254/latest/meta-data/local-ipv4)"
+INSTANCE_ID="$(curl http://169.254.169.254/latest/meta-data/instance-id)"
+AZ="$(curl http://169.254.169.254/latest/meta-data/placement/availability-zone)"
+REGION="${AZ%?}"
+
+# Set the hostname
+phase hostname
 HOSTNAME="${TAG}-${ENV}-$(echo $LOCAL_IPV4 | sed s/\\./-/g)"
 echo "$HOSTNAME" > /etc/hostname
 hostname "$HOSTNAME"
 
+# Instance store disks and EBS volumes, before Chef so recipes can put data
+# there
+if [ -n "$DATA_PATH$EBS_MOUNTS" ]; then
+  phase disks
+fi
+if [ -n "$DATA_PATH" ]; then
+  /opt/ephemeral-raid.sh "$DATA_PATH"
+fi
+# EBS volumes come as DEVICE:MOUNT_POINT pairs
+for volume in $EBS_MOUNTS; do
+  device="${volume%%:*}"
+  mount_point="${volume#*:}"
+  # Xen kernels name sdX devices xvdX
+  if [ ! -b "$device" ]; then
+    device="$(echo "$device" | sed 's/\/sd/\/xvd/')"
+  fi
+  if ! blkid "$device"; then
+    mkfs.xfs "$device"
+  fi
+  mkdir -p "$mount_point"
+  echo "UUID=$(blkid -s UUID -o value "$device") $mount_point xfs noatime,nobootwait 0 0" >> /etc/fstab
+  mount "$mount_point"
+done
+
+phase chef-config
+# Images baked for this role (see role-bake.sh) already have it converged,
+# recipes can check the prebaked attribute to skip one-time setup.
+if [ "$(cat /etc/chef/prebaked 2>/dev/null)" = "$ROLE" ]; then
+  PREBAKED=true
+fi
+
+# Drop timings left over from the image build
+rm -f "$CHEF_TIMINGS"
+
 # Write Chef first-boot JSON
 cat > /etc/chef/first-boot.json <<EOP
-{"run_list":["recipe[role-base]", "recipe[$ROLE]"]}
+{"run_list":["recipe[role-base]", "recipe[$ROLE]"], "prebaked": $PREBAKED}
 EOP
 
 # Lock the chef node name
 echo "node_name '$HOSTNAME'" >> /etc/chef/client.rb
 
 # Run Chef
+phase chef-client
 chef-client --environment "$ENV" --json-attributes /etc/chef/first-boot.json --logfile /var/log/chef-bootstrap.log
@@ -5,3 +5,6 @@ validation_client_name 'chef-validator'
 ssl_verify_mode :verify_peer
 verify_api_cert true
 ssl_ca_file '/etc/chef/cacert.pem'
+require '/etc/chef/handlers/boot_timings.rb'
+report_handlers << BootTimings.new('/var/log/chef-timings.json')
+exception_handlers << BootTimings.new('/var/log/chef-timings.json')
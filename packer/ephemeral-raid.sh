@@ -0,0 +1,65 @@
+#!/bin/bash -xe
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Assemble the instance store disks into one XFS volume mounted at $1. One
+# disk is formatted as is, several become a RAID0 array. Does nothing on
+# instance types without instance store disks.
+
+MOUNT_POINT="$1"
+METADATA=http://169.254.169.254/latest/meta-data/block-device-mapping
+
+DEVICES=""
+for name in $(curl -s "$METADATA/" | grep '^ephemeral'); do
+  device="/dev/$(curl -s "$METADATA/$name" | sed 's/^\/dev\///')"
+  # Xen kernels name sdX devices xvdX
+  if [ ! -b "$device" ]; then
+    device="$(echo "$device" | sed 's/\/sd/\/xvd/')"
+  fi
+  if [ -b "$device" ]; then
+    DEVICES="$DEVICES $device"
+  fi
+done
+if [ -z "$DEVICES" ]; then
+  exit 0
+fi
+
+# cloud-init mounts the first disk on /mnt
+for device in $DEVICES; do
+  if grep -q "^$device " /proc/mounts; then
+    umount "$device"
+  fi
+  sed -i "\|^$device\s|d" /etc/fstab
+done
+
+set -- $DEVICES
+if [ "$#" -gt 1 ]; then
+  mdadm --create /dev/md0 --run --level=0 --chunk=256 --raid-devices="$#" "$@"
+  # Persist the array so it assembles on reboot, it may come back as md127
+  # though, hence mounting by UUID below.
+  mdadm --detail --scan >> /etc/mdadm/mdadm.conf
+  update-initramfs -u
+  VOLUME=/dev/md0
+else
+  VOLUME="$1"
+fi
+
+mkfs.xfs -f "$VOLUME"
+mkdir -p "$MOUNT_POINT"
+echo "UUID=$(blkid -s UUID -o value "$VOLUME") $MOUNT_POINT xfs noatime,nobootwait 0 0" >> /etc/fstab
+mount "$MOUNT_POINT"
@@ -62,6 +62,11 @@ if [ -f /tmp/solo.rb ]; then
   sudo chmod 600 /etc/chef/solo.rb
 fi
 
+# Report handler for boot timings, see bootstrap.sh
+sudo mkdir /etc/chef/handlers
+sudo mv /tmp/boot_timings.rb /etc/chef/handlers
+sudo chown root:root /etc/chef/handlers/boot_timings.rb
+
 # Ohai hints
 sudo mkdir /etc/chef/ohai
 sudo mkdir /etc/chef/ohai/hints
@@ -73,9 +78,12 @@ sudo chmod 600 /etc/chef/ohai/hints/ec2.json
 sudo mv /tmp/bootstrap.sh /opt
 sudo chown root:root /opt/bootstrap.sh
 sudo chmod 744 /opt/bootstrap.sh
+sudo mv /tmp/ephemeral-raid.sh /opt
+sudo chown root:root /opt/ephemeral-raid.sh
+sudo chmod 744 /opt/ephemeral-raid.sh
 
 # more bootstrapping
-sudo apt-get -y install python-pip xfs xfsprogs
+sudo apt-get -y install python-pip xfs xfsprogs mdadm
 sudo pip install /tmp/aws-cfn-bootstrap-20140311.tar.gz
 sudo pip install awscli
 sudo mv /tmp/jq /usr/bin/
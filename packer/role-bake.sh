@@ -0,0 +1,39 @@
+#!/bin/bash -xe
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Pre-converge a role on top of the base image so first boot only has to
+# apply the final configuration.
+
+ROLE="$1"
+ENV="$2"
+NODE_NAME="bake-${ROLE}-$(date +%s)"
+
+cat > /etc/chef/first-boot.json <<EOP
+{"run_list":["recipe[role-base]", "recipe[$ROLE]"]}
+EOP
+
+chef-client --environment "$ENV" --node-name "$NODE_NAME" --json-attributes /etc/chef/first-boot.json --logfile /var/log/chef-bake.log
+
+# Forget the bake node so each instance registers itself on first boot.
+knife node delete "$NODE_NAME" --yes --config /etc/chef/client.rb --user "$NODE_NAME" --key /etc/chef/client.pem || true
+knife client delete "$NODE_NAME" --yes --config /etc/chef/client.rb --user "$NODE_NAME" --key /etc/chef/client.pem || true
+rm -f /etc/chef/client.pem /etc/chef/first-boot.json
+
+# Tell bootstrap.sh which role this image already has.
+echo "$ROLE" > /etc/chef/prebaked
@@ -25,6 +25,10 @@ class BalancedApi(AppTemplate):
     CHEF_RECIPE = 'role-balanced-api'
     STACK_TAG = 'bapi'
     INSTANCE_TYPE = 'm3.large'
+    PROFILES = {
+        'production': {'InstanceType': 'm3.xlarge', 'EbsOptimized': True, 'Monitoring': True},
+        'test': {'InstanceType': 'm3.medium'},
+    }
     PORT = 5000
     CITADEL_FOLDERS = ['omnibus']
 
@@ -18,6 +18,7 @@
 
 from stratosphere import GetAtt, Ref
 
+from .balanced_gateway import BalancedGateway
 from .base import Template
 
 
@@ -45,13 +46,17 @@ class BalancedAZTemplate(Template):
         return {'Type': 'String'}
 
     def param_AmiId(self):
-        """AMI ID for gateway instances."""
-        return {'Type': 'String'}
+        """AMI ID for gateway instances. Optional."""
+        return {'Type': 'String', 'Default': ''}
 
     def param_PublicRouteTableId(self):
         """Route table to use for public subnet."""
         return {'Type': 'String'}
 
+    def param_GatewayInstanceType(self):
+        """Instance type for the NAT gateway."""
+        return {'Type': 'String', 'Default': BalancedGateway.INSTANCE_TYPE}
+
     def stack_Gateway(self):
         return {
             'TemplateName': 'balanced_gateway',
@@ -60,6 +65,9 @@ class BalancedAZTemplate(Template):
                 'AvailabilityZone': Ref(self.param_AvailabilityZone()),
                 'Cidr': Ref(self.param_GatewayCidr()),
                 'PublicRouteTableId': Ref(self.param_PublicRouteTableId()),
+                # The gateway instance points the default route at itself.
+                'RouteTableId': Ref(self.rtb()),
+                'InstanceType': Ref(self.param_GatewayInstanceType()),
             }
         }
 
@@ -71,10 +79,17 @@ class BalancedAZTemplate(Template):
 
     def route_GatewayRoute(self):
         """Route to the NAT gateway."""
+        # The gateway group now claims this route itself. Retained and left
+        # unchanged for one release: the previous gateway instance is kept
+        # exactly as it was, so InstanceId doesn't change and CloudFormation
+        # doesn't move the route back. Once the Retain policy is deployed,
+        # the next release drops this resource and that instance without
+        # stack cleanup deleting the route the group took over.
         return {
             'RouteTableId': Ref(self.rtb()),
             'DestinationCidrBlock': '0.0.0.0/0',
             'InstanceId': GetAtt(self.stack_Gateway(), 'Outputs.Instance'),
+            'DeletionPolicy': 'Retain',
         }
 
     def subnet_ProudctionSubnet(self):
@@ -126,6 +141,10 @@ class BalancedAZTemplate(Template):
         """Security group ID for the gateway."""
         return {'Value': GetAtt(self.stack_Gateway(), 'Outputs.SecurityGroup')}
 
+    def out_RouteTable(self):
+        """Route table for the production, test and misc subnets."""
+        return {'Value': Ref(self.rtb())}
+
     def out_ProductionSubnet(self):
         """Subnet ID for the production network."""
         return {'Value': Ref(self.subnet_ProudctionSubnet())}
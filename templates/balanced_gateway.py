@@ -19,12 +19,15 @@
 from troposphere.ec2 import NetworkInterfaceProperty
 
 import stratosphere
-from stratosphere import Base64, Ref
+from stratosphere import Base64, Join, Ref
 
 from .base import Template, RoleMixin
 
 
 class GatewayInstance(stratosphere.ec2.Instance):
+    # The route of existing stacks still points at this instance. Kept
+    # exactly as it was for one release so balanced_az can retain that
+    # route; any change here would restart or replace the live NAT.
     def AvailabilityZone(self):
         return self.template.subnet()['AvailabilityZone']
 
@@ -58,9 +61,85 @@ class GatewayInstance(stratosphere.ec2.Instance):
         ]))
 
 
+class GatewayLaunchConfiguration(stratosphere.autoscaling.LaunchConfiguration):
+    def AssociatePublicIpAddress(self):
+        return True
+
+    def IamInstanceProfile(self):
+        return Ref(self.template.insp())
+
+    def ImageId(self):
+        return self.template.RoleAmiId()
+
+    def InstanceType(self):
+        return Ref(self.template.param_InstanceType())
+
+    def KeyName(self):
+        return Ref(self.template.param_KeyName())
+
+    def SecurityGroups(self):
+        return [Ref(self.template.sg())]
+
+    def UserData(self):
+        # Once NAT is configured, take over the default route of the AZ so a
+        # replacement instance starts serving without a stack update.
+        return Base64(Join('', [
+            '#!/bin/bash -xe\n',
+            '/opt/bootstrap.sh nat production {} '.format(self.template.CHEF_RECIPE), Ref('AWS::StackName'), '\n',
+            'INSTANCE_ID="$(curl -s http://169.254.169.254/latest/meta-data/instance-id)"\n',
+            'aws ec2 modify-instance-attribute --region ', Ref('AWS::Region'), ' --instance-id "$INSTANCE_ID" --no-source-dest-check\n',
+            'aws ec2 replace-route --region ', Ref('AWS::Region'), ' --route-table-id ', Ref(self.template.param_RouteTableId()),
+            ' --destination-cidr-block 0.0.0.0/0 --instance-id "$INSTANCE_ID" || ',
+            'aws ec2 create-route --region ', Ref('AWS::Region'), ' --route-table-id ', Ref(self.template.param_RouteTableId()),
+            ' --destination-cidr-block 0.0.0.0/0 --instance-id "$INSTANCE_ID"\n',
+        ]))
+
+
+class GatewayGroup(stratosphere.autoscaling.AutoScalingGroup):
+    def AvailabilityZones(self):
+        return [Ref(self.template.param_AvailabilityZone())]
+
+    def LaunchConfigurationName(self):
+        return Ref(self.template.lc())
+
+    def MaxSize(self):
+        return '1'
+
+    def MinSize(self):
+        return '1'
+
+    def VPCZoneIdentifier(self):
+        return [Ref(self.template.subnet())]
+
+
 class BalancedGateway(RoleMixin, Template):
     """NAT gateway configuration."""
 
+    CHEF_RECIPE = 'role-nat'
+    # Network performance matters more than anything else for NAT.
+    INSTANCE_TYPE = 'c3.large'
+    IAM_STATEMENTS = [
+        {
+            'Effect': 'Allow',
+            'Action': [
+                'ec2:CreateRoute',
+                'ec2:DescribeRouteTables',
+                'ec2:ModifyInstanceAttribute',
+                'ec2:ReplaceRoute',
+            ],
+            'Resource': '*',
+        },
+    ]
+
+    @classmethod
+    def STRATOSPHERE_TYPES(cls):
+        types = Template.STRATOSPHERE_TYPES()
+        types.update({
+            'asg': GatewayGroup,
+            'lc': GatewayLaunchConfiguration,
+        })
+        return types
+
     def param_AvailabilityZone(self):
         """Availability zone."""
         return {'Type': 'String'}
@@ -69,14 +148,18 @@ class BalancedGateway(RoleMixin, Template):
         """CIDR block for this network."""
         return {'Type': 'String'}
 
-    def param_AmiId(self):
-        """AMI ID."""
-        return {'Type': 'String'}
-
     def param_PublicRouteTableId(self):
         """Route table to use for public subnet."""
         return {'Type': 'String'}
 
+    def param_RouteTableId(self):
+        """Route table to send through the gateway."""
+        return {'Type': 'String'}
+
+    def param_InstanceType(self):
+        """Instance type for the gateway."""
+        return {'Type': 'String', 'Default': self.INSTANCE_TYPE}
+
     def subnet(self):
         """Gateway network subnet."""
         return {
@@ -96,6 +179,14 @@ class BalancedGateway(RoleMixin, Template):
         """Security group for gateway instance."""
         return {'AllowSSH': True}
 
+    def lc(self):
+        """Launch configuration for NAT gateway instances."""
+        return {'Description': 'Launch configuration for NAT gateway instances'}
+
+    def asg(self):
+        """Group keeping one NAT gateway instance running."""
+        return {'Description': 'Group keeping one NAT gateway instance running'}
+
     def instance(self):
         """EC2 instance serving as a NAT gateway."""
         return GatewayInstance('GatewayInstance', template=self)
@@ -104,6 +195,10 @@ class BalancedGateway(RoleMixin, Template):
         """Gateway instance ID."""
         return {'Value': Ref(self.instance())}
 
+    def out_Group(self):
+        """Gateway autoscaling group name."""
+        return {'Value': Ref(self.asg())}
+
     def out_SecurityGroup(self):
         """Gateway security group."""
         return {'Value': Ref(self.sg())}
@@ -16,14 +16,16 @@
 # limitations under the License.
 #
 
-from stratosphere import FindInMap, GetAtt, Join, Ref
+from stratosphere import GetAtt, Join, Ref
 
-from .base import Template
+from .balanced_api import BalancedApi
+from .balanced_docs import BalancedDocs
+from .balanced_gateway import BalancedGateway
+from .base import RoleMixin, Template
 
-
-def FindInRegionMap(map, key):
-    """Helper to do a lookup in a region-based mapping."""
-    return FindInMap(map, Ref('AWS::Region'), key)
+# Role templates running instances in the region's private subnets, only
+# used to restrict the S3 endpoint (see RESTRICT_S3_ENDPOINT).
+ROLE_TEMPLATES = [BalancedApi, BalancedDocs, BalancedGateway]
 
 
 class BalancedRegionBase(Template):
@@ -33,19 +35,6 @@ class BalancedRegionBase(Template):
         # We don't have one of these, we are the alpha and the omega
         return None
 
-    def map_RegionMap(self):
-        return {
-            'us-west-1': {
-                'AmiId': 'ami-dac4f89f',
-            },
-            'us-west-2': {
-                'AmiId': 'ami-3e167a0e',
-            },
-            'us-east-1': {
-                'AmiId': 'ami-21898948', # For the future
-            },
-        }
-
     def vpc(self):
         raise NotImplementedError
 
@@ -53,6 +42,11 @@ class BalancedRegionBase(Template):
 class BalancedRegionTemplate(BalancedRegionBase):
     """Template for a whole AWS region."""
 
+    # Everything in the private subnets reaches S3 through the endpoint, so
+    # restricting it denies every bucket the ROLE_TEMPLATES roles don't list,
+    # package mirrors included.
+    RESTRICT_S3_ENDPOINT = False
+
     def param_Ip(self):
         """Second octet to use for VPC subnets."""
         return {'Type': 'String', 'Default': '5'}
@@ -122,6 +116,33 @@ class BalancedRegionTemplate(BalancedRegionBase):
             'GatewayId': Ref(self.ig()),
         }
 
+    def vpce_S3Endpoint(self):
+        """S3 endpoint for the private subnets, so S3 traffic skips the NAT gateways."""
+        endpoint = {
+            'VpcId': Ref(self.vpc()),
+            'ServiceName': Join('', ['com.amazonaws.', Ref('AWS::Region'), '.s3']),
+            'RouteTableIds': [GetAtt(self.stack_ZoneA(), 'Outputs.RouteTable'), GetAtt(self.stack_ZoneB(), 'Outputs.RouteTable'), GetAtt(self.stack_ZoneC(), 'Outputs.RouteTable')],
+        }
+        # Without a policy the endpoint allows all of S3.
+        if self.RESTRICT_S3_ENDPOINT:
+            endpoint['PolicyDocument'] = {
+                'Statement': [
+                    {
+                        'Effect': 'Allow',
+                        'Principal': '*',
+                        'Action': 's3:GetObject',
+                        'Resource': ['arn:aws:s3:::{}/*'.format(b) for b in RoleMixin.all_s3_buckets(ROLE_TEMPLATES)],
+                    },
+                    {
+                        'Effect': 'Allow',
+                        'Principal': '*',
+                        'Action': 's3:PutObject',
+                        'Resource': Join('', ['arn:aws:s3:::balanced-cfn-', Ref('AWS::Region'), '/boot-reports/*']),
+                    },
+                ],
+            }
+        return endpoint
+
     def _stack_zone(self, zone_id):
         """Helper to create AZ stacks."""
         zone_id = zone_id.upper()
@@ -134,7 +155,6 @@ class BalancedRegionTemplate(BalancedRegionBase):
                 'ProductionCidr': self.FindSubnet('Production{0}'.format(zone_id)),
                 'TestCidr': self.FindSubnet('Test{0}'.format(zone_id)),
                 'MiscCidr': self.FindSubnet('Misc{0}'.format(zone_id)),
-                'AmiId': FindInRegionMap(self.map_RegionMap(), 'AmiId'),
             },
             'DependsOn': [self.vga(), self.vdoa()],
         }
@@ -157,7 +177,6 @@ class BalancedRegionTemplate(BalancedRegionBase):
             'TemplateName': 'balanced_docs',
             'Parameters': {
                 'Env': 'misc',
-                'AmiId': FindInRegionMap(self.map_RegionMap(), 'AmiId'),
                 'SubnetA': GetAtt(self.stack_ZoneA(), 'Outputs.MiscSubnet'),
                 'SubnetB': GetAtt(self.stack_ZoneB(), 'Outputs.MiscSubnet'),
                 'SubnetC': GetAtt(self.stack_ZoneC(), 'Outputs.MiscSubnet'),
@@ -16,10 +16,53 @@
 # limitations under the License.
 #
 
+import json
+import os
+import re
+
+import troposphere
+import troposphere.autoscaling
+import troposphere.cloudwatch
 import troposphere.elasticloadbalancing
+import troposphere.policies
 
 import stratosphere
-from stratosphere import And, Equals, Not, NoValue, If, GetAtt, Ref, Join, Base64
+from stratosphere import And, Equals, FindInMap, Not, NoValue, If, GetAtt, Ref, Join, Base64
+
+
+# Generic base image built from packer/balanced-client.json.
+BASE_AMIS = {
+    'us-west-1': 'ami-dac4f89f',
+    'us-west-2': 'ami-3e167a0e',
+    'us-east-1': 'ami-21898948', # For the future
+}
+
+# Images built for each role by brix bake.
+ROLE_AMIS_PATH = os.path.join(os.path.dirname(__file__), 'amis.json')
+
+
+# Buckets instances read from besides their citadel folders.
+ROLE_S3_BUCKETS = ['balanced.debs', 'apt.vandelay.io']
+
+
+def role_amis(role):
+    """Return baked AMI IDs by region for a Chef role."""
+    with open(ROLE_AMIS_PATH) as f:
+        return json.load(f).get(role, {})
+
+
+def JSONJoin(value, replacements):
+    """Serialize value as JSON in a Join, with placeholder strings replaced by intrinsic functions."""
+    text = json.dumps(value, sort_keys=True)
+    pattern = re.compile('|'.join(re.escape(placeholder) for placeholder in replacements))
+    parts = []
+    pos = 0
+    for match in pattern.finditer(text):
+        parts.append(text[pos:match.start()])
+        parts.append(replacements[match.group(0)])
+        pos = match.end()
+    parts.append(text[pos:])
+    return Join('', parts)
 
 
 class ConditionalAZMixin(object):
@@ -159,11 +202,46 @@ class LoadBalancer(ConditionalAZMixin, stratosphere.elasticloadbalancing.LoadBal
         self._ssl_certificate_id = kwargs.pop('SSLCertificateId', None)
         self._security_group = kwargs.pop('SecurityGroup', None)
         self._health_url = kwargs.pop('HealthUrl', '/health')
+        self._healthy_threshold = kwargs.pop('HealthyThreshold', '3')
+        self._unhealthy_threshold = kwargs.pop('UnhealthyThreshold', '5')
+        self._health_interval = kwargs.pop('HealthInterval', '30')
+        self._health_timeout = kwargs.pop('HealthTimeout', '5')
+        self._cross_zone = kwargs.pop('CrossZone', True)
+        self._draining_timeout = kwargs.pop('DrainingTimeout', None)
+        self._idle_timeout = kwargs.pop('IdleTimeout', None)
+        self._access_log_bucket = kwargs.pop('AccessLogBucket', None)
+        self._access_log_prefix = kwargs.pop('AccessLogPrefix', None)
+        self._access_log_interval = kwargs.pop('AccessLogInterval', 60)
         super(LoadBalancer, self).__init__(*args, **kwargs)
 
     def Scheme(self):
         return self._scheme
 
+    def CrossZone(self):
+        return self._cross_zone
+
+    def ConnectionDrainingPolicy(self):
+        if self._draining_timeout is not None:
+            return troposphere.elasticloadbalancing.ConnectionDrainingPolicy(
+                Enabled=True,
+                Timeout=self._draining_timeout,
+            )
+
+    def ConnectionSettings(self):
+        if self._idle_timeout is not None:
+            return troposphere.elasticloadbalancing.ConnectionSettings(
+                IdleTimeout=self._idle_timeout,
+            )
+
+    def AccessLoggingPolicy(self):
+        if self._access_log_bucket:
+            return troposphere.elasticloadbalancing.AccessLoggingPolicy(
+                Enabled=True,
+                S3BucketName=self._access_log_bucket,
+                S3BucketPrefix=self._access_log_prefix or NoValue,
+                EmitInterval=self._access_log_interval,
+            )
+
     def SecurityGroups(self):
         if self._security_group:
             return [self._security_group]
@@ -200,10 +278,10 @@ class LoadBalancer(ConditionalAZMixin, stratosphere.elasticloadbalancing.LoadBal
         if self._health_url:
             return troposphere.elasticloadbalancing.HealthCheck(
                 Target=Join('', ['HTTP:', self._port, self._health_url]),
-                HealthyThreshold='3',
-                UnhealthyThreshold='5',
-                Interval='30',
-                Timeout='5',
+                HealthyThreshold=self._healthy_threshold,
+                UnhealthyThreshold=self._unhealthy_threshold,
+                Interval=self._health_interval,
+                Timeout=self._health_timeout,
             )
 
     def Subnets(self):
@@ -227,13 +305,44 @@ class LaunchConfiguration(stratosphere.autoscaling.LaunchConfiguration):
         self._chef_recipe = kwargs.pop('ChefRecipe')
         self._chef_env = kwargs.pop('ChefEnv')
         self._name_tag = kwargs.pop('NameTag', 'ec2')
+        self._ephemeral_disks = kwargs.pop('EphemeralDisks', 0)
+        self._ebs_volumes = kwargs.pop('EbsVolumes', [])
+        self._data_path = kwargs.pop('DataPath', '')
         super(LaunchConfiguration, self).__init__(*args, **kwargs)
 
+    def _ebs_mounts(self):
+        """DEVICE:MOUNT_POINT pairs for bootstrap.sh to format and mount."""
+        return ' '.join('{}:{}'.format(volume['Device'], volume['MountPoint']) for volume in self._ebs_volumes)
+
+    def BlockDeviceMappings(self):
+        mappings = []
+        # Instance store disks start at sdb, types with fewer disks ignore
+        # the extra mappings.
+        for i in range(self._ephemeral_disks):
+            mappings.append(troposphere.autoscaling.BlockDeviceMapping(
+                DeviceName='/dev/sd{}'.format(chr(ord('b') + i)),
+                VirtualName='ephemeral{}'.format(i),
+            ))
+        for volume in self._ebs_volumes:
+            ebs = {
+                'VolumeSize': str(volume['Size']),
+                'VolumeType': volume.get('Type', 'gp2'),
+                'DeleteOnTermination': True,
+            }
+            if 'Iops' in volume:
+                ebs['Iops'] = str(volume['Iops'])
+            mappings.append(troposphere.autoscaling.BlockDeviceMapping(
+                DeviceName=volume['Device'],
+                Ebs=troposphere.autoscaling.EBSBlockDevice(**ebs),
+            ))
+        if mappings:
+            return mappings
+
     def IamInstanceProfile(self):
         return Ref(self.template.insp())
 
     def ImageId(self):
-        return Ref(self.template.param_AmiId())
+        return self.template.RoleAmiId()
 
     def KeyName(self):
         return Ref(self.template.param_KeyName())
@@ -245,11 +354,68 @@ class LaunchConfiguration(stratosphere.autoscaling.LaunchConfiguration):
     def UserData(self):
         return Base64(Join('', [
             '#!/bin/bash -xe\n',
-            '/opt/bootstrap.sh "', self._name_tag, '" "', self._chef_env, '" "',  self._chef_recipe, '"\n',
+            '/opt/bootstrap.sh "', self._name_tag, '" "', self._chef_env, '" "',  self._chef_recipe, '" "', Ref('AWS::StackName'), '" "', self._data_path, '" "', self._ebs_mounts(), '"\n',
         ]))
 
 
+class VPCEndpoint(stratosphere.ec2.Route):
+    """VPC endpoint, troposphere doesn't have it yet.
+
+    Built on the Route wrapper so templates can declare it like any other
+    stratosphere type.
+    """
+    resource_type = 'AWS::EC2::VPCEndpoint'
+
+    props = {
+        'PolicyDocument': (dict, False),
+        'RouteTableIds': ([basestring], False),
+        'ServiceName': (basestring, True),
+        'VpcId': (basestring, True),
+    }
+
+
+class Dashboard(stratosphere.cloudwatch.Alarm):
+    """CloudWatch dashboard, troposphere doesn't have it yet.
+
+    Built on the Alarm wrapper so templates can declare it like any other
+    stratosphere type.
+    """
+    resource_type = 'AWS::CloudWatch::Dashboard'
+
+    props = {
+        'DashboardBody': (basestring, True),
+        'DashboardName': (basestring, False),
+    }
+
+
+class Alarm(stratosphere.cloudwatch.Alarm):
+    # Percentile alarms set ExtendedStatistic instead of Statistic,
+    # troposphere doesn't know about it yet.
+    props = dict(
+        stratosphere.cloudwatch.Alarm.props,
+        Statistic=(basestring, False),
+        ExtendedStatistic=(basestring, False),
+    )
+
+
 class AutoScalingGroup(ConditionalAZMixin, stratosphere.autoscaling.AutoScalingGroup):
+    def __init__(self, *args, **kwargs):
+        # Replace instances in batches when the launch configuration changes.
+        self._min_instances_in_service = kwargs.pop('MinInstancesInService', None)
+        self._max_batch_size = kwargs.pop('MaxBatchSize', '1')
+        self._pause_time = kwargs.pop('PauseTime', 'PT5M')
+        super(AutoScalingGroup, self).__init__(*args, **kwargs)
+
+    def UpdatePolicy(self):
+        if self._min_instances_in_service is not None:
+            return troposphere.policies.UpdatePolicy(
+                AutoScalingRollingUpdate=troposphere.policies.AutoScalingRollingUpdate(
+                    MaxBatchSize=self._max_batch_size,
+                    MinInstancesInService=self._min_instances_in_service,
+                    PauseTime=self._pause_time,
+                ),
+            )
+
     def AvailabilityZones(self):
         zones = []
         if self._cond_a:
@@ -312,18 +478,45 @@ class Stack(stratosphere.cloudformation.Stack):
         return params
 
 
+class StackOutput(troposphere.AWSHelperFn):
+    """An output of a stack outside this template, resolved by brix at render time.
+
+    The region is required, rendered templates are used in every region.
+    """
+    # Find a better way to do this
+    RESOLVER = None
+
+    def __init__(self, stack_name, key, region):
+        self.stack_name = stack_name
+        self.key = key
+        self.region = region
+
+    def JSONrepr(self):
+        if not self.RESOLVER:
+            raise ValueError('Unable to resolve output {} of stack {} outside of brix'.format(self.key, self.stack_name))
+        return self.RESOLVER(self.stack_name, self.key, self.region)
+
+
 class Template(stratosphere.Template):
     """Defaults and mixins for Balanced templates."""
 
+    # Let brix move resources into generated nested stacks when the template
+    # gets close to CloudFormation limits.
+    AUTO_SPLIT = False
+
     @classmethod
     def STRATOSPHERE_TYPES(cls):
         types = stratosphere.Template.STRATOSPHERE_TYPES()
         types.update({
+            'alarm': Alarm,
             'asg': AutoScalingGroup,
+            'dashboard': Dashboard,
             'elb': LoadBalancer,
             'lc': LaunchConfiguration,
+            'policy': stratosphere.autoscaling.ScalingPolicy,
             'sg': SecurityGroup,
             'stack': Stack,
+            'vpce': VPCEndpoint,
         })
         return types
 
@@ -337,14 +530,32 @@ class Template(stratosphere.Template):
 
 
 class RoleMixin(stratosphere.Template):
+    CHEF_RECIPE = None
     CITADEL_FOLDERS = []
     S3_BUCKETS = []
     IAM_STATEMENTS = []
 
+    def param_AmiId(self):
+        """Amazon machine image. Optional, defaults to the image baked for this role."""
+        return {'Type': 'String', 'Default': ''}
+
+    def map_RoleAmiMap(self):
+        """Images baked for this role by brix bake, or the base image."""
+        amis = role_amis(self.CHEF_RECIPE)
+        return {region: {'AmiId': amis.get(region, ami_id)} for region, ami_id in BASE_AMIS.iteritems()}
+
+    def cond_HasAmiId(self):
+        """Condition checking if an AMI was passed in."""
+        return Not(Equals(Ref(self.param_AmiId()), ''))
+
+    def RoleAmiId(self):
+        """AMI to launch instances from."""
+        return If('HasAmiId', Ref(self.param_AmiId()), FindInMap(self.map_RoleAmiMap(), Ref('AWS::Region'), 'AmiId'))
+
     def role(self):
         """IAM role for Balanced docs."""
         citadel_folders = ['newrelic', 'deploy_key'] + self.CITADEL_FOLDERS
-        s3_buckets = ['balanced-citadel/{}'.format(s) for s in citadel_folders] + ['balanced.debs', 'apt.vandelay.io'] + self.S3_BUCKETS
+        s3_buckets = ['balanced-citadel/{}'.format(s) for s in citadel_folders] + ROLE_S3_BUCKETS + self.S3_BUCKETS
         s3_objects = ['arn:aws:s3:::{}/*'.format(s) for s in s3_buckets]
         return {
             'Statements': [
@@ -362,9 +573,23 @@ class RoleMixin(stratosphere.Template):
                   ],
                   'Resource': 'arn:aws:route53:::hostedzone/Z2IP8RX9IARH86',
                 },
+                {
+                    # Boot timing reports from bootstrap.sh
+                    'Effect': 'Allow',
+                    'Action': 's3:PutObject',
+                    'Resource': Join('', ['arn:aws:s3:::balanced-cfn-', Ref('AWS::Region'), '/boot-reports/', Ref('AWS::StackName'), '/*']),
+                },
             ] + self.IAM_STATEMENTS,
         }
 
+    @staticmethod
+    def all_s3_buckets(templates):
+        """Buckets the given role templates read from."""
+        buckets = set(['balanced-citadel'] + ROLE_S3_BUCKETS)
+        for template in templates:
+            buckets.update(template.S3_BUCKETS)
+        return sorted(buckets)
+
     def insp(self):
         """IAM instance profile."""
         return {
@@ -378,12 +603,43 @@ class AppTemplate(RoleMixin, Template):
 
     # Parameter defaults
     ENV = 'production'
-    CHEF_RECIPE = None
+    ENVS = ['production', 'test', 'misc']
     STACK_TAG = None
     INSTANCE_TYPE = 'm1.small'
-    CAPACITY = 1
+    EBS_OPTIMIZED = False
+    MONITORING = True
+    # Sizing per Env, can set any of InstanceType, EbsOptimized and
+    # Monitoring. Anything not set comes from the defaults above.
+    PROFILES = {}
+    # Instance count to set on every stack update, None leaves it to scaling
+    CAPACITY = None
+    MIN_CAPACITY = 1
+    MAX_CAPACITY = 4
     PUBLIC = False
     PORT = 80
+    # Seconds from launch until an instance passes its health check
+    BOOT_TIME = 600
+    # Instance store disks to map, combined into one XFS volume at DATA_PATH
+    EPHEMERAL_DISKS = 0
+    DATA_PATH = '/srv'
+    # Extra EBS volumes, formatted as XFS and mounted on boot. Dicts with
+    # Device, Size, MountPoint and optionally Type and Iops
+    EBS_VOLUMES = []
+
+    # Scaling threshold defaults, stacks can pass their own as parameters
+    SCALE_UP_LATENCY = 0.5 # Average ELB latency in seconds over a minute
+    SCALE_UP_REQUESTS = 6000 # ELB requests per minute
+    SCALE_UP_CPU = 70 # Average percent over five minutes
+    SCALE_DOWN_CPU = 20
+    SCALE_UP_COOLDOWN = 300
+    SCALE_DOWN_COOLDOWN = 900
+
+    # Alarm thresholds, alarms notify the AlarmTopic parameter if given
+    ALARM_LATENCY_P50 = 0.25 # Seconds
+    ALARM_LATENCY_P99 = 2
+    ALARM_SURGE_QUEUE = 50 # Requests waiting for a backend
+    ALARM_5XX = 10 # Backend 5xx responses per minute
+    ALARM_CPU = 90 # Average percent
 
     def param_ChefRecipe(self):
         """Chef recipe name."""
@@ -399,23 +655,85 @@ class AppTemplate(RoleMixin, Template):
 
     def param_Env(self):
         """Logical environment."""
-        return {'Type': 'String', 'AllowedValues': ['production', 'test', 'misc'], 'Default': 'production'}
+        return {'Type': 'String', 'AllowedValues': self.ENVS, 'Default': 'production'}
 
     def param_ChefEnv(self):
         """Configuration environment."""
         return {'Type': 'String', 'Default': self.ENV}
 
     def param_InstanceType(self):
-        """Instance type."""
-        return {'Type': 'String', 'Default': self.INSTANCE_TYPE}
+        """Instance type. Optional, defaults to the one for Env."""
+        return {'Type': 'String', 'Default': ''}
+
+    def profile(self, env):
+        """Sizing settings for an environment."""
+        profile = {
+            'InstanceType': self.INSTANCE_TYPE,
+            'EbsOptimized': self.EBS_OPTIMIZED,
+            'Monitoring': self.MONITORING,
+        }
+        profile.update(self.PROFILES.get(env, {}))
+        return profile
+
+    def map_ProfileMap(self):
+        """Sizing settings by Env."""
+        profiles = {}
+        for env in self.ENVS:
+            profile = self.profile(env)
+            profiles[env] = {
+                'InstanceType': profile['InstanceType'],
+                'EbsOptimized': 'true' if profile['EbsOptimized'] else 'false',
+                'Monitoring': 'true' if profile['Monitoring'] else 'false',
+            }
+        return profiles
+
+    def cond_HasInstanceType(self):
+        """Condition checking if an instance type was passed in."""
+        return Not(Equals(Ref(self.param_InstanceType()), ''))
+
+    def FindProfile(self, key):
+        """Look up a sizing setting for the Env parameter."""
+        return FindInMap(self.map_ProfileMap(), Ref(self.param_Env()), key)
 
     def param_Capacity(self):
-        """Instance count."""
-        return {'Type': 'Number', 'Default': str(self.CAPACITY)}
+        """Instance count to reset the group to. Optional, scaling decides otherwise."""
+        return {'Type': 'String', 'Default': '' if self.CAPACITY is None else str(self.CAPACITY)}
 
-    def param_AmiId(self):
-        """Amazon machine image."""
-        return {'Type': 'String'}
+    def cond_HasCapacity(self):
+        """Condition checking if an instance count was passed in."""
+        return Not(Equals(Ref(self.param_Capacity()), ''))
+
+    def param_MinCapacity(self):
+        """Minimum instance count."""
+        return {'Type': 'Number', 'Default': str(self.MIN_CAPACITY)}
+
+    def param_MaxCapacity(self):
+        """Maximum instance count."""
+        return {'Type': 'Number', 'Default': str(self.MAX_CAPACITY)}
+
+    def param_ScaleUpLatency(self):
+        """Average ELB latency in seconds over a minute to add an instance at."""
+        return {'Type': 'Number', 'Default': str(self.SCALE_UP_LATENCY)}
+
+    def param_ScaleUpRequests(self):
+        """ELB requests per minute to add an instance at."""
+        return {'Type': 'Number', 'Default': str(self.SCALE_UP_REQUESTS)}
+
+    def param_ScaleUpCPU(self):
+        """Average CPU percent over five minutes to add an instance at."""
+        return {'Type': 'Number', 'Default': str(self.SCALE_UP_CPU)}
+
+    def param_ScaleDownCPU(self):
+        """Average CPU percent over five minutes to remove an instance at."""
+        return {'Type': 'Number', 'Default': str(self.SCALE_DOWN_CPU)}
+
+    def param_ScaleUpCooldown(self):
+        """Seconds to wait after adding an instance."""
+        return {'Type': 'Number', 'Default': str(self.SCALE_UP_COOLDOWN)}
+
+    def param_ScaleDownCooldown(self):
+        """Seconds to wait after removing an instance."""
+        return {'Type': 'Number', 'Default': str(self.SCALE_DOWN_COOLDOWN)}
 
     def param_SubnetA(self):
         """Subnet ID for AZ A. Optional."""
@@ -453,6 +771,14 @@ class AppTemplate(RoleMixin, Template):
         """Security group ID for AZ C Gateway instances. Optional."""
         return {'Type': 'String', 'Default': ''}
 
+    def param_AlarmTopic(self):
+        """SNS topic ARN for alarm notifications. Optional."""
+        return {'Type': 'String', 'Default': ''}
+
+    def cond_HasAlarmTopic(self):
+        """Condition checking if an alarm topic was passed in."""
+        return Not(Equals(Ref(self.param_AlarmTopic()), ''))
+
     def cond_HasA(self):
         """Condition checking if AZ A is usable."""
         return And(
@@ -505,6 +831,10 @@ class AppTemplate(RoleMixin, Template):
             'HealthUrl': '/health',
             'Port': self.PORT,
             'SecurityGroup': Ref(self.sg_LoadBalancerSecurityGroup()),
+            'CrossZone': True,
+            # Let requests in flight finish before an instance is removed.
+            'DrainingTimeout': 60,
+            'IdleTimeout': 60,
         }
 
     def lc(self):
@@ -515,13 +845,229 @@ class AppTemplate(RoleMixin, Template):
             'ChefRecipe': Ref(self.param_ChefRecipe()),
             'ChefEnv': Ref(self.param_ChefEnv()),
             'NameTag': Ref(self.param_Tag()),
-            'InstanceType': Ref(self.param_InstanceType()),
+            'InstanceType': If('HasInstanceType', Ref(self.param_InstanceType()), self.FindProfile('InstanceType')),
+            'EbsOptimized': self.FindProfile('EbsOptimized'),
+            'InstanceMonitoring': self.FindProfile('Monitoring'),
+            'EphemeralDisks': self.EPHEMERAL_DISKS,
+            'EbsVolumes': self.EBS_VOLUMES,
+            'DataPath': self.DATA_PATH if self.EPHEMERAL_DISKS else '',
         }
 
     def asg(self):
         """Autoscaling group."""
         return {
             'Description': 'Autoscaling group for {}'.format(self.__class__.__name__),
-            'MinSize': Ref(self.param_Capacity()),
-            'MaxSize': Ref(self.param_Capacity()),
+            'MinSize': Ref(self.param_MinCapacity()),
+            'MaxSize': Ref(self.param_MaxCapacity()),
+            'DesiredCapacity': If('HasCapacity', Ref(self.param_Capacity()), NoValue),
+            'HealthCheckType': 'ELB',
+            'HealthCheckGracePeriod': self.BOOT_TIME,
+            # Only take instances out of service once their replacements
+            # have had time to boot. CloudFormation can't read the current
+            # desired count, so a scaled-up group can drop to MinCapacity
+            # during a roll. Stays below MaxSize as long as MaxCapacity is
+            # greater than MinCapacity.
+            'MinInstancesInService': Ref(self.param_MinCapacity()),
+            'MaxBatchSize': '1',
+            'PauseTime': 'PT{}S'.format(self.BOOT_TIME),
+            'MetricsCollection': [troposphere.autoscaling.MetricsCollection(Granularity='1Minute')],
+        }
+
+    def policy_ScaleUp(self):
+        """Add an instance."""
+        return {
+            'AdjustmentType': 'ChangeInCapacity',
+            'AutoScalingGroupName': Ref(self.asg()),
+            'Cooldown': Ref(self.param_ScaleUpCooldown()),
+            'ScalingAdjustment': '1',
+        }
+
+    def policy_ScaleDown(self):
+        """Remove an instance."""
+        return {
+            'AdjustmentType': 'ChangeInCapacity',
+            'AutoScalingGroupName': Ref(self.asg()),
+            'Cooldown': Ref(self.param_ScaleDownCooldown()),
+            'ScalingAdjustment': '-1',
+        }
+
+    def alarm_HighLatencyAlarm(self):
+        """Scale up when the load balancer is slow to respond."""
+        return {
+            'AlarmDescription': 'High ELB latency for {}'.format(self.__class__.__name__),
+            'Namespace': 'AWS/ELB',
+            'MetricName': 'Latency',
+            'Dimensions': self._elb_dimensions(),
+            'Statistic': 'Average',
+            'Period': '60',
+            'EvaluationPeriods': '3',
+            'ComparisonOperator': 'GreaterThanThreshold',
+            'Threshold': Ref(self.param_ScaleUpLatency()),
+            'AlarmActions': [Ref(self.policy_ScaleUp())],
+        }
+
+    def alarm_HighRequestsAlarm(self):
+        """Scale up when the load balancer gets a lot of requests."""
+        return {
+            'AlarmDescription': 'High ELB request count for {}'.format(self.__class__.__name__),
+            'Namespace': 'AWS/ELB',
+            'MetricName': 'RequestCount',
+            'Dimensions': self._elb_dimensions(),
+            'Statistic': 'Sum',
+            'Period': '60',
+            'EvaluationPeriods': '3',
+            'ComparisonOperator': 'GreaterThanThreshold',
+            'Threshold': Ref(self.param_ScaleUpRequests()),
+            'AlarmActions': [Ref(self.policy_ScaleUp())],
+        }
+
+    def alarm_HighCPUAlarm(self):
+        """Scale up when instances are busy."""
+        return {
+            'AlarmDescription': 'High CPU for {}'.format(self.__class__.__name__),
+            'Namespace': 'AWS/EC2',
+            'MetricName': 'CPUUtilization',
+            'Dimensions': self._asg_dimensions(),
+            'Statistic': 'Average',
+            'Period': '300',
+            'EvaluationPeriods': '2',
+            'ComparisonOperator': 'GreaterThanThreshold',
+            'Threshold': Ref(self.param_ScaleUpCPU()),
+            'AlarmActions': [Ref(self.policy_ScaleUp())],
+        }
+
+    def alarm_LowCPUAlarm(self):
+        """Scale down when instances are idle."""
+        return {
+            'AlarmDescription': 'Low CPU for {}'.format(self.__class__.__name__),
+            'Namespace': 'AWS/EC2',
+            'MetricName': 'CPUUtilization',
+            'Dimensions': self._asg_dimensions(),
+            'Statistic': 'Average',
+            'Period': '300',
+            'EvaluationPeriods': '3',
+            'ComparisonOperator': 'LessThanThreshold',
+            'Threshold': Ref(self.param_ScaleDownCPU()),
+            'AlarmActions': [Ref(self.policy_ScaleDown())],
+        }
+
+    def _elb_dimensions(self):
+        return [troposphere.cloudwatch.MetricDimension(Name='LoadBalancerName', Value=Ref(self.elb()))]
+
+    def _asg_dimensions(self):
+        return [troposphere.cloudwatch.MetricDimension(Name='AutoScalingGroupName', Value=Ref(self.asg()))]
+
+    def _alarm_actions(self):
+        return If('HasAlarmTopic', [Ref(self.param_AlarmTopic())], NoValue)
+
+    def alarm_LatencyP50Alarm(self):
+        """Median ELB latency is high."""
+        return {
+            'AlarmDescription': 'Median latency for {}'.format(self.__class__.__name__),
+            'Namespace': 'AWS/ELB',
+            'MetricName': 'Latency',
+            'Dimensions': self._elb_dimensions(),
+            'ExtendedStatistic': 'p50',
+            'Period': '60',
+            'EvaluationPeriods': '5',
+            'ComparisonOperator': 'GreaterThanThreshold',
+            'Threshold': str(self.ALARM_LATENCY_P50),
+            'AlarmActions': self._alarm_actions(),
+        }
+
+    def alarm_LatencyP99Alarm(self):
+        """Tail ELB latency is high."""
+        return {
+            'AlarmDescription': '99th percentile latency for {}'.format(self.__class__.__name__),
+            'Namespace': 'AWS/ELB',
+            'MetricName': 'Latency',
+            'Dimensions': self._elb_dimensions(),
+            'ExtendedStatistic': 'p99',
+            'Period': '60',
+            'EvaluationPeriods': '5',
+            'ComparisonOperator': 'GreaterThanThreshold',
+            'Threshold': str(self.ALARM_LATENCY_P99),
+            'AlarmActions': self._alarm_actions(),
+        }
+
+    def alarm_SurgeQueueAlarm(self):
+        """Requests are queueing in the ELB."""
+        return {
+            'AlarmDescription': 'ELB surge queue for {}'.format(self.__class__.__name__),
+            'Namespace': 'AWS/ELB',
+            'MetricName': 'SurgeQueueLength',
+            'Dimensions': self._elb_dimensions(),
+            'Statistic': 'Maximum',
+            'Period': '60',
+            'EvaluationPeriods': '3',
+            'ComparisonOperator': 'GreaterThanThreshold',
+            'Threshold': str(self.ALARM_SURGE_QUEUE),
+            'AlarmActions': self._alarm_actions(),
+        }
+
+    def alarm_Backend5XXAlarm(self):
+        """Instances are returning errors."""
+        return {
+            'AlarmDescription': 'Backend 5xx responses for {}'.format(self.__class__.__name__),
+            'Namespace': 'AWS/ELB',
+            'MetricName': 'HTTPCode_Backend_5XX',
+            'Dimensions': self._elb_dimensions(),
+            'Statistic': 'Sum',
+            'Period': '60',
+            'EvaluationPeriods': '3',
+            'ComparisonOperator': 'GreaterThanThreshold',
+            'Threshold': str(self.ALARM_5XX),
+            'AlarmActions': self._alarm_actions(),
+        }
+
+    def alarm_CPUAlarm(self):
+        """Instances are out of CPU."""
+        return {
+            'AlarmDescription': 'CPU for {}'.format(self.__class__.__name__),
+            'Namespace': 'AWS/EC2',
+            'MetricName': 'CPUUtilization',
+            'Dimensions': self._asg_dimensions(),
+            'Statistic': 'Average',
+            'Period': '60',
+            'EvaluationPeriods': '5',
+            'ComparisonOperator': 'GreaterThanThreshold',
+            'Threshold': str(self.ALARM_CPU),
+            'AlarmActions': self._alarm_actions(),
+        }
+
+    def dashboard_Dashboard(self):
+        """CloudWatch dashboard for the load balancer and instances."""
+        elb = ['LoadBalancerName', '{elb}']
+        asg = ['AutoScalingGroupName', '{asg}']
+        graphs = [
+            ('Latency', [['AWS/ELB', 'Latency'] + elb + [{'stat': stat, 'label': stat}] for stat in ('p50', 'p90', 'p99')]),
+            ('Requests', [['AWS/ELB', 'RequestCount'] + elb + [{'stat': 'Sum'}]]),
+            ('Errors', [['AWS/ELB', metric] + elb + [{'stat': 'Sum'}] for metric in ('HTTPCode_Backend_5XX', 'HTTPCode_ELB_5XX')]),
+            ('Queueing', [['AWS/ELB', 'SurgeQueueLength'] + elb + [{'stat': 'Maximum'}], ['AWS/ELB', 'SpilloverCount'] + elb + [{'stat': 'Sum'}]]),
+            ('CPU', [['AWS/EC2', 'CPUUtilization'] + asg + [{'stat': 'Average'}], ['AWS/EC2', 'CPUUtilization'] + asg + [{'stat': 'Maximum'}]]),
+            ('Instances', [['AWS/AutoScaling', metric] + asg for metric in ('GroupInServiceInstances', 'GroupDesiredCapacity')]),
+        ]
+        widgets = []
+        for i, (title, metrics) in enumerate(graphs):
+            widgets.append({
+                'type': 'metric',
+                'x': (i % 2) * 12,
+                'y': (i // 2) * 6,
+                'width': 12,
+                'height': 6,
+                'properties': {
+                    'title': title,
+                    'metrics': metrics,
+                    'period': 60,
+                    'region': '{region}',
+                    'view': 'timeSeries',
+                },
+            })
+        return {
+            'DashboardName': Ref('AWS::StackName'),
+            'DashboardBody': JSONJoin({'widgets': widgets}, {
+                '{elb}': Ref(self.elb()),
+                '{asg}': Ref(self.asg()),
+                '{region}': Ref('AWS::Region'),
+            }),
         }
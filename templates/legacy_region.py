@@ -18,7 +18,7 @@
 
 from stratosphere import Ref
 
-from .balanced_region import BalancedRegionBase, FindInRegionMap
+from .balanced_region import BalancedRegionBase
 from .base import Stack
 
 
@@ -33,7 +33,6 @@ class AppStack(Stack):
         params = {
             'VpcId': self.template.vpc(),
             'KeyName': Ref(self.template.param_KeyName()),
-            'AmiId': FindInRegionMap(self.template.map_RegionMap(), 'AmiId'),
             'SubnetA': Ref(self.template.subnet_SubnetA()),
             'SubnetB': Ref(self.template.subnet_SubnetB()),
             'GatewaySecurityGroupA': 'sg-cdbdafa1',
@@ -106,7 +105,8 @@ class LegacyRegionTemplate(BalancedRegionBase):
             'Parameters': {
                 'Env': 'production',
                 'ChefEnv': 'production',
-                'Capacity': 4,
+                'MinCapacity': 2,
+                'MaxCapacity': 8,
             },
         }
 
@@ -117,6 +117,7 @@ class LegacyRegionTemplate(BalancedRegionBase):
             'Parameters': {
                 'Env': 'test',
                 'ChefEnv': 'test',
-                'Capacity': 2,
+                'MinCapacity': 1,
+                'MaxCapacity': 4,
             },
         }
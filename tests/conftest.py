@@ -0,0 +1,63 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+
+import pytest
+
+import brix
+from brix import aws, canonical, split
+
+
+def rendered(name, body):
+    """Template data as Brix._load_templates makes it."""
+    sha1 = canonical.sha1(body)
+    return {
+        'name': name,
+        'children': [],
+        'warnings': [],
+        'json': split.dumps(body),
+        'sha1': sha1,
+        's3_key': 'templates/{}-{}.json'.format(name, sha1),
+    }
+
+
+class MemoryBrix(brix.Brix):
+    """Brix with fixed rendered templates instead of the templates package."""
+
+    def __init__(self, region, templates, **kwargs):
+        self.rendered = templates
+        super(MemoryBrix, self).__init__(region, **kwargs)
+
+    def _load_templates(self):
+        return dict((name, dict(data)) for name, data in self.rendered.iteritems())
+
+
+@pytest.fixture
+def make_app(tmpdir, monkeypatch):
+    """Return a factory for Brix objects on a memory backend private to the test."""
+    # No waiting on rate limits, and no buckets left from other tests.
+    monkeypatch.setattr(aws, '_buckets', {})
+    monkeypatch.setitem(aws.RATES, 'cloudformation', (1000.0, 1000))
+    monkeypatch.setitem(aws.RATES, 's3', (1000.0, 1000))
+    for var in ('BRIX_MEMORY_LATENCY', 'BRIX_MEMORY_THROTTLE', 'BRIX_MEMORY_DEPLOY_TIME'):
+        monkeypatch.delenv(var, raising=False)
+    def make_app(templates={}, region='us-west-1', options=''):
+        spec = 'memory:path={}{}'.format(tmpdir.join('world.pickle'), options)
+        return MemoryBrix(region, templates, backend=spec)
+    return make_app
@@ -0,0 +1,146 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+
+import boto.exception
+import pytest
+
+from brix import aws
+
+
+class Clock(object):
+    """Fake time, sleeping just moves it forward."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(aws.time, 'time', clock.time)
+    monkeypatch.setattr(aws.time, 'sleep', clock.sleep)
+    return clock
+
+
+def error(code, status=400, message=''):
+    e = boto.exception.BotoServerError(status, 'Bad Request')
+    e.error_code = code
+    e.message = message
+    return e
+
+
+def test_bucket_burst(clock):
+    bucket = aws.TokenBucket(2.0, 3)
+    assert [bucket.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert clock.sleeps == []
+
+
+def test_bucket_waits_for_rate(clock):
+    bucket = aws.TokenBucket(2.0, 1)
+    bucket.acquire()
+    assert bucket.acquire() == pytest.approx(0.5)
+    assert clock.now == pytest.approx(1000.5)
+
+
+def test_bucket_refills_up_to_burst(clock):
+    bucket = aws.TokenBucket(1.0, 2)
+    bucket.acquire()
+    bucket.acquire()
+    clock.now += 60
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == pytest.approx(1.0)
+
+
+def test_is_throttling():
+    assert aws.is_throttling(error('Throttling'))
+    assert aws.is_throttling(error('SlowDown', status=503))
+    assert aws.is_throttling(error(None, message='Rate exceeded'))
+    assert not aws.is_throttling(error('ValidationError', message='Stack foo does not exist'))
+
+
+def test_is_missing_stack():
+    assert aws.is_missing_stack(error('ValidationError', message='Stack with id foo does not exist'))
+    assert not aws.is_missing_stack(error('ValidationError', message='Template format error'))
+
+
+def test_namespace():
+    assert aws.namespace('s3', 'us-west-1') == 's3'
+    assert aws.namespace('cloudformation') == 'cloudformation'
+    assert aws.namespace('cloudformation', 'us-west-1') == 'cloudformation.us-west-1'
+
+
+class Flaky(object):
+    """Backend failing the first calls with the given errors."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def describe_stacks(self, stack_name=None):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return [stack_name]
+
+
+def test_retry_throttled(clock):
+    conn = Flaky(error('Throttling'), error('Throttling'))
+    stats = aws.Stats()
+    throttled = aws.Throttled(conn, region='test-retry', stats=stats)
+    assert throttled.describe_stacks('foo') == ['foo']
+    assert conn.calls == 3
+    assert stats.calls == 3
+    assert stats.retries == 2
+    # Full jitter stays below the exponential cap
+    assert len(clock.sleeps) == 2
+    assert 0 <= clock.sleeps[0] <= aws.Throttled.BASE_DELAY
+    assert 0 <= clock.sleeps[1] <= aws.Throttled.BASE_DELAY * 2
+
+
+def test_no_retry_other_errors(clock):
+    conn = Flaky(error('ValidationError', message='Template format error'))
+    throttled = aws.Throttled(conn, region='test-other', stats=aws.Stats())
+    with pytest.raises(boto.exception.BotoServerError):
+        throttled.describe_stacks('foo')
+    assert conn.calls == 1
+
+
+def test_retry_gives_up(clock, monkeypatch):
+    monkeypatch.setattr(aws.Throttled, 'MAX_RETRIES', 2)
+    conn = Flaky(*[error('Throttling')] * 5)
+    throttled = aws.Throttled(conn, region='test-give-up', stats=aws.Stats())
+    with pytest.raises(boto.exception.BotoServerError):
+        throttled.describe_stacks('foo')
+    assert conn.calls == 3
+
+
+def test_shared_bucket():
+    assert aws.bucket('cloudformation', 'test-shared') is aws.bucket('cloudformation', 'test-shared')
+    assert aws.bucket('cloudformation', 'test-shared') is not aws.bucket('cloudformation', 'test-other-shared')
+    assert aws.bucket('s3', 'test-shared') is aws.bucket('s3', 'test-other-shared')
@@ -0,0 +1,131 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+
+import json
+
+import boto.exception
+import pytest
+
+from brix import aws, backend
+
+
+def test_parse_options():
+    assert backend.parse_options('') == {}
+    assert backend.parse_options('/tmp/brix') == {'path': '/tmp/brix'}
+    assert backend.parse_options('latency=0.2,throttle=5') == {'latency': '0.2', 'throttle': '5'}
+    with pytest.raises(ValueError):
+        backend.parse_options('latency=0.2,speed=5')
+    with pytest.raises(ValueError):
+        backend.parse_options('latency=0.2,throttle')
+
+
+def test_connect_memory():
+    conn = backend.connect('memory:latency=0.2,deploy_time=3', 'us-west-1')
+    assert isinstance(conn, backend.MemoryBackend)
+    assert (conn.latency, conn.throttle, conn.deploy_time) == (0.2, 0.0, 3.0)
+
+
+def test_connect_memory_environment(monkeypatch):
+    monkeypatch.setenv('BRIX_MEMORY_THROTTLE', '0.5')
+    assert backend.connect('memory', 'us-west-1').throttle == 0.5
+    assert backend.connect('memory:throttle=0', 'us-west-1').throttle == 0.0
+
+
+@pytest.mark.parametrize('spec', ['memory:latency=fast', 'boto:latency=1', 'ftp'])
+def test_connect_invalid(spec):
+    with pytest.raises(ValueError):
+        backend.connect(spec, 'us-west-1')
+
+
+def test_backend_abstract():
+    with pytest.raises(TypeError):
+        backend.Backend()
+
+
+TEMPLATE = {
+    'Parameters': {'Env': {'Type': 'String'}, 'Size': {'Type': 'String', 'Default': 'small'}},
+    'Resources': {'Queue': {'Type': 'AWS::SQS::Queue'}},
+    'Outputs': {'QueueUrl': {'Value': {'Ref': 'Queue'}}},
+}
+URL = 'https://balanced-cfn-us-west-1.s3.amazonaws.com/templates/app.json'
+
+
+@pytest.fixture
+def conn():
+    conn = backend.MemoryBackend('us-west-1', backend.MemoryWorld(), latency=0, throttle=0, deploy_time=0)
+    conn.put_object('balanced-cfn-us-west-1', 'templates/app.json', json.dumps(TEMPLATE))
+    return conn
+
+
+def test_objects(conn):
+    assert conn.get_object('balanced-cfn-us-west-1', 'templates/app.json') == json.dumps(TEMPLATE)
+    assert [o.key for o in conn.list_objects('balanced-cfn-us-west-1', 'templates/')] == ['templates/app.json']
+    conn.delete_objects('balanced-cfn-us-west-1', ['templates/app.json'])
+    with pytest.raises(boto.exception.BotoServerError):
+        conn.get_object('balanced-cfn-us-west-1', 'templates/app.json')
+
+
+def test_create_stack(conn):
+    conn.create_stack('app', URL, parameters=[('Env', 'test')])
+    stack, = conn.describe_stacks('app')
+    assert stack.stack_status == 'CREATE_COMPLETE'
+    assert [(p.key, p.value) for p in stack.parameters] == [('Env', 'test'), ('Size', 'small')]
+    assert [o.key for o in stack.outputs] == ['QueueUrl']
+    resource, = conn.describe_stack_resources('app')
+    assert resource.resource_type == 'AWS::SQS::Queue'
+    assert conn.describe_stack_events('app')[0].resource_status == 'CREATE_COMPLETE'
+
+
+def test_create_stack_errors(conn):
+    with pytest.raises(boto.exception.BotoServerError):
+        conn.create_stack('app', URL)
+    assert list(conn.describe_stacks()) == []
+    conn.create_stack('app', URL, parameters=[('Env', 'test')])
+    with pytest.raises(boto.exception.BotoServerError):
+        conn.create_stack('app', URL, parameters=[('Env', 'test')])
+
+
+def test_update_stack(conn):
+    conn.create_stack('app', URL, parameters=[('Env', 'test')])
+    conn.update_stack('app', URL, parameters=[('Env', 'production')])
+    stack, = conn.describe_stacks('app')
+    assert stack.stack_status == 'UPDATE_COMPLETE'
+    assert stack.last_updated_time is not None
+
+
+def test_in_progress_until_deploy_time(conn):
+    conn.deploy_time = 60
+    conn.create_stack('app', URL, parameters=[('Env', 'test')])
+    assert conn.describe_stacks('app')[0].stack_status == 'CREATE_IN_PROGRESS'
+    with pytest.raises(boto.exception.BotoServerError):
+        conn.update_stack('app', URL, parameters=[('Env', 'test')])
+
+
+def test_missing_stack(conn):
+    with pytest.raises(boto.exception.BotoServerError) as e:
+        conn.describe_stacks('nope')
+    assert aws.is_missing_stack(e.value)
+
+
+def test_throttle(conn):
+    conn.throttle = 1.0
+    with pytest.raises(boto.exception.BotoServerError) as e:
+        conn.describe_stacks()
+    assert e.value.error_code == 'Throttling'
@@ -0,0 +1,64 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+
+from brix import bake
+
+
+class BalancedApi(object):
+    CHEF_RECIPE = 'role-api'
+    ENV = 'test'
+
+
+class BalancedGateway(object):
+    CHEF_RECIPE = 'role-nat'
+
+
+class BalancedRegion(object):
+    pass
+
+
+def test_roles():
+    templates = {
+        'balanced_api': {'class': BalancedApi},
+        'balanced_gateway': {'class': BalancedGateway},
+        'balanced_region': {'class': BalancedRegion},
+    }
+    assert bake.roles(templates) == {'role-api': 'test', 'role-nat': 'production'}
+
+
+def test_parse_artifacts():
+    output = '\n'.join([
+        '1400000000,,ui,say,==> amazon-ebs: Creating the AMI',
+        '1400000001,amazon-ebs,artifact-count,1',
+        '1400000001,amazon-ebs,artifact,0,builder-id,mitchellh.amazonebs',
+        '1400000001,amazon-ebs,artifact,0,id,us-west-1:ami-1234%!(PACKER_COMMA)us-east-1:ami-5678',
+    ])
+    assert bake.parse_artifacts(output) == {'us-west-1': 'ami-1234', 'us-east-1': 'ami-5678'}
+
+
+def test_parse_artifacts_none():
+    assert bake.parse_artifacts('1400000000,,ui,error,Build failed') == {}
+
+
+def test_load_save(tmpdir):
+    path = str(tmpdir.join('amis.json'))
+    assert bake.load(path) == {}
+    bake.save({'role-api': {'us-west-1': 'ami-1234'}}, path)
+    assert bake.load(path) == {'role-api': {'us-west-1': 'ami-1234'}}
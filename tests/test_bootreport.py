@@ -0,0 +1,67 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+
+from brix import bootreport
+
+
+REPORT = {
+    'role': 'role-api',
+    'uptime_at_start': 20.0,
+    'phases': [
+        {'name': 'metadata', 'start': 100.0, 'end': 101.0},
+        {'name': 'chef-client', 'start': 101.0, 'end': 161.0},
+    ],
+    'chef': {'resources': [
+        {'recipe': 'role-api::default', 'elapsed': 10.0},
+        {'recipe': 'role-api::default', 'elapsed': 5.0},
+        {'recipe': 'role-base::default', 'elapsed': 30.0},
+    ]},
+}
+
+
+def test_phases():
+    assert dict(bootreport.phases(REPORT)) == {
+        'kernel': 20.0,
+        'metadata': 1.0,
+        'chef-client': 60.0,
+        'chef:role-api::default': 15.0,
+        'chef:role-base::default': 30.0,
+        'total': 81.0,
+    }
+
+
+def test_phases_without_chef():
+    assert list(bootreport.phases({'chef': None})) == [('kernel', 0.0), ('total', 0.0)]
+
+
+def test_percentile():
+    values = range(1, 101)
+    assert bootreport.percentile(values, 0.5) == 50
+    assert bootreport.percentile(values, 0.99) == 99
+    assert bootreport.percentile(values, 1.0) == 100
+    assert bootreport.percentile([7], 0.9) == 7
+
+
+def test_aggregate_order():
+    slower = dict(REPORT, uptime_at_start=40.0)
+    stats = bootreport.aggregate([REPORT, slower])
+    assert [s.phase for s in stats] == ['kernel', 'metadata', 'chef-client', 'total', 'chef:role-base::default', 'chef:role-api::default']
+    kernel = stats[0]
+    assert (kernel.count, kernel.p50, kernel.max) == (2, 20.0, 40.0)
@@ -0,0 +1,153 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import docopt
+import pytest
+
+import brix
+
+from .conftest import rendered
+
+
+TEMPLATES = {
+    'balanced_queue': dict(rendered('balanced_queue', {
+        'Description': 'Work queue',
+        'Parameters': {'Env': {'Type': 'String', 'Default': 'production'}},
+        'Resources': {'Queue': {'Type': 'AWS::SQS::Queue'}},
+    }), warnings=['getting big']),
+    'balanced_empty': rendered('balanced_empty', {'Description': 'Nothing'}),
+}
+
+BROKEN = {
+    'balanced_broken': {'name': 'balanced_broken', 'children': [], 'error': (ValueError, ValueError('CHEF_RECIPE not set'), None)},
+}
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app(TEMPLATES)
+
+
+def run(app, *argv):
+    brix.run(app, docopt.docopt(brix.__doc__, argv=list(argv)))
+
+
+def test_validate(app):
+    results = sorted(app.validate())
+    assert results == [
+        brix.Validation('balanced_empty', None, []),
+        brix.Validation('balanced_queue', None, ['getting big']),
+    ]
+    assert results[1].warnings == ['getting big']
+
+
+def test_validate_full(app):
+    results = dict((v.name, v) for v in app.validate(full=True))
+    assert results['balanced_empty'].error == 'Template format error: At least one Resources member must be defined.'
+    assert results['balanced_queue'].error is None
+
+
+def test_validate_error(make_app):
+    assert make_app(BROKEN).validate() == [brix.Validation('balanced_broken', 'CHEF_RECIPE not set', [])]
+
+
+def test_sync(app):
+    uploads = app.sync()
+    assert len(uploads) == len(TEMPLATES) * len(app.REGIONS)
+    assert brix.Upload('balanced_queue', 'us-east-1', TEMPLATES['balanced_queue']['s3_key']) in uploads
+
+
+def test_sync_errors(make_app):
+    with pytest.raises(ValueError) as excinfo:
+        make_app(BROKEN).sync()
+    assert str(excinfo.value) == 'Errors detected in balanced_broken'
+
+
+def test_update_and_stacks(app):
+    app.sync()
+    assert app.update('q', 'queue', {'Env': 'test'}) == brix.StackChange('q', 'us-west-1', 'create', 'balanced_queue', {'Env': 'test'})
+    change = app.update('q', 'queue')
+    assert (change.operation, change.template, change.parameters) == ('update', 'balanced_queue', {'Env': 'test'})
+    assert app.stacks() == [brix.StackInfo('q', 'UPDATE_COMPLETE', 'Work queue')]
+
+
+def test_gc_result(app):
+    app.sync()
+    results = app.gc()
+    assert results['us-west-1'] == brix.GcResult(0, [])
+    assert results['us-west-1'].referenced == 0
+
+
+def test_run_validate(app, capsys):
+    run(app, 'validate')
+    out, err = capsys.readouterr()
+    assert sorted(out.splitlines()) == ['balanced_empty ok', 'balanced_queue ok', 'balanced_queue warning: getting big']
+    run(app, '--quiet', 'validate')
+    out, err = capsys.readouterr()
+    assert out == 'balanced_queue warning: getting big\n'
+
+
+def test_run_validate_error(make_app, capsys):
+    with pytest.raises(SystemExit) as excinfo:
+        run(make_app(BROKEN), 'validate')
+    assert excinfo.value.code == 1
+    out, err = capsys.readouterr()
+    assert out == 'balanced_broken error: CHEF_RECIPE not set\n'
+    assert err == 'Errors detected\n'
+
+
+def test_run_sync(app, capsys):
+    run(app, 'sync')
+    out, err = capsys.readouterr()
+    regions = ' '.join(app.REGIONS)
+    assert sorted(out.splitlines()) == ['Uploading balanced_empty ' + regions, 'Uploading balanced_queue ' + regions]
+
+
+def test_run_update_and_stacks(app, capsys):
+    run(app, 'update', '--param=Env:test', 'q', 'queue')
+    out, err = capsys.readouterr()
+    assert out.splitlines()[-2:] == ['Creating stack q in us-west-1', '']
+    run(app, 'update', '--no-sync', 'q', 'queue')
+    out, err = capsys.readouterr()
+    assert out == 'Updating stack q in us-west-1\n\n'
+    run(app, 'stacks')
+    out, err = capsys.readouterr()
+    assert out == 'q: Work queue\n'
+
+
+def test_run_update_without_template(app, capsys):
+    with pytest.raises(SystemExit):
+        run(app, 'update', '--no-sync', 'q')
+    out, err = capsys.readouterr()
+    assert err == 'Template name for stack q is required\n'
+
+
+def test_run_gc(app, capsys):
+    app.sync()
+    app.backend.put_object('balanced-cfn-us-west-1', 'templates/balanced_old-{}.json'.format('0' * 40), '{}')
+    run(app, 'gc', '--dry-run', '--grace=0')
+    out, err = capsys.readouterr()
+    assert out.splitlines() == [
+        'us-east-1: 0 referenced, would delete 0',
+        'us-west-1: 0 referenced, would delete 1',
+        '  templates/balanced_old-{}.json'.format('0' * 40),
+        'us-west-2: 0 referenced, would delete 0',
+    ]
+    run(app, 'gc', '--grace=0')
+    out, err = capsys.readouterr()
+    assert out.splitlines()[1] == 'us-west-1: 0 referenced, deleted 1'
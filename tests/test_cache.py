@@ -0,0 +1,133 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+
+import os
+
+import pytest
+
+from brix import cache
+
+
+class Conn(object):
+    """Backend counting how often it is really called."""
+
+    def __init__(self):
+        self.calls = []
+        self.stacks = {'foo': 'CREATE_COMPLETE'}
+
+    def describe_stacks(self, stack_name=None):
+        self.calls.append(('describe_stacks', stack_name))
+        return self.stacks.get(stack_name)
+
+    def update_stack(self, stack_name, status):
+        self.calls.append(('update_stack', stack_name))
+        self.stacks[stack_name] = status
+
+    def region(self):
+        return 'test'
+
+
+def cached(response_cache):
+    return cache.Cached(Conn(), response_cache, reads={'describe_stacks': 'cloudformation'}, writes={'update_stack': 'cloudformation'})
+
+
+def test_reads_cached():
+    conn = cached(cache.ResponseCache())
+    assert conn.describe_stacks('foo') == 'CREATE_COMPLETE'
+    assert conn.describe_stacks('foo') == 'CREATE_COMPLETE'
+    assert conn.describe_stacks(stack_name='foo') == 'CREATE_COMPLETE'
+    assert conn.uncached.calls == [('describe_stacks', 'foo'), ('describe_stacks', 'foo')]
+
+
+def test_write_invalidates():
+    conn = cached(cache.ResponseCache())
+    conn.describe_stacks('foo')
+    conn.update_stack('foo', 'UPDATE_COMPLETE')
+    assert conn.describe_stacks('foo') == 'UPDATE_COMPLETE'
+    assert len(conn.uncached.calls) == 3
+
+
+def test_failed_write_invalidates():
+    conn = cached(cache.ResponseCache())
+    conn.describe_stacks('foo')
+    with pytest.raises(TypeError):
+        conn.update_stack('foo')
+    conn.describe_stacks('foo')
+    assert conn.uncached.calls.count(('describe_stacks', 'foo')) == 2
+
+
+def test_other_calls_passed_through():
+    conn = cached(cache.ResponseCache())
+    assert conn.region() == 'test'
+    assert conn.region() == 'test'
+
+
+def test_invalidate_namespace():
+    response_cache = cache.ResponseCache()
+    response_cache.set(('cloudformation', 'a'), 1)
+    response_cache.set(('s3', 'b'), 2)
+    response_cache.invalidate('cloudformation')
+    assert response_cache.get(('cloudformation', 'a')) == (False, None)
+    assert response_cache.get(('s3', 'b')) == (True, 2)
+
+
+def test_clear():
+    response_cache = cache.ResponseCache()
+    response_cache.set(('cloudformation', 'a'), 1)
+    response_cache.clear()
+    assert response_cache.get(('cloudformation', 'a')) == (False, None)
+
+
+def test_memory_only_without_ttl(tmpdir):
+    response_cache = cache.ResponseCache(path=str(tmpdir))
+    response_cache.set(('cloudformation', 'a'), 1)
+    assert tmpdir.listdir() == []
+
+
+def test_disk_shared(tmpdir):
+    cache.ResponseCache(ttl=60, path=str(tmpdir)).set(('cloudformation', 'a'), {'b': 1})
+    assert cache.ResponseCache(ttl=60, path=str(tmpdir)).get(('cloudformation', 'a')) == (True, {'b': 1})
+
+
+def test_disk_expired(tmpdir):
+    cache.ResponseCache(ttl=60, path=str(tmpdir)).set(('cloudformation', 'a'), 1)
+    for path in tmpdir.listdir():
+        mtime = os.path.getmtime(str(path)) - 120
+        os.utime(str(path), (mtime, mtime))
+    assert cache.ResponseCache(ttl=60, path=str(tmpdir)).get(('cloudformation', 'a')) == (False, None)
+
+
+def test_disk_invalidate(tmpdir):
+    response_cache = cache.ResponseCache(ttl=60, path=str(tmpdir))
+    response_cache.set(('cloudformation', 'a'), 1)
+    response_cache.set(('s3', 'b'), 2)
+    response_cache.invalidate('cloudformation')
+    assert len(tmpdir.listdir()) == 1
+    other = cache.ResponseCache(ttl=60, path=str(tmpdir))
+    assert other.get(('cloudformation', 'a')) == (False, None)
+    assert other.get(('s3', 'b')) == (True, 2)
+
+
+def test_unpicklable_kept_in_memory(tmpdir):
+    response_cache = cache.ResponseCache(ttl=60, path=str(tmpdir))
+    value = lambda: None
+    response_cache.set(('cloudformation', 'a'), value)
+    assert response_cache.get(('cloudformation', 'a')) == (True, value)
+    assert tmpdir.listdir() == []
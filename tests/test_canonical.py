@@ -0,0 +1,71 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import hashlib
+import json
+
+import pytest
+import troposphere
+import troposphere.ec2
+
+from brix import canonical
+
+
+def test_key_order():
+    a = json.loads('{"Resources": {"A": {"Type": "x", "Properties": {"B": 1, "C": [1, 2]}}}, "Outputs": {}}')
+    b = json.loads('{"Outputs": {}, "Resources": {"A": {"Properties": {"C": [1, 2], "B": 1}, "Type": "x"}}}')
+    assert canonical.sha1(a) == canonical.sha1(b)
+
+
+def test_value_change():
+    a = {'Resources': {'A': {'Type': 'x', 'Properties': {'B': 'one'}}}}
+    b = {'Resources': {'A': {'Type': 'x', 'Properties': {'B': 'two'}}}}
+    assert canonical.sha1(a) != canonical.sha1(b)
+
+
+def test_list_order_matters():
+    assert canonical.sha1({'A': [1, 2]}) != canonical.sha1({'A': [2, 1]})
+
+
+def test_numbers_and_strings():
+    assert canonical.dumps({'A': 1, 'B': 1.0, 'C': 1.5}) == '{"A":"1","B":"1","C":"1.5"}'
+    assert canonical.sha1({'A': 1}) == canonical.sha1({'A': '1'})
+    assert canonical.sha1({'A': u'x'}) == canonical.sha1({'A': 'x'})
+
+
+def test_sha1_matches_dumps():
+    value = {'B': [None, True, False], 'A': {'C': 'd'}}
+    assert canonical.sha1(value) == hashlib.sha1(canonical.dumps(value)).hexdigest()
+
+
+def test_troposphere_objects():
+    template = troposphere.Template()
+    template.add_resource(troposphere.ec2.SecurityGroup(
+        'Group',
+        GroupDescription='test',
+        VpcId=troposphere.Ref('VpcId'),
+    ))
+    document = {'Resources': template.resources}
+    body = json.dumps(document, cls=troposphere.awsencode, indent=4)
+    assert canonical.sha1(document) == canonical.sha1(json.loads(body))
+
+
+def test_unserializable():
+    with pytest.raises(TypeError):
+        canonical.dumps({'A': object()})
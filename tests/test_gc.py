@@ -0,0 +1,104 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import datetime
+
+import pytest
+
+from brix import backend, canonical, split
+
+from .conftest import rendered
+
+
+CHILD = {'Resources': {'DeadLetters': {'Type': 'AWS::SQS::Queue'}}}
+CHILD_KEY = 'templates/balanced_region-Child1-{}.json'.format(canonical.sha1(CHILD))
+
+API_V1 = {'Resources': {'Queue': {'Type': 'AWS::SQS::Queue'}}}
+API_V2 = {'Resources': {'Topic': {'Type': 'AWS::SNS::Topic'}}}
+REGION = {'Resources': {'Child1': {
+    'Type': 'AWS::CloudFormation::Stack',
+    'Properties': {'TemplateURL': 'https://balanced-cfn-us-west-1.s3.amazonaws.com/' + CHILD_KEY},
+}}}
+
+OLD = {'balanced_api': rendered('balanced_api', API_V1), 'balanced_region': rendered('balanced_region', REGION)}
+NEW = {'balanced_api': rendered('balanced_api', API_V2)}
+
+API_V1_KEY = OLD['balanced_api']['s3_key']
+API_V1_REGIONAL_KEY = 'templates/balanced_api-us-west-1-{}.json'.format(OLD['balanced_api']['sha1'])
+API_V2_KEY = NEW['balanced_api']['s3_key']
+REGION_KEY = OLD['balanced_region']['s3_key']
+STRAY_KEY = 'templates/balanced_api-{}.json'.format('0' * 40)
+FRESH_KEY = 'templates/balanced_docs-{}.json'.format('1' * 40)
+
+
+@pytest.fixture
+def app(make_app, tmpdir):
+    """App with the NEW templates, stacks running the OLD ones, all a month old."""
+    old = make_app(OLD)
+    old.sync()
+    for key, body in [(CHILD_KEY, CHILD), (API_V1_REGIONAL_KEY, API_V1), (STRAY_KEY, API_V1)]:
+        old.backend.put_object('balanced-cfn-us-west-1', key, split.dumps(body))
+    old.update('api', 'balanced_api')
+    old.update('region', 'balanced_region')
+    app = make_app(NEW)
+    app.sync()
+    world = backend.MemoryWorld.get(str(tmpdir.join('world.pickle')))
+    for bucket in world.buckets.itervalues():
+        for obj in bucket.itervalues():
+            obj['last_modified'] -= datetime.timedelta(days=30)
+    app.backend.put_object('balanced-cfn-us-west-1', FRESH_KEY, split.dumps(API_V1))
+    return app
+
+
+def keys(app, region='us-west-1'):
+    return [obj.key for obj in app.for_region(region).backend.list_objects('balanced-cfn-{}'.format(region), 'templates/')]
+
+
+def test_referenced_keys(app):
+    # The region stack keeps its nested stack's key, found by TEMPLATE_KEY_RE.
+    assert app.backend.describe_stacks('region-Child1')
+    assert app._referenced_template_keys() >= set([API_V1_KEY, API_V1_REGIONAL_KEY, REGION_KEY, CHILD_KEY])
+
+
+def test_gc(app):
+    results = app.gc()
+    assert sorted(results) == app.REGIONS
+    assert results['us-west-1'].garbage == [STRAY_KEY]
+    assert results['us-west-1'].referenced > 0
+    assert keys(app) == sorted([CHILD_KEY, API_V1_REGIONAL_KEY, API_V1_KEY, API_V2_KEY, REGION_KEY, FRESH_KEY])
+    # Nothing runs in the other regions, so only the current templates stay.
+    assert results['us-east-1'] == (0, sorted([API_V1_KEY, REGION_KEY]))
+    assert keys(app, 'us-east-1') == [API_V2_KEY]
+
+
+def test_local_regional_keys(app):
+    app.templates['balanced_api']['regions'] = {'us-west-1': {'s3_key': STRAY_KEY}}
+    assert app.gc()['us-west-1'].garbage == []
+
+
+def test_grace(app):
+    results = app.gc(grace=60)
+    assert all(r.garbage == [] for r in results.itervalues())
+    assert STRAY_KEY in keys(app)
+
+
+def test_dry_run(app):
+    before = {region: keys(app, region) for region in app.REGIONS}
+    results = app.gc(dry_run=True)
+    assert results['us-west-1'].garbage == [STRAY_KEY]
+    assert {region: keys(app, region) for region in app.REGIONS} == before
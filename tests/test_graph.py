@@ -0,0 +1,92 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+
+from brix import graph
+
+
+SHA1 = '0' * 40
+
+BODY = {'Resources': {
+    'Vpc': {'Type': 'AWS::EC2::VPC'},
+    'Subnet': {'Type': 'AWS::EC2::Subnet', 'Properties': {'VpcId': {'Ref': 'Vpc'}}},
+    'Group': {'Type': 'AWS::EC2::SecurityGroup', 'Properties': {'VpcId': {'Ref': 'Vpc'}}},
+    # Implied by the Subnet reference, and Group adds nothing to the chain.
+    'Instance': {
+        'Type': 'AWS::EC2::Instance',
+        'DependsOn': ['Vpc', 'Group'],
+        'Properties': {'SubnetId': {'Ref': 'Subnet'}},
+    },
+}}
+
+NESTED = {'Resources': {
+    'Vpc': {'Type': 'AWS::EC2::VPC'},
+    'Zone': {
+        'Type': 'AWS::CloudFormation::Stack',
+        'Properties': {
+            'TemplateURL': {'Fn::Join': ['', ['https://balanced-cfn-', {'Ref': 'AWS::Region'}, '.s3.amazonaws.com/templates/zone-{}.json'.format(SHA1)]]},
+            'Parameters': {'VpcId': {'Ref': 'Vpc'}},
+        },
+    },
+}}
+
+ZONE = {'Resources': {
+    'Subnet': {'Type': 'AWS::EC2::Subnet'},
+    'Table': {'Type': 'AWS::EC2::RouteTable', 'Properties': {'SubnetId': {'Ref': 'Subnet'}}},
+}}
+
+
+def test_edges():
+    g = graph.Graph.from_template(BODY, lambda name: None)
+    assert sorted((e.source, e.target, e.kind) for e in g.edges) == [
+        ('Group', 'Vpc', 'ref'),
+        ('Instance', 'Group', 'dependson'),
+        ('Instance', 'Subnet', 'ref'),
+        ('Instance', 'Vpc', 'dependson'),
+        ('Subnet', 'Vpc', 'ref'),
+    ]
+
+
+def test_longest_chain():
+    g = graph.Graph.from_template(BODY, lambda name: None)
+    assert len(g.longest_chain()) == 3
+    assert g.longest_chain()[0] == 'Vpc'
+    assert g.longest_chain()[-1] == 'Instance'
+
+
+def test_depends_on_report():
+    g = graph.Graph.from_template(BODY, lambda name: None)
+    report = dict(((edge.target, implied), saving) for edge, implied, saving in g.depends_on_report())
+    assert report == {('Vpc', True): 0, ('Group', False): 0}
+
+
+def test_nested_stacks():
+    assert graph.nested_template(NESTED['Resources']['Zone']) == 'zone'
+    g = graph.Graph.from_template(NESTED, {'zone': ZONE}.get)
+    assert list(g.nodes) == ['Vpc', 'Zone', 'Zone/Subnet', 'Zone/Table']
+    assert g.longest_chain() == ['Vpc', 'Zone/Subnet', 'Zone/Table', 'Zone']
+    assert g.reachable('Zone/Subnet', 'Vpc')
+    assert not g.reachable('Vpc', 'Zone/Subnet')
+
+
+def test_to_dot():
+    dot = graph.Graph.from_template(BODY, lambda name: None).to_dot('app')
+    assert dot.startswith('digraph "app" {')
+    assert '    "Instance" -> "Vpc" [style=dashed, color=red];' in dot
+    assert '    "Instance" -> "Group" [style=dashed];' in dot
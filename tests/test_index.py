@@ -0,0 +1,99 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+
+import collections
+
+from brix import index
+
+
+Stack = collections.namedtuple('Stack', ['stack_name', 'stack_id', 'creation_time', 'last_updated_time'])
+Resource = collections.namedtuple('Resource', ['physical_resource_id', 'logical_resource_id', 'resource_type'])
+
+
+def stack(name, updated=None):
+    return Stack(name, 'arn:aws:cloudformation:us-west-1:1:stack/{}/1'.format(name), '2014-01-01', updated)
+
+
+def test_find_prefix():
+    idx = index.ResourceIndex(':memory:')
+    idx.update('us-west-1', stack('app'), [
+        Resource('i-1234', 'Instance', 'AWS::EC2::Instance'),
+        Resource('i-1299', 'Other', 'AWS::EC2::Instance'),
+        Resource('sg-1234', 'Group', 'AWS::EC2::SecurityGroup'),
+        Resource(None, 'Pending', 'AWS::EC2::Instance'),
+    ])
+    assert [m.physical_id for m in idx.find('i-12')] == ['i-1234', 'i-1299']
+    assert [m.physical_id for m in idx.find('i-123')] == ['i-1234']
+    assert idx.find('i-2') == []
+    assert idx.find('i-1234') == [index.Match('i-1234', 'us-west-1', 'app', 'Instance', 'AWS::EC2::Instance')]
+
+
+def test_find_across_regions():
+    idx = index.ResourceIndex(':memory:')
+    idx.update('us-west-1', stack('app'), [Resource('sg-1', 'Group', 'AWS::EC2::SecurityGroup')])
+    idx.update('us-east-1', stack('app'), [Resource('sg-1', 'Group', 'AWS::EC2::SecurityGroup')])
+    assert [m.region for m in idx.find('sg-1')] == ['us-east-1', 'us-west-1']
+
+
+def test_update_replaces():
+    idx = index.ResourceIndex(':memory:')
+    assert idx.empty()
+    idx.update('us-west-1', stack('app'), [Resource('i-1', 'Instance', 'AWS::EC2::Instance')])
+    idx.update('us-west-1', stack('app', '2014-02-01'), [Resource('i-2', 'Instance', 'AWS::EC2::Instance')])
+    assert idx.find('i-1') == []
+    assert [m.physical_id for m in idx.find('i-')] == ['i-2']
+    assert idx.versions('us-west-1') == {'app': '2014-02-01'}
+    assert idx.versions('us-east-1') == {}
+
+
+def test_remove():
+    idx = index.ResourceIndex(':memory:')
+    idx.update('us-west-1', stack('app'), [Resource('i-1', 'Instance', 'AWS::EC2::Instance')])
+    idx.remove('us-west-1', 'app')
+    assert idx.find('i-') == []
+    assert idx.empty()
+
+
+def test_stack_path():
+    idx = index.ResourceIndex(':memory:')
+    region, zone, gateway = stack('region'), stack('region-ZoneA-ABC'), stack('region-ZoneA-ABC-Gateway-DEF')
+    idx.update('us-west-1', region, [Resource(zone.stack_id, 'ZoneA', 'AWS::CloudFormation::Stack')])
+    idx.update('us-west-1', zone, [Resource(gateway.stack_id, 'Gateway', 'AWS::CloudFormation::Stack')])
+    idx.update('us-west-1', gateway, [Resource('i-1', 'GatewayInstance', 'AWS::EC2::Instance')])
+    match, = idx.find('i-1')
+    assert match.stack_path == 'region/ZoneA/Gateway'
+
+
+def test_stack_path_other_region():
+    idx = index.ResourceIndex(':memory:')
+    parent, child = stack('parent'), stack('parent-Child-ABC')
+    idx.update('us-east-1', parent, [Resource(child.stack_id, 'Child', 'AWS::CloudFormation::Stack')])
+    idx.update('us-west-1', child, [Resource('i-1', 'Instance', 'AWS::EC2::Instance')])
+    match, = idx.find('i-1')
+    assert match.stack_path == 'parent-Child-ABC'
+
+
+def test_stack_path_cycle():
+    idx = index.ResourceIndex(':memory:')
+    a, b = stack('a'), stack('b')
+    idx.update('us-west-1', a, [Resource(b.stack_id, 'B', 'AWS::CloudFormation::Stack'), Resource('i-1', 'Instance', 'AWS::EC2::Instance')])
+    idx.update('us-west-1', b, [Resource(a.stack_id, 'A', 'AWS::CloudFormation::Stack')])
+    match, = idx.find('i-1')
+    assert match.stack_path == 'b/A'
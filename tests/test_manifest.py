@@ -0,0 +1,171 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+
+import json
+import threading
+
+import pytest
+
+from brix import backend, manifest
+
+from .conftest import rendered
+
+
+def test_defaults():
+    m = manifest.Manifest([{'name': 'app', 'template': 'balanced_api', 'params': {'MaxCapacity': 4}}], region='us-west-1')
+    assert m.stacks == [{
+        'id': 'app',
+        'name': 'app',
+        'template': 'balanced_api',
+        'region': 'us-west-1',
+        'params': {'MaxCapacity': '4'},
+        'depends_on': [],
+    }]
+
+
+def test_same_name_in_regions():
+    m = manifest.Manifest([
+        {'id': 'app-west', 'name': 'app', 'template': 'balanced_api'},
+        {'id': 'app-east', 'name': 'app', 'template': 'balanced_api', 'region': 'us-east-1', 'depends_on': ['app-west']},
+    ], region='us-west-1')
+    assert [(s['id'], s['region']) for s in m.stacks] == [('app-west', 'us-west-1'), ('app-east', 'us-east-1')]
+
+
+@pytest.mark.parametrize('stacks', [
+    [{'name': 'app'}],
+    [{'name': 'app', 'template': 'balanced_api'}, {'name': 'app', 'template': 'balanced_api'}],
+    [{'name': 'app', 'template': 'balanced_api', 'depends_on': ['region']}],
+    [
+        {'name': 'a', 'template': 'balanced_api', 'depends_on': ['b']},
+        {'name': 'b', 'template': 'balanced_api', 'depends_on': ['a']},
+    ],
+])
+def test_invalid(stacks):
+    with pytest.raises(ValueError):
+        manifest.Manifest(stacks, region='us-west-1')
+
+
+def test_no_region():
+    with pytest.raises(ValueError):
+        manifest.Manifest([{'name': 'app', 'template': 'balanced_api'}])
+
+
+def test_load(tmpdir):
+    path = tmpdir.join('manifest.json')
+    path.write(json.dumps({'region': 'us-west-1', 'stacks': [{'name': 'region', 'template': 'balanced_region'}]}))
+    m = manifest.Manifest.load(str(path))
+    assert [s['name'] for s in m.stacks] == ['region']
+
+
+TEMPLATES = {
+    'queue': rendered('queue', {
+        'Parameters': {'Env': {'Type': 'String'}},
+        'Resources': {'Queue': {'Type': 'AWS::SQS::Queue'}},
+    }),
+}
+
+
+def stacks(*specs):
+    """Manifest stacks from (name, depends_on) pairs."""
+    return manifest.Manifest([
+        {'name': name, 'template': 'queue', 'params': {'Env': 'test'}, 'depends_on': depends_on}
+        for name, depends_on in specs
+    ], region='us-west-1')
+
+
+class Recorder(object):
+    """Wraps Brix.update and Deployer progress to log what happens when."""
+
+    def __init__(self, app):
+        self.log = []
+        self.lock = threading.Lock()
+        update = app.update
+        def recording_update(stack_name, *args, **kwargs):
+            with self.lock:
+                self.log.append(('start', stack_name))
+            return update(stack_name, *args, **kwargs)
+        # Instance attributes carry over to the copies for_region makes.
+        app.update = recording_update
+
+    def __call__(self, deploy):
+        with self.lock:
+            self.log.append(('done', deploy.stack_id))
+
+
+@pytest.fixture
+def app(make_app):
+    app = make_app(TEMPLATES, options=',deploy_time=0.2')
+    app.sync()
+    return app
+
+
+def deploy(app, m, **kwargs):
+    return manifest.Deployer(app, m, poll_interval=0.05, **kwargs).run()
+
+
+def test_dependency_order(app):
+    recorder = Recorder(app)
+    results = manifest.Deployer(app, stacks(('c', ['b']), ('b', ['a']), ('a', [])), poll_interval=0.05, progress=recorder).run()
+    assert dict((k, v.result) for k, v in results.iteritems()) == {'a': 'ok', 'b': 'ok', 'c': 'ok'}
+    assert recorder.log == [('start', 'a'), ('done', 'a'), ('start', 'b'), ('done', 'b'), ('start', 'c'), ('done', 'c')]
+
+
+def test_concurrency_cap(app):
+    recorder = Recorder(app)
+    manifest.Deployer(app, stacks(*[(name, []) for name in 'abcde']), concurrency=2, poll_interval=0.05, progress=recorder).run()
+    running = peak = 0
+    for event, _ in recorder.log:
+        running += 1 if event == 'start' else -1
+        peak = max(peak, running)
+    assert peak == 2
+
+
+def test_failed_dependency_skips_dependents(app):
+    m = manifest.Manifest([
+        # No Env, so the create is rejected.
+        {'name': 'a', 'template': 'queue'},
+        {'name': 'b', 'template': 'queue', 'params': {'Env': 'test'}, 'depends_on': ['a']},
+        {'name': 'c', 'template': 'queue', 'params': {'Env': 'test'}, 'depends_on': ['b']},
+        {'name': 'd', 'template': 'queue', 'params': {'Env': 'test'}},
+    ], region='us-west-1')
+    results = deploy(app, m)
+    assert results['a'].result == 'failed'
+    assert 'ValidationError' in results['a'].reason
+    assert results['b'] == manifest.Deploy('b', 'skipped', 'dependency a failed')
+    assert results['c'] == manifest.Deploy('c', 'skipped', 'dependency b failed')
+    assert results['d'].result == 'ok'
+
+
+def test_unchanged(app):
+    assert deploy(app, stacks(('a', [])))['a'].result == 'ok'
+    assert deploy(app, stacks(('a', [])))['a'].result == 'unchanged'
+    changed = manifest.Manifest([{'name': 'a', 'template': 'queue', 'params': {'Env': 'production'}}], region='us-west-1')
+    assert deploy(app, changed)['a'].result == 'ok'
+
+
+def test_stack_disappears(app, tmpdir):
+    update = app.update
+    def vanishing_update(stack_name, *args, **kwargs):
+        change = update(stack_name, *args, **kwargs)
+        # Like a failed create that rolled back and was deleted.
+        del backend.MemoryWorld.get(str(tmpdir.join('world.pickle'))).stacks['us-west-1'][stack_name]
+        return change
+    app.update = vanishing_update
+    assert deploy(app, stacks(('a', [])))['a'] == manifest.Deploy('a', 'failed', 'stack a no longer exists')
@@ -0,0 +1,138 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import pytest
+
+from brix import backend, outputs
+
+from .conftest import rendered
+
+
+TEMPLATES = {
+    'network': rendered('network', {
+        'Resources': {'Vpc': {'Type': 'AWS::EC2::VPC'}},
+        'Outputs': {'VpcId': {'Value': {'Ref': 'Vpc'}}, 'Cidr': {'Value': '10.0.0.0/16'}},
+    }),
+}
+
+
+@pytest.fixture
+def app(make_app):
+    app = make_app(TEMPLATES)
+    app.sync()
+    app.update('net-a', 'network')
+    app.update('net-b', 'network')
+    app.for_region('us-east-1').update('net-east', 'network')
+    return app
+
+
+@pytest.fixture
+def resolver(app, tmpdir):
+    return outputs.OutputResolver(app, path=str(tmpdir.join('cache')))
+
+
+def test_region_required(resolver):
+    with pytest.raises(ValueError):
+        resolver('net-a', 'VpcId', None)
+
+
+def test_two_passes(resolver):
+    assert resolver('net-a', 'VpcId', 'us-west-1') == 'StackOutput:us-west-1:net-a:VpcId'
+    assert resolver('net-east', 'Cidr', 'us-east-1') == 'StackOutput:us-east-1:net-east:Cidr'
+    assert resolver.pending == set([('us-west-1', 'net-a', 'VpcId'), ('us-east-1', 'net-east', 'Cidr')])
+    resolver.fetch()
+    assert not resolver.pending
+    assert resolver('net-a', 'VpcId', 'us-west-1') == 'net-a-VpcId'
+    assert resolver('net-east', 'Cidr', 'us-east-1') == 'net-east-Cidr'
+    # Other outputs of fetched stacks came along.
+    assert resolver('net-a', 'Cidr', 'us-west-1') == 'net-a-Cidr'
+
+
+def test_missing_output(resolver):
+    resolver('net-a', 'Nope', 'us-west-1')
+    resolver('gone', 'VpcId', 'us-west-1')
+    resolver.fetch()
+    with pytest.raises(ValueError) as excinfo:
+        resolver('net-a', 'Nope', 'us-west-1')
+    assert str(excinfo.value) == 'Stack net-a in us-west-1 has no output Nope'
+    with pytest.raises(ValueError) as excinfo:
+        resolver('gone', 'VpcId', 'us-west-1')
+    assert str(excinfo.value) == 'Stack gone in us-west-1 has no output VpcId'
+
+
+def test_missing_stack(resolver):
+    # Looked up by name, so the error comes from describe_stacks.
+    resolver('gone', 'VpcId', 'us-west-1')
+    resolver.fetch()
+    with pytest.raises(ValueError) as excinfo:
+        resolver('gone', 'VpcId', 'us-west-1')
+    assert 'ValidationError' in str(excinfo.value)
+
+
+def test_paged_listing(resolver, monkeypatch):
+    calls = []
+    describe_stacks = backend.MemoryBackend.describe_stacks
+    def paged(self, stack_name=None, next_token=None):
+        calls.append((stack_name, next_token))
+        stacks = describe_stacks(self, stack_name)
+        if stack_name:
+            return stacks
+        # One stack per page.
+        index = int(next_token or 0)
+        page = backend.ResultSet(stacks[index:index + 1])
+        if index + 1 < len(stacks):
+            page.next_token = str(index + 1)
+        return page
+    monkeypatch.setattr(backend.MemoryBackend, 'describe_stacks', paged)
+    resolver('net-a', 'VpcId', 'us-west-1')
+    resolver('net-b', 'VpcId', 'us-west-1')
+    resolver.fetch()
+    assert calls == [(None, None), (None, '1')]
+    assert resolver('net-b', 'VpcId', 'us-west-1') == 'net-b-VpcId'
+
+
+def test_single_stack(resolver, monkeypatch):
+    calls = []
+    describe_stacks = backend.MemoryBackend.describe_stacks
+    def counted(self, stack_name=None, next_token=None):
+        calls.append(stack_name)
+        return describe_stacks(self, stack_name, next_token)
+    monkeypatch.setattr(backend.MemoryBackend, 'describe_stacks', counted)
+    resolver('net-b', 'Cidr', 'us-west-1')
+    resolver.fetch()
+    assert calls == ['net-b']
+
+
+def test_expired(resolver, monkeypatch):
+    assert not resolver.expired()
+    resolver('net-a', 'VpcId', 'us-west-1')
+    assert not resolver.expired()
+    monkeypatch.setattr(resolver, 'created', resolver.created - resolver.ttl - 1)
+    assert resolver.expired()
+
+
+def test_refresh_rerenders(app, monkeypatch):
+    renders = []
+    monkeypatch.setattr(app, '_load_templates', lambda: renders.append(1) or {})
+    assert not app.refresh()
+    resolver = outputs.OutputResolver(app)
+    resolver.used = True
+    resolver.created -= resolver.TTL + 1
+    app._outputs = resolver
+    assert app.refresh()
+    assert renders == [1]
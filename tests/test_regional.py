@@ -0,0 +1,92 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+
+import json
+
+from brix import canonical, regional
+
+
+BODY = {
+    'Mappings': {
+        'RegionMap': {'us-west-1': {'AMI': 'ami-west'}, 'us-east-1': {'AMI': 'ami-east'}},
+        'EnvMap': {'production': {'Size': 'large'}},
+    },
+    'Parameters': {'Env': {'Type': 'String'}},
+    'Resources': {
+        'Instance': {
+            'Type': 'AWS::EC2::Instance',
+            'Properties': {
+                'ImageId': {'Fn::FindInMap': ['RegionMap', {'Ref': 'AWS::Region'}, 'AMI']},
+                'InstanceType': {'Fn::FindInMap': ['EnvMap', {'Ref': 'Env'}, 'Size']},
+            },
+        },
+        'Bucket': {
+            'Type': 'AWS::S3::Bucket',
+            'Properties': {'BucketName': {'Fn::Join': ['-', ['balanced', {'Ref': 'AWS::Region'}, 'logs']]}},
+        },
+    },
+}
+
+
+def test_region_lookups():
+    result = regional.specialize(BODY, 'us-west-1')
+    assert result['Resources']['Instance']['Properties']['ImageId'] == 'ami-west'
+    assert result['Resources']['Bucket']['Properties']['BucketName'] == 'balanced-us-west-1-logs'
+
+
+def test_unused_mappings_dropped():
+    result = regional.specialize(BODY, 'us-west-1')
+    assert result['Mappings'] == {'EnvMap': BODY['Mappings']['EnvMap']}
+    assert result['Resources']['Instance']['Properties']['InstanceType'] == {'Fn::FindInMap': ['EnvMap', {'Ref': 'Env'}, 'Size']}
+    assert 'Mappings' in BODY and len(BODY['Mappings']) == 2
+
+
+def test_unknown_region_left_alone():
+    result = regional.specialize(BODY, 'eu-west-1')
+    assert result['Resources']['Instance']['Properties']['ImageId'] == {'Fn::FindInMap': ['RegionMap', 'eu-west-1', 'AMI']}
+    assert 'RegionMap' in result['Mappings']
+
+
+def test_partial_join():
+    body = {'Outputs': {'Url': {'Value': {'Fn::Join': ['', ['https://', {'Ref': 'AWS::Region'}, '.example.com/', {'Ref': 'Path'}, '/', 'x']]}}}}
+    result = regional.specialize(body, 'us-west-1')
+    assert result['Outputs']['Url']['Value'] == {'Fn::Join': ['', ['https://us-west-1.example.com/', {'Ref': 'Path'}, '/x']]}
+
+
+def test_nested_template_keys():
+    sha1 = 'a' * 40
+    body = {'Resources': {'Child': {
+        'Type': 'AWS::CloudFormation::Stack',
+        'Properties': {'TemplateURL': {'Fn::Join': ['', [
+            'https://balanced-cfn-', {'Ref': 'AWS::Region'}, '.s3.amazonaws.com/templates/child-{}.json'.format(sha1),
+        ]]}},
+    }}}
+    key_map = {'templates/child-{}.json'.format(sha1): 'templates/child-us-west-1-{}.json'.format('b' * 40)}
+    result = regional.specialize(body, 'us-west-1', key_map)
+    assert result['Resources']['Child']['Properties']['TemplateURL'] == \
+        'https://balanced-cfn-us-west-1.s3.amazonaws.com/templates/child-us-west-1-{}.json'.format('b' * 40)
+
+
+def test_render():
+    body, sha1 = regional.render(BODY, 'us-east-1')
+    result = json.loads(body)
+    assert result['Resources']['Instance']['Properties']['ImageId'] == 'ami-east'
+    assert sha1 == canonical.sha1(result)
+    assert regional.render(BODY, 'us-west-1')[1] != sha1
@@ -0,0 +1,106 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+
+import json
+import threading
+
+import docopt
+import pytest
+
+import brix
+from brix import server
+
+from .conftest import MemoryBrix, rendered
+
+
+TEMPLATES = {
+    'balanced_queue': rendered('balanced_queue', {
+        'Parameters': {'Env': {'Type': 'String'}},
+        'Resources': {'Queue': {'Type': 'AWS::SQS::Queue'}},
+    }),
+}
+
+
+@pytest.fixture
+def daemon(make_app, tmpdir):
+    # make_app sets up the rate limits, apps here use the requested backend.
+    make_app()
+    path = str(tmpdir.join('brix.sock'))
+    srv = server.BrixServer(path, lambda region, spec, ttl: MemoryBrix(region, TEMPLATES, backend=spec, cache_ttl=ttl), brix.run)
+    thread = threading.Thread(target=srv.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def args(*argv):
+    return docopt.docopt(brix.__doc__, argv=list(argv))
+
+
+def memory(tmpdir, name):
+    return '--backend=memory:path={}'.format(tmpdir.join(name))
+
+
+def test_show(daemon, tmpdir):
+    reply = server.forward(daemon.path, args(memory(tmpdir, 'a'), 'show', 'queue'))
+    assert reply['status'] == 0
+    assert json.loads(reply['stdout']) == json.loads(TEMPLATES['balanced_queue']['json'])
+    assert reply['stderr'] == ''
+
+
+def test_error_status(daemon, tmpdir):
+    reply = server.forward(daemon.path, args(memory(tmpdir, 'a'), 'show', 'nope'))
+    assert reply['status'] == 1
+    assert reply['stderr'] == 'Unknown template nope\n'
+
+
+def test_unsupported_command(daemon):
+    reply = server.forward(daemon.path, {'sync': True})
+    assert reply == {'status': 1, 'stdout': '', 'stderr': 'brix serve: unsupported command\n'}
+
+
+def test_client_options(daemon, tmpdir):
+    server.forward(daemon.path, args(memory(tmpdir, 'a'), 'show', 'queue'))
+    server.forward(daemon.path, args(memory(tmpdir, 'a'), 'show', 'queue'))
+    server.forward(daemon.path, args(memory(tmpdir, 'b'), '--cache-ttl=60', '--region=us-east-1', 'show', 'queue'))
+    assert sorted(daemon.apps) == [
+        ('us-east-1', 'memory:path={}'.format(tmpdir.join('b')), 60),
+        ('us-west-1', 'memory:path={}'.format(tmpdir.join('a')), 0),
+    ]
+    app = daemon.apps['us-east-1', 'memory:path={}'.format(tmpdir.join('b')), 60]
+    assert (app.region, app.cache.ttl) == ('us-east-1', 60)
+
+
+def test_stats(daemon, tmpdir):
+    # diff reads the stack's template, one AWS call.
+    app = MemoryBrix('us-west-1', TEMPLATES, backend='memory:path={}'.format(tmpdir.join('a')))
+    app.sync()
+    app.update('queue', 'queue', {'Env': 'test'})
+    reply = server.forward(daemon.path, args(memory(tmpdir, 'a'), '--stats', 'diff', 'queue', 'queue'))
+    assert reply['status'] == 0
+    assert reply['stderr'].startswith('AWS calls: 1, retries: 0')
+    reply = server.forward(daemon.path, args(memory(tmpdir, 'a'), 'diff', 'queue', 'queue'))
+    assert reply['stderr'] == ''
+
+
+def test_no_daemon(tmpdir):
+    assert server.forward(str(tmpdir.join('missing.sock')), {'show': True}) is None
@@ -0,0 +1,138 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+
+import pytest
+
+from brix import split
+
+
+@pytest.fixture
+def small_limits(monkeypatch):
+    # Children get at most 2 resources and 3 parameters.
+    monkeypatch.setitem(split.LIMITS, 'resources', 4)
+    monkeypatch.setitem(split.LIMITS, 'parameters', 6)
+
+
+def queue(name, **properties):
+    return {'Type': 'AWS::SQS::Queue', 'Properties': dict(properties, QueueName=name)}
+
+
+def chain(length):
+    """Template where each queue refers to the one before it."""
+    resources = {'Queue0': queue('q0')}
+    for i in range(1, length):
+        resources['Queue{}'.format(i)] = queue('q{}'.format(i), RedrivePolicy={'deadLetterTargetArn': {'Fn::GetAtt': ['Queue{}'.format(i - 1), 'Arn']}})
+    return {
+        'Description': 'Chain',
+        'Parameters': {'Env': {'Type': 'String'}},
+        'Resources': resources,
+        'Outputs': {'Last': {'Value': {'Ref': 'Queue{}'.format(length - 1)}}},
+    }
+
+
+def test_warnings():
+    assert split.warnings({'Resources': dict(('R{}'.format(i), {}) for i in range(160))}, 100) == ['160 resources of 200 allowed']
+    assert split.warnings({'Resources': {}}, split.LIMITS['bytes']) == ['460800 bytes of 460800 allowed']
+    assert split.warnings({'Resources': {}}, 100) == []
+
+
+def test_dependency_order(small_limits):
+    parent, children = split.split('chain', chain(5))
+    assert [name for name, _ in children] == ['chain_split1', 'chain_split2', 'chain_split3']
+    assert [sorted(child['Resources']) for _, child in children] == [['Queue0', 'Queue1'], ['Queue2', 'Queue3'], ['Queue4']]
+    assert sorted(parent['Resources']) == ['Split1', 'Split2', 'Split3']
+    assert parent['Resources']['Split2']['DependsOn'] == ['Split1']
+    assert 'DependsOn' not in parent['Resources']['Split1']
+
+
+def test_getatt_crosses_as_parameter(small_limits):
+    parent, children = split.split('chain', chain(3))
+    first, second = children[0][1], children[1][1]
+    assert first['Outputs'] == {'Queue1Arn': {'Value': {'Fn::GetAtt': ['Queue1', 'Arn']}}}
+    assert second['Parameters'] == {'Queue1Arn': {'Type': 'String', 'Default': ''}}
+    assert second['Resources']['Queue2']['Properties']['RedrivePolicy'] == {'deadLetterTargetArn': {'Ref': 'Queue1Arn'}}
+    assert parent['Resources']['Split2']['Properties']['Parameters'] == {'Queue1Arn': {'Fn::GetAtt': ['Split1', 'Outputs.Queue1Arn']}}
+
+
+def test_parent_outputs(small_limits):
+    parent, children = split.split('chain', chain(3))
+    assert parent['Parameters'] == {'Env': {'Type': 'String'}}
+    assert parent['Outputs'] == {'Last': {'Value': {'Fn::GetAtt': ['Split2', 'Outputs.Queue2']}}}
+    assert children[1][1]['Outputs'] == {'Queue2': {'Value': {'Ref': 'Queue2'}}}
+
+
+def test_parameters_and_conditions(small_limits):
+    body = {
+        'Parameters': {'Env': {'Type': 'String'}, 'Unused': {'Type': 'String'}},
+        'Conditions': {
+            'IsProduction': {'Fn::Equals': [{'Ref': 'Env'}, 'production']},
+            'IsNotProduction': {'Fn::Not': [{'Condition': 'IsProduction'}]},
+        },
+        'Resources': {
+            'A': queue('a'),
+            'B': queue('b'),
+            'C': dict(queue('c'), Condition='IsNotProduction'),
+        },
+        'Outputs': {'C': {'Value': {'Ref': 'C'}}},
+    }
+    parent, children = split.split('cond', body)
+    child = children[1][1]
+    assert sorted(child['Resources']) == ['C']
+    assert sorted(child['Conditions']) == ['IsNotProduction', 'IsProduction']
+    assert child['Parameters'] == {'Env': {'Type': 'String'}}
+    assert child['Outputs']['C']['Condition'] == 'IsNotProduction'
+    assert parent['Resources']['Split2']['Properties']['Parameters'] == {'Env': {'Ref': 'Env'}}
+    assert parent['Outputs']['C']['Value'] == {'Fn::If': ['IsNotProduction', {'Fn::GetAtt': ['Split2', 'Outputs.C']}, {'Ref': 'AWS::NoValue'}]}
+    assert 'Parameters' not in children[0][1]
+
+
+def test_depends_on(small_limits):
+    body = {'Resources': {
+        'A': queue('a'),
+        'B': queue('b'),
+        'C': dict(queue('c'), DependsOn=['A', 'Z']),
+    }}
+    body['Resources']['Z'] = dict(queue('z'), DependsOn='A')
+    parent, children = split.split('deps', body)
+    assert [sorted(child['Resources']) for _, child in children] == [['A', 'B'], ['C', 'Z']]
+    assert children[1][1]['Resources']['C']['DependsOn'] == ['Z']
+    assert 'DependsOn' not in children[1][1]['Resources']['Z']
+    assert parent['Resources']['Split2']['DependsOn'] == ['Split1']
+
+
+def test_too_many_inputs(monkeypatch):
+    monkeypatch.setitem(split.LIMITS, 'parameters', 1)
+    monkeypatch.setitem(split.LIMITS, 'resources', 2)
+    body = {
+        'Parameters': {'A': {'Type': 'String'}, 'B': {'Type': 'String'}},
+        'Resources': {'Q': queue('q', DelaySeconds={'Ref': 'A'}, MaximumMessageSize={'Ref': 'B'})},
+    }
+    with pytest.raises(ValueError):
+        split.split('inputs', body)
+
+
+def test_child_url_changes_with_child(small_limits):
+    parent, _ = split.split('chain', chain(3))
+    body = chain(3)
+    body['Resources']['Queue2']['Properties']['QueueName'] = 'other'
+    other, _ = split.split('chain', body)
+    url = lambda p, stack: p['Resources'][stack]['Properties']['TemplateURL']
+    assert url(parent, 'Split1') == url(other, 'Split1')
+    assert url(parent, 'Split2') != url(other, 'Split2')
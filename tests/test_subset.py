@@ -0,0 +1,68 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+
+import pytest
+
+from brix import subset
+
+
+BODY = {
+    'Parameters': {'Env': {'Type': 'String'}, 'Other': {'Type': 'String'}},
+    'Mappings': {'EnvMap': {'production': {'Size': 'large'}}},
+    'Conditions': {'IsProduction': {'Fn::Equals': [{'Ref': 'Env'}, 'production']}},
+    'Resources': {
+        'Group': {'Type': 'AWS::EC2::SecurityGroup'},
+        'Instance': {
+            'Type': 'AWS::EC2::Instance',
+            'Condition': 'IsProduction',
+            'Properties': {
+                'InstanceType': {'Fn::FindInMap': ['EnvMap', {'Ref': 'Env'}, 'Size']},
+                'SecurityGroups': [{'Fn::GetAtt': ['Group', 'GroupId']}],
+            },
+        },
+        'Alarm': {'Type': 'AWS::CloudWatch::Alarm', 'DependsOn': 'Instance'},
+        'ZoneB': {'Type': 'AWS::CloudFormation::Stack', 'Properties': {'Parameters': {'Env': {'Ref': 'Other'}}}},
+    },
+}
+
+
+def test_subset_follows_references():
+    result = subset.subset(BODY, ['Alarm'])
+    assert sorted(result) == ['Conditions', 'Mappings', 'Parameters', 'Resources']
+    assert sorted(result['Resources']) == ['Alarm', 'Group', 'Instance']
+    assert sorted(result['Parameters']) == ['Env']
+
+
+def test_subset_leaf():
+    assert subset.subset(BODY, ['Group']) == {'Resources': {'Group': BODY['Resources']['Group']}}
+
+
+def test_find_resource():
+    assert subset.find_resource(BODY, 'zoneb') == 'ZoneB'
+    assert subset.find_resource(BODY, 'stack_ZoneB') == 'ZoneB'
+    with pytest.raises(ValueError):
+        subset.find_resource(BODY, 'ZoneC')
+
+
+def test_select():
+    assert subset.select(BODY, 'Resources.Instance.Properties.SecurityGroups.0') == {'Fn::GetAtt': ['Group', 'GroupId']}
+    assert subset.select(BODY, '') is BODY
+    with pytest.raises(ValueError):
+        subset.select(BODY, 'Resources.Instance.Properties.SecurityGroups.1')
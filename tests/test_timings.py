@@ -0,0 +1,90 @@
+#
+# Author:: Noah Kantrowitz <noah@coderanger.net>
+#
+# Copyright 2014, Balanced, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+
+import collections
+import datetime
+
+from brix import timings
+
+
+Event = collections.namedtuple('Event', ['stack_name', 'logical_resource_id', 'resource_type', 'resource_status', 'timestamp'])
+
+T0 = datetime.datetime(2014, 1, 1)
+
+
+def at(seconds):
+    return T0 + datetime.timedelta(seconds=seconds)
+
+
+def events():
+    """A stack creating A, then B and C in parallel once A is done."""
+    spec = [
+        ('app', 'AWS::CloudFormation::Stack', 0, 100),
+        ('A', 'AWS::EC2::SecurityGroup', 1, 10),
+        ('B', 'AWS::EC2::Instance', 10, 90),
+        ('C', 'AWS::EC2::Instance', 11, 40),
+    ]
+    result = []
+    for logical_id, resource_type, start, end in spec:
+        result.append(Event('app', logical_id, resource_type, 'CREATE_IN_PROGRESS', at(start)))
+        result.append(Event('app', logical_id, resource_type, 'CREATE_COMPLETE', at(end)))
+    return result
+
+
+def test_intervals():
+    found = timings.intervals(events())
+    assert [(i.logical_id, timings.duration(i)) for i in found] == [('app', 100), ('A', 9), ('B', 80), ('C', 29)]
+    assert set(i.operation for i in found) == set(['CREATE'])
+
+
+def test_rollback_extends_operation():
+    found = timings.intervals([
+        Event('app', 'A', 'AWS::EC2::Instance', 'UPDATE_IN_PROGRESS', at(0)),
+        Event('app', 'A', 'AWS::EC2::Instance', 'UPDATE_ROLLBACK_IN_PROGRESS', at(5)),
+        Event('app', 'A', 'AWS::EC2::Instance', 'UPDATE_FAILED', at(9)),
+    ])
+    assert [(i.operation, i.status, timings.duration(i)) for i in found] == [('UPDATE', 'UPDATE_FAILED', 9)]
+
+
+def test_deploys_and_within():
+    found = timings.intervals(events())
+    deploy, = timings.deploys(found, 'app')
+    assert [i.logical_id for i in timings.within(found, deploy)] == ['A', 'B', 'C']
+
+
+def test_critical_path():
+    found = timings.intervals(events())
+    deploy, = timings.deploys(found, 'app')
+    assert [i.logical_id for i in timings.critical_path(timings.within(found, deploy))] == ['A', 'B']
+    assert timings.critical_path([deploy]) == []
+
+
+def test_by_type():
+    stats = timings.by_type(timings.intervals(events()))
+    instances = next(s for s in stats if s['resource_type'] == 'AWS::EC2::Instance')
+    assert (instances['count'], instances['mean'], instances['max']) == (2, 54.5, 80)
+    assert stats[0]['resource_type'] == 'AWS::CloudFormation::Stack'
+
+
+def test_gantt():
+    found = timings.intervals(events())
+    deploy, = timings.deploys(found, 'app')
+    lines = timings.gantt(deploy, timings.within(found, deploy), width=10)
+    assert lines[1] == 'app/B |' + ' ' + '#' * 8 + ' ' + '| 80s'